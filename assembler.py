@@ -0,0 +1,116 @@
+import re
+
+# Instruction words are ADDRESS_BITS + 4 bits wide (12 by default):
+#
+#   I | op (3 bits) | address     op 1-7: memory reference instruction, I: indirect
+#   1 |     000     | n           register and IO instruction n (1, 2, ...)
+#   0 |     000     | x           not an instruction, data only
+#
+# Opcodes are positions in these tuples, counted from 1.
+MEMORY_OPS = ('LDA', 'CAL', 'STA', 'BR', 'ISA', 'SWT', 'AWT')
+REGISTER_OPS = (
+    'AND', 'ADD', 'SUB', 'OR', 'CLE', 'CMA', 'CME', 'CIR', 'CIL', 'SZA', 'SZE', 'ICA', 'ESW',
+    'DSW', 'HLT', 'FORK', 'RST', 'UTM', 'LDP', 'SPA', 'INP', 'OUT', 'SKI', 'SKO', 'EI', 'TSA',
+)
+ADDRESS_BITS = 8
+
+LABEL = re.compile(r'\s*([A-Za-z_][A-Za-z0-9_]*)\s*:(.*)$')
+
+
+def word_bits(address_bits = ADDRESS_BITS):
+    return address_bits + 4
+
+
+def encode(mnemonic, operand = None, indirect = False, address_bits = ADDRESS_BITS):
+    if mnemonic in MEMORY_OPS:
+        if operand is None: raise ValueError(f'{mnemonic} needs an address')
+        if not 0 <= operand < 1 << address_bits: raise ValueError(f'Address {operand:X} out of bounds')
+        return indirect << address_bits + 3 | (MEMORY_OPS.index(mnemonic) + 1) << address_bits | operand
+    if mnemonic in REGISTER_OPS:
+        if operand is not None or indirect: raise ValueError(f'{mnemonic} takes no address')
+        return 1 << address_bits + 3 | REGISTER_OPS.index(mnemonic) + 1
+    raise ValueError(f'unknown instructions {mnemonic}')
+
+
+def assemble_word(text, symbols = {}, address_bits = ADDRESS_BITS):
+    # 'LDA 0A I', 'LDA x', 'HLT', a hex data word or a label (its address), as one int word
+    codes = str(text).split()
+    if not codes: return 0
+    mnemonic = codes[0].upper()
+
+    if mnemonic not in MEMORY_OPS and mnemonic not in REGISTER_OPS:
+        if len(codes) == 1:
+            if codes[0] in symbols: return symbols[codes[0]]
+            try: word = int(codes[0], 16)
+            except ValueError: raise ValueError(f'unknown instructions {mnemonic}') from None
+            if not 0 <= word < 1 << word_bits(address_bits): raise ValueError(f'Word {codes[0]} does not fit in {word_bits(address_bits)} bits')
+            return word
+        raise ValueError(f'unknown instructions {mnemonic}')
+
+    if len(codes) > 3 or len(codes) == 3 and codes[2].upper() != 'I':
+        raise ValueError(f'Invalid operand {" ".join(codes[1:])}')
+    operand = None
+    if len(codes) > 1:
+        if codes[1] in symbols: operand = symbols[codes[1]]
+        else:
+            try: operand = int(codes[1], 16)
+            except ValueError: raise ValueError(f'Unknown label {codes[1]}') from None
+    return encode(mnemonic, operand, len(codes) == 3, address_bits)
+
+
+def split_label(entry):
+    # (label or None, text) of a memory entry written as 'label: text' or {label: text}
+    if isinstance(entry, dict):
+        if len(entry) != 1: raise ValueError(f'Invalid labelled entry {entry}')
+        (label, text), = entry.items()
+        return str(label), '' if text is None else str(text)
+    text = str(entry).split('#')[0].split(';')[0]
+    match = LABEL.match(text)
+    if match: return match.group(1), match.group(2).strip()
+    return None, text.strip()
+
+
+def assemble_entries(entries, address_bits = ADDRESS_BITS):
+    # Two passes over (address, entry) pairs: labels first, then words.
+    # Returns ({address: word}, {label: address}); empty entries are skipped.
+    symbols, texts = {}, {}
+    for address, entry in entries:
+        if not 0 <= address < 1 << address_bits: raise ValueError('Address out of bounds')
+        label, text = split_label(entry)
+        if label is not None:
+            if label in symbols: raise ValueError(f'Label {label} defined twice')
+            symbols[label] = address
+        if text: texts[address] = text
+
+    words = {}
+    for address, text in texts.items():
+        try:
+            words[address] = assemble_word(text, symbols, address_bits)
+        except ValueError as v:
+            raise ValueError(f'Invalid instruction/operand at location {address:02X}: {text} ({v})') from None
+    return words, symbols
+
+
+def assemble(source, address_bits = ADDRESS_BITS):
+    # Text program: one entry per line, 'ORG <hex>' moves the location counter,
+    # '#' or ';' starts a comment. Returns ({address: word}, {label: address}).
+    entries, address = [], 0
+    for line in source.splitlines():
+        code = line.split('#')[0].split(';')[0].strip()
+        if not code: continue
+        if code.upper().startswith('ORG '):
+            address = int(code[4:].strip(), 16)
+            continue
+        entries.append((address, code))
+        address += 1
+    return assemble_entries(entries, address_bits)
+
+
+def disassemble(word, address_bits = ADDRESS_BITS):
+    # 'LDA 0A I' style text of an instruction word, or the word in hex
+    op = word >> address_bits & 7
+    address = word & (1 << address_bits) - 1
+    digits = (address_bits + 3) // 4
+    if op: return f'{MEMORY_OPS[op - 1]} {address:0{digits}X}' + (' I' if word >> address_bits + 3 & 1 else '')
+    if word >> address_bits + 3 & 1 and 0 < address <= len(REGISTER_OPS): return REGISTER_OPS[address - 1]
+    return f'{word:0{digits + 1}X}'
@@ -0,0 +1,78 @@
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from devices import make_devices
+from machine import Machine
+
+
+def expand(targets):
+    # yaml files named by paths, directories and glob patterns, sorted and without duplicates
+    paths = set()
+    for target in targets:
+        if os.path.isdir(target):
+            paths.update(glob.glob(os.path.join(target, '*.yaml')))
+        elif glob.has_magic(target):
+            paths.update(glob.glob(target, recursive=True))
+        else:
+            paths.add(target)
+    return sorted(paths)
+
+
+def run_program(path, max_cycles=None, timeout=None, compile=False, io=()):
+    # io: make_devices() arguments, so every program gets devices of its own
+    try:
+        machine = Machine(compile=compile, devices=make_devices(*io))
+        machine.load(path)
+    except (OSError, ValueError) as v:
+        return {'halt': f'error: {v}', 'cycles': 0}
+    except Exception as e:
+        # a simulator bug hit by this program is its result, not the end of the batch
+        return {'halt': f'error: {type(e).__name__}: {e}', 'cycles': 0}
+    try: machine.run(max_cycles, timeout)
+    except Exception as e:
+        machine.halt_reason = f'error: {type(e).__name__}: {e}'
+    return machine.state()
+
+
+def _run(job):
+    return run_program(*job)
+
+
+def run_batch(paths, max_cycles=None, timeout=None, workers=None, compile=False, io=()):
+    # {path: final state}; programs are independent, so they are spread over
+    # worker processes in chunks to keep the per-program IPC overhead small
+    workers = workers or os.cpu_count() or 1
+    jobs = [(path, max_cycles, timeout, compile, io) for path in paths]
+    if workers == 1 or len(jobs) <= 1:
+        return dict(zip(paths, map(_run, jobs)))
+
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(workers) as pool:
+        return dict(zip(paths, pool.map(_run, jobs, chunksize=chunksize)))
+
+
+def main(args):
+    paths = expand(args.programs)
+    if not paths:
+        print('no programs found', file=sys.stderr)
+        return 1
+
+    start = perf_counter()
+    io = (args.input, args.interval, args.seed, args.output is not None, args.latency)
+    results = run_batch(paths, args.max_cycles, args.timeout, args.workers, args.compile, io)
+    elapsed = perf_counter() - start
+
+    with open(args.out, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    halts = {}
+    for state in results.values():
+        reason = state['halt'].split(':')[0]
+        halts[reason] = halts.get(reason, 0) + 1
+    summary = ', '.join(f'{n} {reason}' for reason, n in sorted(halts.items()))
+    print(f'{len(paths)} programs in {elapsed:.2f}s ({summary}), results in {args.out}')
+    return 1 if 'error' in halts else 0
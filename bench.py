@@ -0,0 +1,227 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from time import perf_counter, strftime
+
+from devices import Devices, Input
+from machine import Machine
+
+
+def process(pc):
+    return {'PC': pc, 'PC0': pc, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}
+
+
+# Guest workloads. The IO one gets a new input every `input` T-states from an
+# input device; a workload that halts is restarted from its loaded state.
+WORKLOADS = {
+    # one process multiplying by repeated addition, no switching
+    'multiply': {
+        'FF': {'GS': 1, 'S': 1, 'SW': 0},
+        'M': {
+            0: [0], 8: 'FF',
+            '0A': 'a: 7', '0B': 'b: 2F', '0C': 'n: 0', '0D': 'sum: 0', '0E': 'one: 1',
+            20: ['outer: LDA b', 'STA n', 'loop: ADD', 'LDA sum', 'CAL a', 'STA sum',
+                 'SUB', 'LDA n', 'CAL one', 'STA n', 'SZA', 'BR loop', 'BR outer'],
+        },
+        'M2': {0: process('20')},
+    },
+    # eight processes sharing a counting loop, switched every 2 instructions
+    'round_robin': {
+        'FF': {'GS': 1, 'S': 1, 'SW': 1},
+        'M': {
+            0: [0, 1, 2, 3, 4, 5, 6, 7], 8: 2,
+            '0A': 'count: 0', '0B': 'one: 1',
+            20: ['loop: ADD', 'LDA count', 'CAL one', 'STA count', 'BR loop'],
+        },
+        'M2': {pid: process('20') for pid in range(8)},
+    },
+    # a SKI/INP polling loop that also takes every input it can as an interrupt
+    'io': {
+        'FF': {'GS': 1, 'S': 1, 'SW': 0},
+        'M': {
+            0: [0], 8: 'FF', 9: 'handler',
+            '0A': 'polled: 0', '0B': 'taken: 0',
+            20: ['loop: EI', 'SKI', 'BR loop', 'INP', 'STA polled', 'BR loop'],
+            30: ['handler: INP', 'OUT', 'STA taken', 'LDP'],
+        },
+        'M2': {0: process('20')},
+        'input': 16,
+    },
+    # a process forks a worker and a third one waits for it with AWT
+    'fork_awt': {
+        'FF': {'GS': 1, 'S': 1, 'SW': 1},
+        'M': {
+            0: [0, 2, 1], 8: 3,
+            '0A': 'count: 60', '0B': 'result: 0', '0C': 'one: 1', '0D': 'child: 1',
+            20: ['FORK', 'work: SUB', 'LDA count', 'CAL one', 'STA count', 'SZA', 'BR work', 'HLT'],
+            30: ['AWT child', 'LDA count', 'STA result', 'HLT'],
+        },
+        'M2': {0: process('20'), 2: process('30')},
+    },
+}
+
+
+def measure(name, cycles, compile=False):
+    # run one workload for `cycles` cycles and return its rates
+    config = WORKLOADS[name]
+    devices = None
+    if 'input' in config: devices = Devices(Input(count(1), config['input'], size=1))
+    machine = Machine(compile=compile, devices=devices)
+    machine.load({k: v for k, v in config.items() if k != 'input'})
+    cpu = machine.cpu
+    start = machine.snapshot()
+
+    counts = {'switches': 0, 'interrupts': 0}
+    def counted(method, key):
+        def wrapper():
+            counts[key] += 1
+            method()
+        return wrapper
+    cpu.contextSwitch = counted(cpu.contextSwitch, 'switches')
+    cpu.ioInterrupt = counted(cpu.ioInterrupt, 'interrupts')
+
+    done = ticks = restarts = 0
+    began = perf_counter()
+    while done < cycles:
+        machine.run(cycles - done)
+        done += machine.cycles
+        if machine.halt_reason != 'max_cycles':
+            if machine.halt_reason != 'halted': raise RuntimeError(f'{name}: {machine.halt_reason}')
+            ticks += cpu.ticks
+            machine.restore(start)
+            restarts += 1
+        else:
+            machine.cycles = 0
+            machine.halt_reason = None
+    seconds = perf_counter() - began
+    ticks += cpu.ticks
+
+    instructions = done - counts['switches'] - counts['interrupts']
+    return {
+        'cycles': done,
+        'seconds': round(seconds, 4),
+        'instructions_per_s': round(instructions / seconds),
+        'tstates_per_s': round(ticks / seconds),
+        'switches_per_s': round(counts['switches'] / seconds),
+        'interrupts_per_s': round(counts['interrupts'] / seconds),
+        'restarts': restarts,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_suite(names, cycles, repeat=3, compile=False):
+    # best of `repeat` runs per workload, each run in a fresh process so peak RSS is its own
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                runs.append(pool.submit(measure, name, cycles, compile).result())
+        results[name] = max(runs, key=lambda r: r['instructions_per_s'])
+    return results
+
+
+# entry point -> what a fresh interpreter runs to start it; the GUI one stops
+# short of opening the window, which needs a display
+STARTUP = {
+    'python': 'pass',
+    'headless': 'import machine',
+    'gui': 'import csm',
+}
+
+
+def measure_startup(repeat=10):
+    # best wall time in ms of a new interpreter starting each entry point
+    here = os.path.dirname(os.path.abspath(__file__))
+    startup = {}
+    for name, statement in STARTUP.items():
+        times = []
+        for _ in range(repeat):
+            began = perf_counter()
+            subprocess.run([sys.executable, '-c', statement], cwd=here, check=True)
+            times.append(perf_counter() - began)
+        startup[name] = round(min(times) * 1000, 1)
+    return startup
+
+
+# metric -> +1 if higher is better, -1 if lower is better
+COMPARED = {'instructions_per_s': 1, 'tstates_per_s': 1, 'switches_per_s': 1, 'interrupts_per_s': 1, 'peak_rss_kb': -1}
+
+
+def compare(results, baseline, threshold, compared=COMPARED):
+    # (workload, metric, baseline, now, change %) for every metric worse than threshold %
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None: continue
+        for metric, sign in compared.items():
+            if not before.get(metric): continue
+            change = (now[metric] - before[metric]) / before[metric] * 100
+            if change * sign < -threshold: regressions.append((name, metric, before[metric], now[metric], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench', description='Benchmark the headless simulator core')
+    parser.add_argument('workloads', nargs='*', default=list(WORKLOADS), help=f'any of {", ".join(WORKLOADS)}')
+    parser.add_argument('--cycles', type=int, default=200000, help='instruction cycles per run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per workload, the best one is kept')
+    parser.add_argument('--compile', action='store_true', help='run straight-line code as compiled superblocks')
+    parser.add_argument('--out', default=None, help='write the results as json')
+    parser.add_argument('--baseline', default=None, help='results json to compare against')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed regression against the baseline, in percent')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown: parser.error(f'unknown workloads: {", ".join(unknown)}')
+
+    startup = measure_startup()
+    print('startup ' + ', '.join(f'{name} {ms:.1f} ms' for name, ms in startup.items()))
+    results = run_suite(args.workloads, args.cycles, args.repeat, args.compile)
+    print(f'{"workload":<12} {"instr/s":>12} {"T-states/s":>12} {"switches/s":>11} {"interrupts/s":>12} {"peak RSS":>10}')
+    for name, r in results.items():
+        print(f'{name:<12} {r["instructions_per_s"]:>12,} {r["tstates_per_s"]:>12,} {r["switches_per_s"]:>11,} '
+              f'{r["interrupts_per_s"]:>12,} {r["peak_rss_kb"]:>7,} KB')
+
+    if args.out:
+        report = {
+            'date': strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'compile': args.compile,
+            'cycles': args.cycles,
+            'startup_ms': startup,
+            'workloads': results,
+        }
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline['workloads'], args.threshold)
+        # older baselines have no startup times
+        if 'startup_ms' in baseline:
+            regressions += compare({'startup': startup}, {'startup': baseline['startup_ms']}, args.threshold, dict.fromkeys(STARTUP, -1))
+        for name, metric, before, now, change in regressions:
+            print(f'REGRESSION {name} {metric}: {before:,} -> {now:,} ({change:+.1f}%)')
+        if regressions: return 1
+        print(f'no regressions beyond {args.threshold:g}% against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
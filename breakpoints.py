@@ -0,0 +1,176 @@
+from hooks import Hooks
+
+SIZE = 1 << 16  # bitmaps cover the largest main memory (cpu.ADDRESS_WIDTHS)
+
+
+class Break(Exception):
+    # Raised out of an instruction cycle by a breakpoint, before anything was
+    # fetched (done False), or by a watchpoint once its cycle is over (done True)
+    def __init__(self, message, done):
+        super().__init__(message)
+        self.done = done
+
+
+class Breakpoints:
+    # Breakpoints and watchpoints on a CPU. Each kind hooks the CPU instance only
+    # while one is set (fetch for breakpoints; store, store_process and
+    # instruction_cycle for watchpoints), so with none set nothing is checked.
+    #
+    # A breakpoint at an address stops before the instruction there is fetched,
+    # when its condition, if it has one, holds. A condition set on its own is
+    # checked before every fetch. Conditions are Python expressions over the
+    # registers and flip-flops, M (main memory) and M2 (process table rows),
+    # such as 'PRC == 2 and AC == 0'. Running on fetches the instruction it
+    # stopped at. A watchpoint stops at the end of any cycle that wrote the
+    # watched word or process table row, whatever wrote it.
+    #
+    # Compiled superblocks end before breakpoint addresses; while conditions or
+    # watchpoints are set, nothing runs compiled.
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.hooks = Hooks()
+        self.addresses = {}             # address -> (condition text, code) or None
+        self.conditions = {}            # condition text -> code, checked at every fetch
+        self.bitmap = bytearray(SIZE)   # 1 where an address has a breakpoint
+        self.watched = bytearray(SIZE)  # 1 where a main memory word is watched
+        self.processes = set()          # watched process table rows
+        self.hits = []
+        self.resume = None              # (PC, T-state) of the last stop, passed on the next fetch
+        self.needed = None              # what is hooked, see update()
+        self.generation = 0             # bumped whenever the hooks are set again
+
+    def __bool__(self):
+        return bool(self.addresses or self.conditions or any(self.watched) or self.processes)
+
+    def parse(self, condition):
+        try: return condition, compile(condition, '<condition>', 'eval')
+        except SyntaxError: raise ValueError(f'Invalid condition: {condition}') from None
+
+    def check(self, address):
+        if not 0 <= address < len(self.cpu.main_memory): raise ValueError(f'Address {address:X} out of bounds')
+
+    def add(self, address, condition = None):
+        self.check(address)
+        self.addresses[address] = None if condition is None else self.parse(condition)
+        self.bitmap[address] = 1
+        if self.cpu.blocks is not None: self.cpu.blocks.stop(address, True)
+        self.update()
+
+    def remove(self, address):
+        if self.addresses.pop(address, False) is False: return
+        self.bitmap[address] = 0
+        if self.cpu.blocks is not None: self.cpu.blocks.stop(address, False)
+        self.update()
+
+    def add_condition(self, condition):
+        self.conditions[condition] = self.parse(condition)[1]
+        self.update()
+
+    def remove_condition(self, condition):
+        self.conditions.pop(condition, None)
+        self.update()
+
+    def watch(self, address):
+        self.check(address)
+        self.watched[address] = 1
+        self.update()
+
+    def unwatch(self, address):
+        self.watched[address] = 0
+        self.update()
+
+    def watch_process(self, pid):
+        if not 0 <= pid < self.cpu.processes: raise ValueError(f'Invalid PID: {pid:X}')
+        self.processes.add(pid)
+        self.update()
+
+    def unwatch_process(self, pid):
+        self.processes.discard(pid)
+        self.update()
+
+    def clear(self):
+        for address in list(self.addresses): self.remove(address)
+        self.conditions.clear()
+        self.watched[:] = bytes(SIZE)
+        self.processes.clear()
+        self.update()
+
+    def update(self):
+        # hook what the breakpoints and watchpoints now set need, and nothing else
+        cpu = self.cpu
+        breaking = bool(self.addresses or self.conditions)
+        watching = bool(any(self.watched) or self.processes)
+        needed = (breaking, watching, bool(self.conditions) or watching, cpu.blocks)
+        if needed == self.needed: return
+        self.needed = needed
+        self.hooks.remove()
+        # hooks left covered by someone else's stay in place: they pass through from now on
+        self.generation += 1
+        if breaking: self.hooks.set(cpu, 'fetch', self.checked_fetch(cpu.fetch))
+        if watching:
+            self.hooks.set(cpu, 'store', self.watched_store(cpu.store))
+            self.hooks.set(cpu, 'store_process', self.watched_store_process(cpu.store_process))
+            self.hooks.set(cpu, 'instruction_cycle', self.watched_cycle(cpu.instruction_cycle))
+        if cpu.blocks is None: return
+        if self.conditions or watching: self.hooks.set(cpu.blocks, 'lookup', lambda: None)
+        elif breaking:
+            # no block starts at a breakpoint, and none runs into one (SuperblockCompiler.stops)
+            lookup, bitmap = cpu.blocks.lookup, self.bitmap
+            self.hooks.set(cpu.blocks, 'lookup', lambda: None if bitmap[cpu.PC] else lookup())
+
+    def holds(self, condition, code):
+        cpu = self.cpu
+        try: return eval(code, {'M': cpu.main_memory, 'M2': cpu.secondary_memory}, cpu.__dict__)
+        except Exception as e: raise ValueError(f'Condition {condition}: {e}') from None
+
+    def hit(self, pc):
+        # why to stop before fetching at pc, or None
+        cpu = self.cpu
+        if self.resume == (pc, cpu.ticks):
+            self.resume = None
+            return None
+        reason = None
+        if self.bitmap[pc]:
+            condition = self.addresses[pc]
+            if condition is None: reason = f'breakpoint at {cpu.format_address(pc)}'
+            elif self.holds(*condition): reason = f'breakpoint at {cpu.format_address(pc)}: {condition[0]}'
+        if reason is None:
+            reason = next((f'breakpoint: {text}' for text, code in self.conditions.items() if self.holds(text, code)), None)
+        if reason is not None: self.resume = (pc, cpu.ticks)
+        return reason
+
+    def checked_fetch(self, fetch):
+        cpu, bitmap, generation = self.cpu, self.bitmap, self.generation
+        def checked():
+            if generation == self.generation and (bitmap[cpu.PC] or self.conditions):
+                reason = self.hit(cpu.PC)
+                if reason is not None:
+                    # the cycle only just began: take its journal entry back out
+                    if cpu.journal is not None: cpu.journal.step_back(1)
+                    raise Break(reason, False)
+            fetch()
+        return checked
+
+    def watched_store(self, store):
+        cpu, watched, hits, generation = self.cpu, self.watched, self.hits, self.generation
+        def checked(address, word):
+            old = cpu.main_memory[address]
+            store(address, word)
+            if watched[address] and generation == self.generation: hits.append(f'M[{cpu.format_address(address)}] {cpu.format_word(old)} -> {cpu.format_word(word)}')
+        return checked
+
+    def watched_store_process(self, store_process):
+        cpu, hits, generation = self.cpu, self.hits, self.generation
+        def checked(pid, row):
+            store_process(pid, row)
+            if pid in self.processes and generation == self.generation: hits.append(f'M2[{pid:X}] {cpu.format_psr(cpu.secondary_memory[pid])}')
+        return checked
+
+    def watched_cycle(self, cycle):
+        hits, generation = self.hits, self.generation
+        def checked():
+            if generation != self.generation: return cycle()
+            hits.clear()    # writes between cycles (loads, edits, undo) do not stop anything
+            cycle()
+            if hits: raise Break(f'watchpoint: {", ".join(hits)}', True)
+        return checked
@@ -1,7 +1,21 @@
-from time import sleep
-import inspect
+from time import sleep, perf_counter
+from collections import deque
+from array import array
+import marshal
 import threading
-from tkinter import messagebox
+
+from assembler import ADDRESS_BITS, MEMORY_OPS, REGISTER_OPS, assemble_entries, word_bits
+from breakpoints import Break
+
+
+# Column order of a PSR / secondary memory row
+PSR_FIELDS = ('S', 'A1', 'A0', 'E', 'AC', 'PC0', 'PC')
+REGISTERS = ('AR', 'PC', 'DR', 'AC', 'INPR', 'IR', 'TR', 'TM', 'PRC', 'TAR', 'TP', 'NS', 'OUTR', 'SC', 'PSR')
+FLIP_FLOPS = ('I', 'E', 'R', 'C', 'SW', 'IEN', 'FGI', 'FGO', 'S', 'GS', 'A0', 'A1')
+# registers and flip-flops held in a snapshot, in blob order (PSR is kept separately)
+SNAPSHOT_NAMES = tuple(r for r in REGISTERS if r != 'PSR') + FLIP_FLOPS
+SNAPSHOT_VERSION = 3
+ADDRESS_WIDTHS = (8, 12, 16)    # 256, 4K and 64K words
 
 
 class Hex(): 
@@ -38,24 +52,168 @@ class Hex():
     def __or__(self, other): 
         return self._hex(int(self.val, 16) | int(other.val, 16))
 
+    @staticmethod
+    def format(val, bits = 2):
+        # display form of a register / memory word held as an int
+        if val is None: return ''
+        if val.__class__ is str: return val
+        return f"{val:0{bits}X}"
+
+
+class DeltaQueue:
+    # Bounded queue of change records pushed by CPU.block and drained by the UI
+    # once per frame. Each record is (changed names, their new values, memory_ptr
+    # address); when full the oldest records are dropped and `dropped` is set.
+    # In lockstep mode block() waits until the UI has drained its record.
+    # Above CPU.TURBO_HZ no records are queued; the names changed since the last
+    # frame are collected in `pending` and the UI reads the live state instead.
+    def __init__(self, size = 1024, lockstep = False):
+        self.records = deque(maxlen=size)
+        self.lockstep = lockstep
+        self.dropped = False
+        self.pending = set()
+        # main memory addresses and secondary memory rows written since the last frame
+        self.memory = set()
+        self.processes = set()
+        self.cond = threading.Condition()
+
+    def push(self, record):
+        with self.cond:
+            if len(self.records) == self.records.maxlen: self.dropped = True
+            self.records.append(record)
+            while self.lockstep and self.records:
+                self.cond.wait(0.1)
+
+    def drain(self):
+        with self.cond:
+            records = list(self.records)
+            self.records.clear()
+            self.cond.notify_all()
+        return records
+
+    def touch(self, names):
+        with self.cond:
+            self.pending.update(names)
+
+    def take_pending(self):
+        with self.cond:
+            pending, self.pending = self.pending, set()
+        return pending
+
+    def touch_memory(self, address):
+        with self.cond:
+            self.memory.add(address)
+
+    def touch_process(self, pid):
+        with self.cond:
+            self.processes.add(pid)
+
+    def take_dirty(self):
+        with self.cond:
+            memory, self.memory = self.memory, set()
+            processes, self.processes = self.processes, set()
+        return memory, processes
+
+
+class Decoding(dict):
+    # word -> (handler, operand, indirect), or None where the word is no
+    # instruction; entries are made the first time a word is decoded, so the
+    # table only ever holds the words a program actually uses
+    def __init__(self, memory_ops, register_ops, address_bits):
+        self.memory_ops = memory_ops        # handlers by opcode, [0] unused
+        self.register_ops = register_ops    # handlers by register op number, [0] unused
+        self.address_bits = address_bits
+
+    def map(self, f):
+        # the same table with every handler replaced by f(handler)
+        return Decoding([h and f(h) for h in self.memory_ops], [h and f(h) for h in self.register_ops], self.address_bits)
+
+    def __missing__(self, word):
+        a = self.address_bits
+        op, operand = word >> a & 7, word & (1 << a) - 1
+        if op: decoded = (self.memory_ops[op], operand, word >> a + 3 & 1)
+        elif word >> a + 3 & 1 and 0 < operand < len(self.register_ops): decoded = (self.register_ops[operand], None, False)
+        else: decoded = None
+        self[word] = decoded
+        return decoded
+
+
+class ProcessTable:
+    # Secondary memory as parallel columns: one list per PSR field, indexed by
+    # PID, None where a row was never written. A row is read as a tuple and
+    # written from any sequence, both in PSR_FIELDS order and field by field,
+    # so saving or restoring a context allocates no per-row objects.
+    def __init__(self, size):
+        self.columns = tuple([None] * size for _ in PSR_FIELDS)
+        self.S, self.A1, self.A0, self.E, self.AC, self.PC0, self.PC = self.columns
+
+    def __len__(self):
+        return len(self.S)
+
+    def __getitem__(self, pid):
+        return (self.S[pid], self.A1[pid], self.A0[pid], self.E[pid], self.AC[pid], self.PC0[pid], self.PC[pid])
+
+    def __setitem__(self, pid, row):
+        self.S[pid], self.A1[pid], self.A0[pid], self.E[pid], self.AC[pid], self.PC0[pid], self.PC[pid] = row
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
 
 class CPU:
-    def __init__(self, freq = 1):
-        self.AR = Hex(bits=2).val   # Address Register (8 bits)
-        self.PC = Hex(bits=2).val     # Program Counter (8 bits)
-        self.DR = Hex(bits=3).val     # Data Register (12 bits)
-        self.AC = Hex(bits=3).val     # Accumulator (12 bits)
-        self.INPR = Hex(bits=1).val   # Input Register (8 bits)
-        self.IR = Hex(bits=3).val     # instruction Register (12 bits)
-        self.TR = Hex(bits=3).val     # Temporary Register (12 bits)
-        self.TM = Hex(bits=2).val     # Timer Register (8 bits)
-        self.PRC = Hex(bits=1).val    # Priority Register (3 bits)
-        self.TAR = Hex(bits=1).val    # Table Address Register (3 bits)
-        self.TP = Hex(bits=1).val     # Total Processes (3 bits)
-        self.NS = Hex(bits=1).val     # Number of Stops (3 bits)
-        self.OUTR = Hex(bits=1).val    # Output Register (8 bits)
-        self.SC = Hex(bits=1).val
-        self.PSR = {'S': 0, 'A1' : 0, 'A0' : 0, 'E': 0, 'AC': Hex('0',3).val, 'PC0': Hex('0').val, 'PC':Hex('0').val}
+    # Clocks above this (or clk == 0, unthrottled) are paced in batches and
+    # rendered as coalesced frames instead of one UI update per T-state
+    TURBO_HZ = 100
+
+    def __init__(self, freq = 1, address_bits = ADDRESS_BITS, processes = 8):
+        self.clk = freq
+        self.deadline = 0
+        # when False, block() neither sleeps nor publishes deltas (headless runs)
+        self.throttle = True
+        self.deltas = None  # DeltaQueue drained by the UI
+        self.trace = None   # tracer.Trace recording every T-state
+        self.blocks = None  # superblock.SuperblockCompiler, told about every store
+        self.journal = None # journal.Journal, undo log for stepping back
+        self.devices = None # devices.Devices, polled at the start of every cycle
+        # run_next() and run_code() report to these rather than raise: on_error gets
+        # the message of an error (raised again if unset), on_stop why execution stopped
+        self.on_error = None
+        self.on_stop = None
+        self.size = (address_bits, processes)  # what load() goes back to without a SIZE section
+        self.configure(address_bits, processes)
+
+    def configure(self, address_bits, processes):
+        # Memory of 1 << address_bits words of address_bits + 4 bits, and a
+        # process table of `processes` rows whose order table is M[0 .. processes-1],
+        # followed by the time slice and the interrupt vector. Resets the machine.
+        if address_bits not in ADDRESS_WIDTHS: raise ValueError(f'Address width must be one of {", ".join(map(str, ADDRESS_WIDTHS))} bits')
+        if not 1 <= processes <= 1 << address_bits - 2: raise ValueError(f'Invalid number of processes {processes}')
+        self.address_bits = address_bits
+        self.processes = processes
+        self.time_address = processes       # M[08] with 8 processes
+        self.vector_address = processes + 1 # M[09]
+        self.word_bits = word_bits(address_bits)
+        self.typecode = next(t for t in 'HIL' if array(t).itemsize * 8 >= self.word_bits)
+        self.reset()
+        self.decoding = self.decoding_table()
+
+    def reset(self):
+        # Registers hold ints masked to the widths in self.bits
+        self.AR = 0     # Address Register (address width, 8 bits by default)
+        self.PC = 0     # Program Counter (address width)
+        self.DR = 0     # Data Register (word width, 12 bits by default)
+        self.AC = 0     # Accumulator (word width)
+        self.INPR = 0   # Input Register (8 bits)
+        self.IR = 0     # instruction Register (word width)
+        self.TR = 0     # Temporary Register (word width)
+        self.TM = 0     # Timer Register (8 bits)
+        self.PRC = 0    # Priority Register (3 bits)
+        self.TAR = 0    # Table Address Register (3 bits)
+        self.TP = 0     # Total Processes (3 bits)
+        self.NS = 0     # Number of Stops (3 bits)
+        self.OUTR = 0   # Output Register (8 bits)
+        self.SC = 0
+        self.PSR = [0, 0, 0, 0, 0, 0, 0]   # Process Status Register, fields in PSR_FIELDS order
 
         # Flip-Flops
         self.I = 0      # Interrupt Flip-Flop
@@ -70,44 +228,44 @@ class CPU:
         self.GS = 0     # General Status Flip-Flop
         self.A0 = 0     # A0 Flip-Flop
         self.A1 = 0     # A1 Flip-Flop
-        self.clk = freq
 
 
         self.running = False
-        self.execute = False
         self.stepping = False
-        self.lock = threading.Lock()
-        self.ui = None
-        self.update_ui = False 
         self.memory_ptr = 'AR'
+        self.ticks = 0  # T-states executed since reset
 
-        # Main Memory (256 words, each 12 bits)
+        # Main Memory (256 words of 12 bits by default), encoded as by assembler.py
+        self.main_memory = array(self.typecode, [0]) * (1 << self.address_bits)
+        self.symbols = {}   # labels of the loaded program
+        if self.blocks is not None: self.blocks.clear()
 
-        self.main_memory = [''] * 256
-
-        # Secondary Memory (8 rows, 7 columns)
-        # Each row represents a tuple: (S, A1, A0, E, AC, PC0, PC)
-        self.secondary_memory = [
-            {'S': '', 'A1' : '', 'A0' : '', 'E': '', 'AC': '', 'PC0': '', 'PC': ''} for _ in range(8)
-        ]
+        # Secondary Memory (8 rows by default, 7 columns)
+        # Each row represents a tuple: (S, A1, A0, E, AC, PC0, PC), None for unset fields
+        self.secondary_memory = ProcessTable(self.processes)
 
         self.changed_vars = []
         ## OTHER GLOBAL VARIABLE
+        # widths in hex digits
+        address, word, pid = self.address_bits // 4, self.word_bits // 4, len(f'{self.processes:X}')
         self.bits = {
-            'AR' : 2, # Address Register (8 bits)
-            'PC' : 2, # Program Counter (8 bits)
-            'DR' : 3, # Data Register (12 bits)
-            'AC' : 3, # Accumulator (12 bits)
+            'AR' : address, # Address Register (8 bits)
+            'PC' : address, # Program Counter (8 bits)
+            'DR' : word, # Data Register (12 bits)
+            'AC' : word, # Accumulator (12 bits)
             'INPR' : 1, # Input Register (8 bits)
-            'IR' : 3, # instruction Register (12 bits)
-            'TR' : 3, # Temporary Register (12 bits)
+            'IR' : word, # instruction Register (12 bits)
+            'TR' : word, # Temporary Register (12 bits)
             'TM' : 2, # Timer Register (8 bits)
-            'PRC' : 1, # Priority Register (3 bits)
-            'TAR' : 1, # Table Address Register (3 bits)
-            'TP' : 1, # Total Processes (3 bits)
-            'NS' : 1, # Number of Stops (3 bits)
-            'OUT' : 1 # Output Register (8 bits)
+            'PRC' : pid, # Priority Register (3 bits)
+            'TAR' : pid, # Table Address Register (3 bits)
+            'TP' : pid, # Total Processes (3 bits)
+            'NS' : pid, # Number of Stops (3 bits)
+            'OUT' : 1, # Output Register (8 bits)
+            'OUTR' : 1, # Output Register (8 bits)
+            'SC' : 1, # Sequence Counter
         }
+        self.mask = {r: (1 << 4*b) - 1 for r, b in self.bits.items()}
 
         self.instruction_map = {
             "AND": self.AND_instruction,
@@ -142,49 +300,103 @@ class CPU:
             "SKI": self.SKI_instruction,
             "SKO": self.SKO_instruction,
             "EI": self.EI_instruction,
+            "TSA": self.TSA_instruction,
         }
 
+    def format(self, name):
+        # hex display string of a register, flip-flop or the PSR
+        if name == 'PSR': return self.format_psr(self.PSR)
+        return Hex.format(getattr(self, name), self.bits.get(name, 1))
+
+    def format_psr(self, row):
+        # row is the PSR or a process table row, fields in PSR_FIELDS order
+        bits = (1, 1, 1, 1, self.bits['AC'], self.bits['PC'], self.bits['PC'])
+        return '-'.join(Hex.format(value, b) for value, b in zip(row, bits))
+
+    def format_word(self, word):
+        return Hex.format(word, self.bits['IR'])
+
+    def format_address(self, address):
+        return Hex.format(address, self.bits['AR'])
+
+    def format_value(self, name, value):
+        # display string of a value recorded in a delta
+        if name == 'PSR': return self.format_psr(value)
+        return Hex.format(value, self.bits.get(name, 1))
+
+    def value(self, name):
+        # value of a register as recorded in deltas and traces
+        if name == 'PSR': return tuple(self.PSR)
+        if name == 'M': return (self.AR, self.main_memory[self.AR])
+        if name == 'M2': return (self.TAR, self.secondary_memory[self.TAR])
+        return getattr(self, name, None)
+
+    def delta(self):
+        return self.changed_vars, [self.value(name) for name in self.changed_vars], getattr(self, self.memory_ptr)
+
+    def read(self, address):
+        return self.main_memory[address]
+
+    def store(self, address, word):
+        if self.journal is not None: self.journal.write(address, self.main_memory[address])
+        self.main_memory[address] = word
+        if self.blocks is not None: self.blocks.invalidate(address)
+        if self.deltas is not None: self.deltas.touch_memory(address)
+
+    def process(self, pid):
+        # process table row of a PID read from memory, as a tuple
+        if pid >= self.processes: raise ValueError(f'Invalid PID: {pid:X}')
+        return self.secondary_memory[pid]
+
+    def pc0(self, pid):
+        # just the PC0 field of that row
+        if pid >= self.processes: raise ValueError(f'Invalid PID: {pid:X}')
+        return self.secondary_memory.PC0[pid]
+
+    def store_process(self, pid, row):
+        # row is any sequence in PSR_FIELDS order; its fields are copied into the table
+        if self.journal is not None: self.journal.write_process(pid, self.secondary_memory[pid])
+        self.secondary_memory[pid] = row
+        if self.deltas is not None: self.deltas.touch_process(pid)
+
 
     def fetch(self):
         self.AR = self.PC
         self.block(['AR']) 
 
-        self.IR = self.main_memory[int(self.AR, 16)]
-        self.PC = Hex(self.PC) + Hex('1') 
+        self.IR = self.main_memory[self.AR]
+        self.PC = (self.PC + 1) & self.mask['PC']
         self.block(['IR', 'PC'])
 
     def decode(self):
-        codes = self.IR.split(' ')
-        if len(codes) == 1:
-            return codes[0].strip().upper(), None,False
-        elif len(codes) == 2:
-            self.AR = Hex(codes[1].upper().strip()).val
-            self.block(['AR'])
-            return codes[0],self.AR,False
-        else:
-            self.AR = Hex(codes[1].upper().strip()).val
-            self.I = 1
-            self.block(['AR'])
-            return codes[0].strip().upper(),codes[1].strip().upper,True
-
-    @staticmethod
-    def hex_op(hex1, hex2, bits = 3, func = lambda x, y : x + y): 
-        if bits == 3: 
-            return f"{func(int(hex1, 16), int(hex2, 16)):03x}".upper()
-
-        if bits == 2: 
-            return f"{func(int(hex1, 16), int(hex2, 16)):02x}".upper()
-    
-    @staticmethod
-    def minus(x, y): return x - y
+        decoded = self.decoding[self.IR]
+        if decoded is None: raise ValueError(f'unknown instructions {self.format_word(self.IR)}')
+        handler, operand, indirect = decoded
+        if operand is not None:
+            self.AR = operand
+            if indirect: 
+                self.I = 1
+                self.block(['AR', 'I'])
+            else: self.block(['AR'])
+        return decoded
+
+    def decode_word(self, word):
+        # (handler, operand, indirect) of an instruction word
+        decoded = self.decoding[word]
+        if decoded is None: raise ValueError(f'unknown instructions {self.format_word(word)}')
+        return decoded
+
+    def decoding_table(self):
+        # decode_word() for any word: memory reference handlers by opcode,
+        # register/IO handlers by the address field, None where there is no instruction
+        memory_ops = [None] + [self.instruction_map[op] for op in MEMORY_OPS]
+        register_ops = [None] + [self.instruction_map[op] for op in REGISTER_OPS]
+        return Decoding(memory_ops, register_ops, self.address_bits)
 
     def block(self, changed_var = [], last = False): 
-        # print(f"Changed Vars: {changed_var}")
-        # print(f"Fetch {inspect.stack()[1].function}")
-
         if last: 
             self.changed_vars = changed_var + ['C']
-            if Hex(self.TM) == Hex('0'): 
+            if self.TM == 0:
                 self.C = self.SW
                 self.stepping = False
             
@@ -192,521 +404,608 @@ class CPU:
             self.memory_ptr = 'PC'
         else: 
             self.changed_vars = changed_var + ['SC']
-            self.SC = Hex(self.SC,1) + Hex('1')
+            self.SC = (self.SC + 1) & self.mask['SC']
             self.memory_ptr = 'AR'
-        
-        self.update_ui = True
+        if self.trace is not None: self.trace.record(self.ticks, *self.delta())
+        self.ticks += 1
 
-        if not self.running and last: return
-        sleep(1/self.clk) 
-        while self.update_ui: pass
-        
-        # if last == True: 
-        #     self.stepping = False
-        #     return
-
-        # with self.lock: 
-        #     self.execute = False 
-
-        # if self.stepping and not self.running and not last: 
-        #     while self.execute == False and self.stepping and self.running == False: pass
-        #     if self.running: 
-        #         sleep(1/self.clk) 
-        #         while self.update_ui: pass
-        
-        # print(f"comming out of block with parent function {inspect.stack()[1].function}")
+        if not self.throttle: return
+        if self.clk and self.clk <= self.TURBO_HZ: 
+            if self.deltas is not None: self.deltas.push(self.delta())
+
+            if not self.running and last: return
+            sleep(1/self.clk) 
+        else: 
+            if self.deltas is not None: self.deltas.touch(self.changed_vars)
+            if self.clk: self.pace()
+
+    def pace(self):
+        # keep the simulated clock in step with real time, sleeping only once it
+        # is more than a millisecond ahead
+        now = perf_counter()
+        self.deadline = max(self.deadline, now - 0.05) + 1/self.clk
+        if self.deadline - now > 0.001: sleep(self.deadline - now)
 
     def ioInterrupt(self): 
-        self.PSR["S"] = self.S
-        self.PSR["A1"] = self.A1
-        self.PSR["A0"] = self.A0
-        self.PSR["E"] = self.E
-        self.PSR["PC"] = self.PC
-        self.PSR["AC"] = self.AC
-        self.AR = Hex(self.PRC).val
-        temp = int(self.main_memory[int(self.AR, 16)], 16)
-        self.PSR["PC0"] = self.secondary_memory[temp]['PC0']
+        self.AR = self.PRC
+        temp = self.read(self.AR)
+        self.PSR[:] = (self.S, self.A1, self.A0, self.E, self.AC, self.pc0(temp), self.PC)
         self.block(['AR', 'PSR'])
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
-        if int(self.TAR, 16) >= 8: 
-            raise ValueError(f'Invalid PID: {self.TAR}')
-        self.TAR = Hex(self.TAR, 1).val
+        self.TAR = self.read(self.AR)
+        if self.TAR >= self.processes:
+            raise ValueError(f'Invalid PID: {self.TAR:X}')
+        self.TAR = self.TAR & self.mask['TAR']
         self.block(['TAR'])
 
-        self.AR = '09'
+        self.AR = self.vector_address
         self.block(['AR'])
 
-        self.secondary_memory[int(self.TAR, 16)] = self.PSR.copy()
-        self.PC = self.main_memory[int(self.AR, 16)]
-        self.IEN, self.SW, self.R, self.SC = 0,0,0,Hex('0',1).val
+        self.store_process(self.TAR, self.PSR)
+        self.PC = self.read(self.AR) & self.mask['PC']
+        self.IEN, self.SW, self.R, self.SC = 0,0,0,0
         self.FGI, self.FGO = 0,0
-        self.block(['PC', 'IEN', 'SW', 'R', 'SC', 'FGI', 'FGO'], True)
+        self.block(['M2', 'PC', 'IEN', 'SW', 'R', 'SC', 'FGI', 'FGO'], True)
 
     def contextSwitch(self):
-        self.PSR["S"] = self.S
-        self.PSR["A1"] = self.A1
-        self.PSR["A0"] = self.A0
-        self.PSR["E"] = self.E
-        self.PSR["PC"] = self.PC
-        self.PSR["AC"] = self.AC
         self.AR = self.PRC
-        temp = int(self.main_memory[int(self.AR, 16)], 16)
-        self.PSR["PC0"] = self.secondary_memory[temp]['PC0']
+        temp = self.read(self.AR)
+        self.PSR[:] = (self.S, self.A1, self.A0, self.E, self.AC, self.pc0(temp), self.PC)
 
         # breakpoint()
         self.block(['AR', 'PSR'])
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
-        if int(self.TAR, 16) >= 8: 
-            raise ValueError(f'Invalid PID: {self.TAR}')
-        self.TAR = Hex(self.TAR, 1).val 
+        self.TAR = self.read(self.AR)
+        if self.TAR >= self.processes:
+            raise ValueError(f'Invalid PID: {self.TAR:X}')
+        self.TAR = self.TAR & self.mask['TAR']
         self.block(['TAR'])
 
-        self.AR = '08'
-        self.PRC = Hex(self.PRC, 1) + Hex('1')
+        self.AR = self.time_address
+        self.PRC = (self.PRC + 1) & self.mask['PRC']
         self.block(['AR', 'PRC'])
 
-        self.secondary_memory[int(self.TAR, 16)] = self.PSR.copy()
-        self.TM = Hex(self.main_memory[int(self.AR, 16)]).val
-        if (Hex(self.PRC,1) == Hex(self.TP)):
-            self.PRC = Hex('0', 1).val
-        self.block(['PRC', 'TM'])        
+        self.store_process(self.TAR, self.PSR)
+        self.TM = self.read(self.AR) & self.mask['TM']
+        if self.PRC == self.TP:
+            self.PRC = 0
+        self.block(['M2', 'PRC', 'TM'])        
 
         self.AR = self.PRC
         self.block(['AR'])
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
+        self.TAR = self.read(self.AR)
         self.block(['TAR'])
 
-        self.PSR = self.secondary_memory[int(self.TAR, 16)].copy()
+        self.PSR[:] = self.process(self.TAR)
         self.block(['PSR'])
 
-        self.PC = self.PSR["PC"]
-        self.AC = self.PSR["AC"]
-        self.E = self.PSR["E"]
-        self.A0 = self.PSR["A0"]
-        self.A1 = self.PSR["A1"]
-        self.S = self.PSR["S"]
+        self.S, self.A1, self.A0, self.E, self.AC, _, self.PC = self.PSR
         self.C = 0
         if (self.S == 0):
             self.C = 1
-        self.SC = Hex('0', 1).val
+        self.SC = 0
         self.block(['PC', 'AC', 'E', 'A0', 'A1', 'S', 'C', 'SC'], True)
 
     def CAL_instruction(self):
-        self.DR = Hex(self.main_memory[int(self.AR, 16)],3).val
+        self.DR = self.read(self.AR) & self.mask['DR']
         self.block(['DR'])
 
         if self.A0 == 0 and self.A1 == 0:
-            self.AC = Hex(self.AC,3) + Hex(self.DR,3)
+            self.AC = (self.AC + self.DR) & self.mask['AC']
 
         elif self.A0 == 1 and self.A1 == 0:
-            self.AC = Hex(self.AC,3) - Hex(self.DR,3)
+            self.AC = (self.AC - self.DR) & self.mask['AC']
 
         elif self.A0 == 0 and self.A1 == 1:
-            self.AC = Hex(self.AC,3) & Hex(self.DR,3)
+            self.AC = self.AC & self.DR
         else:
-            self.AC = Hex(self.AC,3) | Hex(self.DR,3)
+            self.AC = self.AC | self.DR
 
-        self.TM = Hex(self.TM) - Hex('1') 
-        self.SC = Hex('0',1).val
+        self.TM = (self.TM - 1) & self.mask['TM']
+        self.SC = 0
         self.block(['AC', 'TM', 'SC'], True)
 
     def LDA_instruction(self):
-        self.DR = Hex(self.main_memory[int(self.AR, 16)], 3).val
+        self.DR = self.read(self.AR) & self.mask['DR']
         self.block(['DR'])
 
         self.AC = self.DR
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['AC', 'SC', 'TM'], True)
 
     def STA_instruction(self):
-        self.main_memory[int(self.AR, 16)] = self.AC
+        self.store(self.AR, self.AC)
         self.block(['M'])
 
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['TM'], True)
 
 
     def BR_instruction(self):
-        self.PC = Hex(self.AR).val
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1')  
+        self.PC = self.AR & self.mask['PC']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
 
         self.block(['PC', 'TM', 'SC'], True)
 
     def ISA_instruction(self):
-        self.DR = Hex(self.main_memory[int(self.AR, 16)],3).val
+        self.DR = self.read(self.AR) & self.mask['DR']
         self.block(['DR'])
 
-        self.DR = Hex(self.DR,3) + Hex('1',3)
+        self.DR = (self.DR + 1) & self.mask['DR']
         self.block(['DR'])
 
-        self.main_memory[int(self.AR, 16)] = self.DR
+        self.store(self.AR, self.DR)
         if self.DR == self.AC:
-            self.PC = Hex(self.PC) + Hex('1') 
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
-        self.block(['DR', 'PC', 'TM', 'SC'], True)
+            self.PC = (self.PC + 1) & self.mask['PC']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
+        self.block(['M', 'DR', 'PC', 'TM', 'SC'], True)
 
     def SWT_instruction(self):
-        self.PSR["PC"] = self.PC
-        self.PSR["AC"] = self.AC
-        self.PSR["E"] = self.E
-        self.PSR["A0"] = self.A0
-        self.PSR["A1"] = self.A1
-        self.PSR["S"] = self.S
-        temp = int(self.main_memory[int(self.PRC, 16)], 16)
-        self.PSR["PC0"] = self.secondary_memory[temp]['PC0']
+        temp = self.read(self.PRC)
+        self.PSR[:] = (self.S, self.A1, self.A0, self.E, self.AC, self.pc0(temp), self.PC)
         
-        self.TR = Hex(self.AR,3).val 
+        self.TR = self.AR & self.mask['TR']
         self.block(['PSR', 'TR'])
 
         self.AR = self.PRC
         self.block(['AR'])
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
-        if int(self.TAR, 16) >= 8: 
-            raise ValueError(f'Invalid PID: {self.TAR}')
-        self.TAR = Hex(self.TAR, 1).val
+        self.TAR = self.read(self.AR)
+        if self.TAR >= self.processes:
+            raise ValueError(f'Invalid PID: {self.TAR:X}')
+        self.TAR = self.TAR & self.mask['TAR']
 
         self.block(['TAR'])
 
-        self.secondary_memory[int(self.TAR, 16)] = self.PSR.copy()
-        self.PRC = Hex(self.TR, 1).val
-        self.AR = Hex(self.TR, 2).val
-        self.block(['PRC', 'AR'])
+        self.store_process(self.TAR, self.PSR)
+        self.PRC = self.TR & self.mask['PRC']
+        self.AR = self.TR & self.mask['AR']
+        self.block(['M2', 'PRC', 'AR'])
         
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
+        self.TAR = self.read(self.AR)
         self.block(['TAR'])
 
-        self.PSR = self.secondary_memory[int(self.TAR, 16)].copy()
-        self.AR = '08'
+        self.PSR[:] = self.process(self.TAR)
+        self.AR = self.time_address
         self.block(['PSR', 'AR'])
 
-        self.PC = self.PSR["PC"]
-        self.AC = self.PSR["AC"]
-        self.E = self.PSR["E"]
-        self.A0 = self.PSR["A0"]
-        self.A1 = self.PSR["A1"]
+        s, self.A1, self.A0, self.E, self.AC, _, self.PC = self.PSR
         self.S = 1
-        self.TM = self.main_memory[int(self.AR, 16)]
-        if self.PSR["S"] == 0:
-            self.NS = Hex(self.NS) - Hex('1')
-        self.TAR = Hex(self.TAR, 1).val
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.TM = self.read(self.AR)
+        if s == 0:
+            self.NS = (self.NS - 1) & self.mask['NS']
+        self.TAR = self.TAR & self.mask['TAR']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'AC', 'E', 'A0', 'A1', 'S', 'TM', 'NS', 'SC', 'TM'], True)
     
 
     def AWT_instruction(self):
-        self.TAR = self.main_memory[int(self.AR, 16)]
-        if int(self.TAR, 16) >= 8: 
-            raise ValueError(f"Invalid PID: {self.TAR}")
-        self.TAR = Hex(self.TAR,1).val
+        self.TAR = self.read(self.AR)
+        if self.TAR >= self.processes:
+            raise ValueError(f"Invalid PID: {self.TAR:X}")
+        self.TAR = self.TAR & self.mask['TAR']
         self.block(['TAR'])
 
-        self.PSR = self.secondary_memory[int(self.TAR, 16)].copy()
+        self.PSR[:] = self.process(self.TAR)
         self.block(['PSR'])
 
-        if self.PSR["S"] == 1:
-            self.PC = Hex(self.PC) - Hex('1')
+        if self.PSR[0] == 1:    # S
+            self.PC = (self.PC - 1) & self.mask['PC']
             self.C = 1
         
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'C', 'SC', 'TM'], True)
 
     def CLE_instruction(self):
         self.E = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['E', 'SC', 'TM'], True)
 
     def CMA_instruction(self):
-        self.AC = Hex(bits=3)._hex(~int(self.AC,16) & ((1 << 12) - 1))
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.AC = ~self.AC & self.mask['AC']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['AC', 'SC', 'TM'], True)
 
     def CME_instruction(self):
         self.E = ~self.E % 2
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['E', 'SC', 'TM'], True)
 
     def CIR_instruction(self):
 
-        Lsb = int(self.AC, 16) & 1 
-        self.AC = Hex(bits=3)._hex(int(self.AC, 16) >> 1 | (self.E << 11))
+        Lsb = self.AC & 1
+        self.AC = (self.AC >> 1 | (self.E << (self.bits['AC']*4 - 1))) & self.mask['AC']
         self.E = Lsb
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['AC', 'E', 'SC', 'TM'], True)
 
     def CIL_instruction(self):
-        Msb = (int(self.AC,16) >> 11) & 1
-        # self.AC = self.hex_op(self.AC, '0', func= lambda x, y: ((self.AC << 1) & ((1 << 12) - 1)) | self.E)
-        self.AC = Hex(bits=3)._hex(((int(self.AC, 16) << 1) & ((1 << 12) - 1)) | self.E)
+        Msb = (self.AC >> (self.bits['AC']*4 - 1)) & 1
+        self.AC = ((self.AC << 1) & self.mask['AC']) | self.E
         self.E = Msb
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['AC', 'E', 'SC', 'TM'], True)
 
 
     def SZA_instruction(self):
-        if Hex(self.AC, 3) == Hex('0'):
-            self.PC = Hex(self.PC) + Hex('1') 
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        if self.AC == 0:
+            self.PC = (self.PC + 1) & self.mask['PC']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'SC', 'TM'], True)
 
     def SZE_instruction(self):
         if self.E == 0:
-            self.PC = Hex(self.PC) + Hex('1')     
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+            self.PC = (self.PC + 1) & self.mask['PC']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'SC', 'TM'], True)
 
     def ICA_instruction(self):
-        self.AC = Hex(self.AC) + Hex('1')
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.AC = (self.AC + 1) & self.mask['AC']
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['AC', 'SC', 'TM'], True)
 
     def ESW_instruction(self):
         self.SW = 1
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['SW', 'SC', 'TM'], True)
 
     def DSW_instruction(self):
         self.SW = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['SW', 'SC', 'TM'], True)
 
     def ADD_instruction(self):
         self.A0 = 0
         self.A1 = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['A0', 'A1', 'SC', 'TM'], True)
     
     def SUB_instruction(self):
         self.A0 = 1
         self.A1 = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['A0', 'A1', 'TM', 'SC'], True) 
 
     def AND_instruction(self):
         self.A0 = 0
         self.A1 = 1
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['A0', 'A1', 'TM', 'SC'], True)
 
     def OR_instruction(self):
         self.A0 = 1
         self.A1 = 1
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['A0', 'A1', 'TM', 'SC'], True)
 
     def HLT_instruction(self):
         if self.S: 
-            self.NS = Hex(self.NS, 1) + Hex('1')
+            self.NS = (self.NS + 1) & self.mask['NS']
         self.S = 0
-        self.PC = Hex(self.PC) - Hex('1')
+        self.PC = (self.PC - 1) & self.mask['PC']
         self.block(['S', 'NS'])
 
-        if Hex(self.NS) == Hex(self.TP):
+        if self.NS == self.TP:
             self.GS = 0
         self.S = 0
         self.C = 1
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['S', 'GS', 'PC', 'C', 'SC', 'TM'], True)
 
     def FORK_instruction(self):
-        self.PSR["PC"] = self.PC
-        self.PSR["AC"] = self.AC
-        self.PSR["E"] = self.E
-        self.PSR["A0"] = self.A0
-        self.PSR["A1"] = self.A1
-        self.PSR["S"] = self.S
-        temp = int(self.main_memory[int(self.PRC, 16)], 16)
-        self.PSR["PC0"] = self.secondary_memory[temp]['PC0']
-        if Hex(self.TP) == Hex('7'): 
-            raise ValueError('Cannot create more than 8 processes')
-        self.AR = Hex(self.TP).val
-        self.TP = Hex(self.TP,1) + Hex('1')
+        temp = self.read(self.PRC)
+        self.PSR[:] = (self.S, self.A1, self.A0, self.E, self.AC, self.pc0(temp), self.PC)
+        if self.TP == self.processes - 1:
+            raise ValueError(f'Cannot create more than {self.processes} processes')
+        self.AR = self.TP
+        self.TP = (self.TP + 1) & self.mask['TP']
         self.block(['PSR', 'AR', 'TP'])
 
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
+        self.TAR = self.read(self.AR)
+        self.pc0(self.TAR)
         self.block(['TAR'])
 
-        self.secondary_memory[int(self.TAR, 16)] = self.PSR.copy()
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
-        self.block(['SC', 'TM'], True)
+        self.store_process(self.TAR, self.PSR)
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
+        self.block(['M2', 'SC', 'TM'], True)
 
     def RST_instruction(self):
         self.AR = self.PRC
         self.block(['AR'])
         
-        self.TAR =  self.main_memory[int(self.AR, 16)]
+        self.TAR = self.read(self.AR)
         self.block(['TAR'])
 
-        self.PSR = self.secondary_memory[int(self.TAR, 16)].copy()
+        self.PSR[:] = self.process(self.TAR)
         self.block(['PSR'])
 
-        self.PSR["PC"] = self.PSR["PC0"]
-        self.PSR["AC"] = '000'
-        self.PSR["S"] = 0
-        self.PSR["A0"] = 0
-        self.PSR["A1"] = 0
-        self.PSR["E"] = 0
-        self.PC = self.PSR['PC0']
-        self.AC = Hex('0', 3).val
+        pc0 = self.PSR[5]
+        self.PSR[:] = (0, 0, 0, 0, 0, pc0, pc0)
+        self.PC = pc0
+        self.AC = 0
         self.A0, self.A1, self.E = 0,0,0
         self.block(['PSR', 'PC', 'AC', 'A0', 'A1', 'S', 'E'])
 
-        self.secondary_memory[int(self.TAR,16)] = self.PSR.copy()
-        self.SC = Hex('0',1).val
+        self.store_process(self.TAR, self.PSR)
+        self.SC = 0
         self.C = 1
-        if not self.S: self.NS = Hex(self.NS,1) - Hex('0')
         self.S = 0
-        self.block(['PSR', 'S', 'SC'], True)
+        self.block(['M2', 'PSR', 'S', 'SC'], True)
 
 
     def UTM_instruction(self):
-        self.AR = '08'
+        self.AR = self.time_address
         self.block(['AR'])
-        self.TM = Hex(self.main_memory[int(self.AR, 16)], 2).val
-        self.SC = Hex('0',1).val
+        self.TM = self.read(self.AR) & self.mask['TM']
+        self.SC = 0
         self.block(['TM', 'SC'], True)
 
     def LDP_instruction(self):
         self.AR = self.PRC
         self.block(['AR'])
 
-        self.TAR = self.main_memory[int(self.AR, 16)]
+        self.TAR = self.read(self.AR)
         self.block(['TAR'])
 
-        self.PSR = self.secondary_memory[int(self.TAR, 16)]
+        self.PSR[:] = self.process(self.TAR)
         self.block(['PSR'])
 
-        self.PC = self.PSR["PC"]
-        self.AC = self.PSR["AC"]
-        self.E = self.PSR["E"]
-        self.A0 = self.PSR["A0"]
-        self.A1 = self.PSR["A1"]
-        self.S = self.PSR["S"]
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.S, self.A1, self.A0, self.E, self.AC, _, self.PC = self.PSR
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'AC', 'A0', 'A1', 'S', 'E', 'SC', 'TM'], True)
 
     def SPA_instruction(self):
         self.AR = self.PRC
         self.block(['AR'])
 
-        if self.main_memory[int(self.AR, 16)] == self.AC:
-            self.PC = Hex(self.PC) + Hex('1') 
+        if self.read(self.AR) == self.AC:
+            self.PC = (self.PC + 1) & self.mask['PC']
 
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['SC', 'TM'], True)
 
     def INP_instruction(self):
-        self.AC = Hex(self.INPR,3).val
+        self.AC = self.INPR & self.mask['AC']
         self.FGI = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        if self.devices is not None: self.devices.read()
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['AC', 'FGI', 'SC', 'TM'], True)
     
     def OUT_instruction(self):
-        self.OUTR = Hex(self.AC,1).val
+        self.OUTR = self.AC & self.mask['OUTR']
         self.FGO = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        if self.devices is not None: self.devices.write(self.OUTR, self.ticks)
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['OUTR', 'FGO', 'SC', 'TM'],True)
 
     def SKI_instruction(self):
         if self.FGI == 1:
-            self.PC = Hex(self.PC) + Hex('1') 
+            self.PC = (self.PC + 1) & self.mask['PC']
         
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'SC', 'TM'], True)
 
     def SKO_instruction(self):
         if self.FGO == 1:
-            self.PC = Hex(self.PC) + Hex('1') 
+            self.PC = (self.PC + 1) & self.mask['PC']
         
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['PC', 'SC', 'TM'], True)
 
     def EI_instruction(self):
         self.IEN = 1
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['IEN', 'SC', 'TM'], True)
 
+    def TSA_instruction(self):
+        # test and set the word AC points to: AC <- M[AC], and M[AC] <- 1 if it was 0
+        self.AR = self.AC & self.mask['AR']
+        self.block(['AR'])
+
+        self.DR = self.read(self.AR) & self.mask['DR']
+        if self.DR == 0: self.store(self.AR, 1)
+        self.block(['DR', 'M'])
+
+        self.AC = self.DR
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
+        self.block(['AC', 'SC', 'TM'], True)
+
     def DI_instruction(self):
         self.IEN = 0
-        self.SC = Hex('0',1).val
-        self.TM = Hex(self.TM) - Hex('1') 
+        self.SC = 0
+        self.TM = (self.TM - 1) & self.mask['TM']
         self.block(['IEN', 'SC', 'TM'], True)
 
 
+    def snapshot(self):
+        # marshal blob of registers, flip-flops, PSR, both memories and the T-state count
+        return marshal.dumps((
+            SNAPSHOT_VERSION,
+            (self.address_bits, self.processes),
+            self.ticks,
+            tuple([getattr(self, name) for name in SNAPSHOT_NAMES]),
+            tuple(self.PSR),
+            self.main_memory.tobytes(),
+            tuple(self.secondary_memory),
+        ))
+
+    def restore(self, blob):
+        try:
+            version, *fields = marshal.loads(blob)
+        except (EOFError, ValueError, TypeError):
+            raise ValueError('Corrupt snapshot')
+        if version != SNAPSHOT_VERSION: raise ValueError(f'Unsupported snapshot version {version}')
+        size, ticks, values, psr, memory, processes = fields
+        if size != (self.address_bits, self.processes): self.configure(*size)
+
+        self.__dict__.update(zip(SNAPSHOT_NAMES, values))
+        self.PSR = list(psr)
+        self.main_memory = array(self.typecode)
+        self.main_memory.frombytes(memory)
+        self.secondary_memory = ProcessTable(len(processes))
+        for pid, row in enumerate(processes): self.secondary_memory[pid] = row
+        self.ticks = ticks
+        if self.blocks is not None: self.blocks.clear()
+        self.changed_vars = []
+        self.memory_ptr = 'PC'
+
+    def load(self, config):
+        # Same YAML semantics as the Load button: SIZE, REG, FF, M and M2 sections
+        if not isinstance(config, dict): raise ValueError('A program is a mapping of SIZE, REG, FF, M and M2 sections')
+        for section in ('SIZE', 'REG', 'FF', 'M', 'M2'): 
+            if section in config and not isinstance(config[section], dict): raise ValueError(f'Section {section} must be a mapping')
+        size = config.get('SIZE') or {}
+        address_bits, processes = int(size.get('ADDRESS_BITS', self.size[0])), int(size.get('PROCESSES', self.size[1]))
+        if (address_bits, processes) != (self.address_bits, self.processes): self.configure(address_bits, processes)
+        else: self.reset()
+        try: 
+            if 'REG' in config: 
+                for r, v in config['REG'].items(): 
+                    # only registers: a flip-flop or method name here would pass getattr and have no mask
+                    if r not in REGISTERS: raise ValueError(f"No such register as {r}")
+
+                    if r == 'PSR': 
+                        v = v.split('-')
+                        if len(v) != 7: raise ValueError("Invalid PSR register format")
+                        val = [int(v[0])%2, int(v[1])%2, int(v[2])%2, int(v[3])%2, 
+                            int(str(v[4]), 16) & self.mask['AC'], int(str(v[5]), 16) & self.mask['PC'], int(str(v[6]), 16) & self.mask['PC']]
+                        setattr(self, r, val)
+                    else: 
+                        setattr(self, r, int(str(v), 16) & self.mask[r])
+                    self.changed_vars.append(r)
+
+            if 'FF' in config: 
+                for f, v in config['FF'].items(): 
+                    if getattr(self, f, None) is None: raise ValueError(f"No such flip flop as {f}")
+                    setattr(self, f, int(v) % 2)
+                    self.changed_vars.append(f)
+
+                
+            # M entries are instructions, labelled instructions or hex data words
+            entries = []
+            if 'M' in config: 
+                for l, v in config['M'].items(): 
+                    l = int(str(l), 16)
+                    if l >= len(self.main_memory) or l < 0: raise ValueError(f"Address out of bounds")
+                    for i, _v in enumerate(v if isinstance(v, list) else [v]): 
+                        entries.append((l + i, _v))
+            words, self.symbols = assemble_entries(entries, self.address_bits)
+            for address, word in words.items(): 
+                self.store(address, word)
+                        
+            if 'M2' in config: 
+                for l, p in config['M2'].items(): 
+                    l = int(l)
+                    if l >= self.processes or l < 0: raise ValueError(f"Invalid M2 location {l}")
+
+                    cols = ['S', 'A1', 'A0', 'E', 'AC', 'PC0', 'PC']
+                    if any(c not in p for c in cols): raise ValueError(f"Invalid M2 configuration at location {l}")
+                    row = {c: int(p[c]) for c in ['S', 'A1', 'A0', 'E']}
+                    row['AC'] = int(str(p['AC']), 16) & self.mask['AC']
+                    row['PC0'] = int(str(p['PC0']), 16) & self.mask['PC']
+                    row['PC'] = int(str(p['PC']), 16) & self.mask['PC']
+                    self.store_process(l, [row[c] for c in PSR_FIELDS])
+
+
+            if self.time_address not in words: raise ValueError(f'Time value not specified at location {self.time_address:X}')
+            self.TM = self.read(self.time_address) & self.mask['TM']
+            self.TP = len(config['M2']) & self.mask['TP'] if 'M2' in config else 1
+            if not ('REG' in config and 'PC' in config['REG']): 
+                if self.secondary_memory.PC[0] is not None: 
+                    self.PC = self.secondary_memory.PC[0]
+                    self.changed_vars.append('PC')
+
+            self.changed_vars.append('TM')
+            self.changed_vars.append('TP')
+
+        except ValueError: 
+            self.reset()
+            raise
+        except (TypeError, AttributeError) as e: 
+            # an entry of the wrong shape, such as an M2 row that is not a mapping
+            self.reset()
+            raise ValueError(f'Invalid program: {e}') from None
+
+        self.memory_ptr = 'PC'
+
+    def instruction_cycle(self):
+        if self.devices is not None: self.devices.poll()
+        if self.journal is not None: self.journal.begin()
+        if (self.C and self.SW) or not self.S:
+            self.contextSwitch()
+        
+        elif self.R or (self.IEN and (self.FGI or self.FGO)): 
+            if not self.R: 
+                self.R = 1
+                self.block(['R']) 
+            self.ioInterrupt()
+
+
+        else:
+            self.fetch()
+            handler, address, I_address = self.decode()
+            if I_address == True:
+                self.AR = self.read(self.AR) & self.mask['AR']
+                self.block(['AR'])
+            
+            handler()
+
     def run_next(self):
         if not self.GS: return
 
-        print('Thread Created')
         self.stepping = True
         try: 
-            if (self.C and self.SW) or not self.S:
-                self.contextSwitch()
-            
-            elif self.R or (self.IEN and (self.FGI or self.FGO)): 
-                if not self.R: 
-                    self.R = 1
-                    self.block(['R']) 
-                self.ioInterrupt()
-
-
-            else:
-                self.fetch()
-                opcode, address, I_address = self.decode()
-                if I_address == True:
-                    self.AR = self.main_memory[int(self.AR, 16)]
-                    self.block(['AR'])
-                
-                if opcode in self.instruction_map:
-                    self.instruction_map[opcode]()  
-                else:
-                    raise ValueError(f'unknown instructions {opcode}')
-
+            try: self.instruction_cycle()
+            except Break as hit:
+                # a single step goes on past the breakpoint it starts at
+                if self.running or hit.done: raise
+                self.instruction_cycle()
         except ValueError as v: 
-            messagebox.showerror(message=v)
-        # print(self.secondary_memory)
-
-
-        print('Thread exited')
-        self.stepping = False
+            if self.on_error is None: raise
+            self.on_error(str(v))
+        except Break as hit:
+            self.running = False
+            if self.on_stop is not None: self.on_stop(str(hit))
+        finally: 
+            self.stepping = False
     
     def run_code(self): 
         while self.running: 
             self.run_next()
             if not self.GS: 
-                messagebox.showinfo(message="Execution stopped/not started. Global Start is 0")
+                if self.on_stop is not None: self.on_stop("Execution stopped/not started. Global Start is 0")
                 self.running = False
         
\ No newline at end of file
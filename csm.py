@@ -1,15 +1,30 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from cpu import CPU, Hex
-import yaml
-import threading
-import time
+from tkinter import ttk, filedialog, messagebox, simpledialog
+from cpu import CPU, DeltaQueue
+from tracer import Trace
+from journal import Journal
+from profiler import Profiler
+from metrics import Metrics
+from breakpoints import Breakpoints
+from memview import MemoryView
+from worker import ExecutionWorker
+from until import Until
+import image
+from assembler import assemble_word, disassemble
 import sys
 
 class UI:
     def __init__(self, cpu: CPU):
         self.cpu = cpu
 
+        self.cpu.deltas = DeltaQueue()
+        self.worker = ExecutionWorker(self.cpu, self.on_report)
+        self.cpu.journal = Journal(self.cpu)
+        self.profiler = Profiler(self.cpu)  # costs nothing until enabled
+        self.metrics = Metrics(self.cpu)    # likewise
+        self.breakpoints = Breakpoints(self.cpu)    # likewise, while none are set
+        self.frame_ms = 33  # UI refresh period, ~30 fps
+
         # Main Window
         self.root = tk.Tk()
         self.root.title("Basic Computer Simulation")
@@ -23,6 +38,8 @@ class UI:
         self.flip_flops_names = ["I", "E", "R", "C", "SW", "IEN", "FGI", "FGO", "S", "GS", "A0", "A1"]
         self.can_edit = {'AR', 'PC', 'PRC', 'INPR', 'NS', 'TAR', 'IEN', 'SW', 'FGI', 'FGO', 'S', 'GS'}
         self.prev_state = {}
+        self.saved_state = None # CPU.snapshot() taken by Load or Save State
+        self.until_values = {}  # fields of the last Run Until
 
         # self.prev_changed_values = self.registers_names + self.flip_flops_names
         self.prev_changed_values = [] 
@@ -54,65 +71,101 @@ class UI:
         self.root.mainloop()
 
 
-    def step_code(self, buttons = True):
-        def update_buttons(): 
-            self.load_button.config(state='disabled')
-            self.run_button.config(state='disabled')
-            self.step_button.config(state='disabled')
-            while self.cpu.stepping and not self.load_button: pass
-            if self.cpu.GS == 0: 
-                if not self.loading: messagebox.showinfo(message="Execution stopped/not started. Global Start is 0")
-                self.cpu.running = False
-                self.cpu.stepping = False
-
-            self.load_button.config(state='normal')
-            self.run_button.config(state='normal')
-            self.step_button.config(state='normal')
-
-
-
-        if self.cpu.stepping == False: 
-            try: 
-                self.step_running = threading.Thread(target = self.cpu.run_next,daemon=True).start()
-            except ValueError as v: 
-                messagebox.showerror(message=v)
-            if buttons: threading.Thread(target=update_buttons, daemon=True).start()
-
-        # else: 
-        #     with self.cpu.lock: 
-        #         self.cpu.execute = True
+    def step_code(self): 
+        # one instruction cycle on the execution worker, the buttons held until it is done
+        if self.worker.busy: return
+        self.load_button.config(state='disabled')
+        self.run_button.config(state='disabled')
+        self.step_button.config(state='disabled')
+        self.worker.submit(self.cpu.run_next, done=self.stepped)
 
+    def stepped(self, result): 
+        if isinstance(result, Exception): messagebox.showerror(message=result)
+        if self.cpu.GS == 0 and not self.loading: messagebox.showinfo(message="Execution stopped/not started. Global Start is 0")
+        self.load_button.config(state='normal')
+        self.run_button.config(state='normal')
+        self.step_button.config(state='normal')
 
     def run_code(self):
-        def run(): 
-            while self.cpu.running:
-                if self.cpu.stepping == False: 
-                    self.step_code(False)
-
-    
-                if self.cpu.GS == 0: 
-                    if not self.loading: messagebox.showinfo(message="Execution stopped/not started. Global Start is 0")
-                    self.load_button.config(state='normal')
-                    self.step_button.config(state='normal')
-                    self.run_button.config(text='Run')
-                    self.cpu.running = False
-                    break
-                time.sleep(0.1)
-        
-    
         if self.cpu.running == False: 
+            if self.worker.busy: return
             self.cpu.running = True
             self.load_button.config(state='disabled')
             self.step_button.config(state='disabled')
+            self.until_button.config(state='disabled')
             self.run_button.config(text='Stop')
-            threading.Thread(target=self.cpu.run_code, daemon=True).start()
+            self.worker.submit(self.cpu.run_code, done=self.stopped)
         else: 
-            self.load_button.config(state='normal')
-            self.step_button.config(state='normal')
-            self.run_button.config(text='Run')
+            # run_code sees this at the end of the cycle, then stopped() gives the buttons back
             self.cpu.running = False
-            if not self.cpu.GS: messagebox.showinfo(message="Execution stopped/not started. Global Start is 0")
 
+    def stopped(self, result): 
+        if isinstance(result, Exception): messagebox.showerror(message=result)
+        self.cpu.running = False
+        self.load_button.config(state='normal')
+        self.step_button.config(state='normal')
+        self.until_button.config(state='normal')
+        self.run_button.config(text='Run')
+
+    def run_until(self, until): 
+        # the fast path on the execution worker: no deltas and no sleeps, one refresh at the end
+        if self.worker.busy: return
+        self.cpu.running = True
+        self.load_button.config(state='disabled')
+        self.step_button.config(state='disabled')
+        self.until_button.config(state='disabled')
+        self.run_button.config(text='Stop')
+        self.worker.submit(until.run, self.cpu, lambda: not self.cpu.running, done=lambda result: self.ran_until(until, result))
+
+    def ran_until(self, until, result): 
+        self.stopped(result if isinstance(result, Exception) else None)
+        self.update_ui()
+        self.update_selected_ui()
+        if not isinstance(result, Exception) and result != 'stopped': 
+            messagebox.showinfo(message=f"Stopped at {result} after {until.ran} cycles")
+
+    def open_run_until(self): 
+        if self.worker.busy: return
+        window = tk.Toplevel(self.root)
+        window.title("Run Until")
+        frame = tk.Frame(window, padx=10, pady=10)
+        frame.pack(side=tk.TOP)
+
+        # (label, Until argument, base) of each field; empty fields are not conditions
+        fields = [("PC reaches (hex)", 'pc', 16), ("TAR reaches (hex)", 'tar', 16), ("Instruction cycles", 'cycles', 10), 
+                  ("T-states", 'tstates', 10), ("Context switches", 'switches', 10)]
+        values = {}
+        for i, (text, key, _) in enumerate(fields): 
+            tk.Label(frame, text=text).grid(row=i, column=0, padx=5, pady=2, sticky="w")
+            values[key] = tk.StringVar(value=self.until_values.get(key, ''))
+            tk.Entry(frame, textvariable=values[key], width=10, justify='center').grid(row=i, column=1, padx=5, pady=2)
+        halt = tk.BooleanVar(value=self.until_values.get('halt', False))
+        tk.Checkbutton(frame, text="A process halts (S = 0)", variable=halt).grid(row=len(fields), column=0, columnspan=2, sticky="w")
+
+        def go(): 
+            conditions = {}
+            for text, key, base in fields: 
+                value = values[key].get().strip()
+                if not value: continue
+                try: conditions[key] = int(value, base)
+                except ValueError: 
+                    messagebox.showerror(message=f"Invalid {text}: {value}", parent=window)
+                    return
+            if halt.get(): conditions['halt'] = True
+            if not conditions: 
+                messagebox.showerror(message="No condition to run until", parent=window)
+                return
+            self.until_values = {key: var.get() for key, var in values.items()}
+            self.until_values['halt'] = halt.get()
+            window.destroy()
+            self.run_until(Until(**conditions))
+
+        tk.Button(window, text="Run", command=go).pack(side=tk.TOP, pady=(0, 10))
+
+    def on_report(self, kind, message): 
+        # errors and stops the CPU reported from the execution worker
+        if kind == 'error': messagebox.showerror(message=message)
+        else: messagebox.showinfo(message=message)
 
 
     def load_program(self): 
@@ -126,85 +179,60 @@ class UI:
 
         print(f"{file_path} is loaded")
 
-        self.cpu.stepping = False
-        self.cpu.running = False
         self.loading = True
-        time.sleep(0.1)
-        self.cpu.__init__(self.cpu.clk)
-
-        self.cpu.changed_vars = []
-        try: 
-            file = open(file_path, 'r') 
-            config = yaml.safe_load(file)
-            if 'REG' in config: 
-                for r, v in config['REG'].items(): 
-                    if getattr(self.cpu, r, None) is None: raise ValueError(f"No such register as {r}")
-
-                    if r == 'PSR': 
-                        v = v.split('-')
-                        if len(v) != 7: raise ValueError("Invalid PSR register format")
-                        val = {'S': int(v[0])%2, 'A1': int(v[1])%2, 'A0': int(v[2])%2, 'E': int(v[3])%2, 
-                            'AC': Hex(str(v[4],3)).val, 'PC0': Hex(str(v[5])).val, 'PC': Hex(str(v[6])).val}
-                        setattr(self.cpu, r, val)
-                        self.prev_state[r] = val
-                    else: 
-                        setattr(self.cpu, r, Hex(str(v),self.cpu.bits[r]).val)
-                        self.prev_state[r] = Hex(str(v),self.cpu.bits[r]).val
-                    self.cpu.changed_vars.append(r)
+        self.worker.submit(self.load, file_path, done=self.loaded)
 
-            if 'FF' in config: 
-                for f, v in config['FF'].items(): 
-                    if getattr(self.cpu, f, None) is None: raise ValueError(f"No such flip flop as {f}")
-                    setattr(self.cpu, f, int(v) % 2)
-                    self.cpu.changed_vars.append(f)
-
-                
-            if 'M' in config: 
-                for l, v in config['M'].items(): 
-                    l = int(str(l), 16)
-                    if l > 255 or l < 0: raise ValueError(f"Address out of bounds")
-                    if isinstance(v, list): 
-                        for i, _v in enumerate(v): 
-                            _v = str(_v)
-                            if len(_v): 
-                                if len(_v.split()) <= 3: self.cpu.main_memory[i+l] = _v.strip()
-                                else: raise ValueError(f"Invalid instruction/operand at location {Hex(str(l)).val}: {_v.strip()}")
-                    else: 
-                        v = str(v)
-                        if len(v): 
-                            if len(v.split()) <= 3: self.cpu.main_memory[l] = v.strip()
-                            else: raise ValueError(f"Invalid instruction/operand at location {Hex(str(l)).val}: {v.strip()}")
-                        
-            if 'M2' in config: 
-                for l, p in config['M2'].items(): 
-                    l == int(l)
-                    if l >= 8 or l < 0: raise ValueError(f"Invalid M2 location {l}")
-
-                    cols = ['S', 'A1', 'A0', 'E', 'AC', 'PC0', 'PC']
-                    if any(c not in p for c in cols): raise ValueError(f"Invalid M2 configuration at location {l}")
-                    p['PC'] = Hex(str(p['PC'])).val
-                    p['PC0'] = Hex(str(p['PC0'])).val
-                    p['AC'] = Hex(str(p['AC']),3).val
-                    self.cpu.secondary_memory[l] = p 
-
-
-            if self.cpu.main_memory[8] == '': raise ValueError('Time value not specified at location 8')
-            self.cpu.TM = Hex(self.cpu.main_memory[8]).val
-            self.cpu.TP = Hex(str(len(config['M2'])),1).val if 'M2' in config else '1'
-            if not ('REG' in config and 'PC' in config['REG']): 
-                if self.cpu.secondary_memory[0]['PC'] != '': 
-                    self.cpu.PC = Hex(str(self.cpu.secondary_memory[0]['PC']), 2).val
-                    self.cpu.changed_vars.append('PC')
-
-            self.cpu.changed_vars.append('TM')
-            self.cpu.changed_vars.append('TP')
-        
-        except ValueError as v: 
-            messagebox.showerror(message=v)
-            self.cpu.__init__(self.cpu.clk)
+    def load(self, file_path): 
+        # on the execution worker, through the compiled image cached next to the yaml
+        self.cpu.reset()
+        return image.load(self.cpu, file_path)
 
+    def loaded(self, result): 
+        # loading is over whatever happened, or update_ui would stay frozen
         self.loading = False 
+        if isinstance(result, Exception): messagebox.showerror(message=result)
+        else: 
+            for r in result: 
+                self.prev_state[r] = self.cpu.format(r)
+
         self.cpu.memory_ptr = 'PC'
+        self.saved_state = self.cpu.snapshot()
+        self.cpu.journal.clear()
+        self.metrics.reset()
+        if self.cpu.trace is not None: self.cpu.trace = Trace(self.cpu)
+        self.update_ui()
+        self.update_selected_ui()
+
+    def save_state(self): 
+        if self.worker.busy: 
+            messagebox.showerror(message='Stop execution before saving the state')
+            return
+        self.saved_state = self.cpu.snapshot()
+
+    def restore_state(self): 
+        # back to the last Save State (or Load) without re-reading the yaml
+        if self.saved_state is None: 
+            messagebox.showerror(message='No saved state')
+            return
+        if self.worker.busy: 
+            messagebox.showerror(message='Stop execution before restoring a state')
+            return
+
+        self.cpu.restore(self.saved_state)
+        self.cpu.journal.clear()
+        self.metrics.reset()
+        if self.cpu.trace is not None: self.cpu.trace = Trace(self.cpu)
+        self.update_ui()
+        self.update_selected_ui()
+
+    def step_back(self): 
+        if self.worker.busy: return
+        if not self.cpu.journal.step_back(1): 
+            messagebox.showinfo(message='Nothing to step back to')
+            return
+        self.metrics.reset()
+        self.breakpoints.resume = None
+        if self.cpu.trace is not None: self.cpu.trace = Trace(self.cpu)
         self.update_ui()
         self.update_selected_ui()
     
@@ -228,7 +256,7 @@ class UI:
                 def on_change(event, ff_name, var_instance, show_error = False):
                     if self.cpu.stepping: 
                         if show_error: messagebox.showerror("error", "can't change value during instruction execution")
-                        var_instance.set(getattr(self.cpu, ff_name))
+                        var_instance.set(self.cpu.format(ff_name))
                         return "break"
                     
                     setattr(self.cpu, ff_name, int(var_instance.get()) % 2)
@@ -259,12 +287,7 @@ class UI:
         self.registers = {}
         for i, reg in enumerate(self.registers_names):
             width = 12 if reg != 'PSR' else 17 
-            if reg == 'PSR':
-                psr_value = getattr(self.cpu, reg, {})
-                formatted_psr = '-'.join(str(value) for key, value in psr_value.items())
-                var = tk.StringVar(value=str(formatted_psr))
-            else:
-                var = tk.StringVar(value=str(getattr(self.cpu, reg)))
+            var = tk.StringVar(value=self.cpu.format(reg))
 
             lbl = tk.Label(registers_frame, text=f"{reg}:")
             lbl.grid(row=i, column=0, pady=1)
@@ -272,23 +295,20 @@ class UI:
             entry.grid(row=i, column=1, pady=1)
 
             self.registers[reg] = [var, entry]
-            self.prev_state[reg] = str(getattr(self.cpu, reg))
-
-            if reg == 'PSR': 
-                self.prev_state[reg] = '-'.join(str(value) for key, value in psr_value.items())
+            self.prev_state[reg] = self.cpu.format(reg)
 
             if reg in self.can_edit: 
                 def on_change(event, reg_name, var_instance, show_error = False):
                     if self.cpu.stepping: 
                         if show_error: messagebox.showerror("error", "can't change value during instruction execution")
-                        var_instance.set(getattr(self.cpu, reg_name))
+                        var_instance.set(self.cpu.format(reg_name))
                         return "break"
 
                     val = var_instance.get()
                     if val == '' or val is None:
                         if show_error: messagebox.showerror("error", "can't assign an empty value")
                     else: 
-                        setattr(self.cpu, reg_name, Hex(var_instance.get(), self.cpu.bits[reg_name]).val)
+                        setattr(self.cpu, reg_name, int(var_instance.get(), 16) & self.cpu.mask[reg_name])
                     
                     self.cpu.changed_vars = [reg_name]
                     self.update_selected_ui()
@@ -313,23 +333,12 @@ class UI:
         main_memory_frame = tk.LabelFrame(frame, text="Main Memory", padx=10, pady=10)
         main_memory_frame.pack(side=tk.LEFT, fill=tk.Y)
 
-        self.main_memory_table = ttk.Treeview(main_memory_frame, columns=("Address", "Value"), show="headings", height=7)
-        self.main_memory_table.heading("Address", text="Address")
-        self.main_memory_table.column("Address", width=50, anchor=tk.CENTER)
-
-        self.main_memory_table.heading("Value", text="Instructions")
-        self.main_memory_table.column("Value", width=200, anchor=tk.CENTER)
-        self.main_memory_table.pack(fill=tk.BOTH, expand=True)
-
-        # Populate memory table
-        for address, value in enumerate(self.cpu.main_memory):
-            self.main_memory_table.insert("", "end", values=(f"{address:02x}".upper(), value))
-
-        row_id = self.main_memory_table.get_children()[int(getattr(self.cpu, 'PC'),16)] 
-        self.main_memory_table.selection_set(row_id)  
-        self.main_memory_table.focus(row_id)
-        self.main_memory_table.see(row_id)
-        self.main_memory_table.bind("<Double-1>", self.on_memory_edit)
+        # only the rows in sight are drawn, so any memory size opens and refreshes at once
+        self.memory_view = MemoryView(main_memory_frame, self.cpu, self.memory_row_values, self.memory_row_background)
+        self.memory_view.frame.pack(fill=tk.BOTH, expand=True)
+        self.memory_view.canvas.bind("<Double-1>", self.on_memory_edit)
+        self.memory_view.canvas.bind("<Button-3>", self.on_memory_menu)
+        self.selected_memory_row = None
 
     def create_secondary_memory_table(self, frame):
         # Create a frame for secondary memory
@@ -343,19 +352,26 @@ class UI:
             self.secondary_memory_table.column(id, width=50, anchor=tk.CENTER)
         self.secondary_memory_table.pack(fill=tk.BOTH, expand=True)
 
-        # Populate secondary memory table
-        for row in self.cpu.secondary_memory:
-            self.secondary_memory_table.insert("", "end", values=list(row.values()))
+        self.process_rows = []
+        self.populate_secondary_memory_table()
+        self.secondary_memory_table.bind("<Double-1>", self.on_secondary_memory_edit)
+
+    def populate_secondary_memory_table(self): 
+        self.secondary_memory_table.delete(*self.process_rows)
+        self.process_rows = [
+            self.secondary_memory_table.insert("", "end", values=self.cpu.format_psr(row).split('-'))
+            for row in self.cpu.secondary_memory
+        ]
         
         # pid = self.cpu.main_memory[int(getattr(self.cpu, 'PRC'))]
         # if pid != '': 
         #     pid = int(pid)
-        pid = int(getattr(self.cpu, 'TAR'))
-        row_id = self.secondary_memory_table.get_children()[pid] 
-        self.secondary_memory_table.selection_set(row_id)  
-        self.secondary_memory_table.focus(row_id)
-        self.secondary_memory_table.see(row_id)
-        self.secondary_memory_table.bind("<Double-1>", self.on_secondary_memory_edit)
+        self.selected_process_row = None
+        self.select_process_row(self.cpu.TAR)
+
+    def resize_tables(self): 
+        # after a load or restore that changed the process count (the memory view follows by itself)
+        if len(self.process_rows) != len(self.cpu.secondary_memory): self.populate_secondary_memory_table()
 
     def create_buttons(self,frame): 
         # Create a frame for the buttons
@@ -376,8 +392,9 @@ class UI:
 
         selected_option = tk.StringVar()
         selected_option.set(str(self.cpu.clk)+"hz")
-        options = ["0.2hz", "0.5hz", "1hz", "20hz"]
-        dropdown = tk.OptionMenu(button_frame, selected_option, *options)
+        # clocks above CPU.TURBO_HZ run at full speed and are drawn as coalesced frames
+        clocks = {"0.2hz": 0.2, "0.5hz": 0.5, "1hz": 1, "20hz": 20, "1khz": 1e3, "1mhz": 1e6, "max": 0}
+        dropdown = tk.OptionMenu(button_frame, selected_option, *clocks)
         dropdown.config(bg='white')
         
         # Position the buttons in the grid
@@ -386,24 +403,226 @@ class UI:
         self.run_button.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
         dropdown.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
 
-        def clk_change(*args): self.cpu.clk = float(selected_option.get()[:-2])
+        def clk_change(*args): self.cpu.clk = clocks[selected_option.get()]
         selected_option.trace_add('write', clk_change)
     
+        # Lockstep: the CPU waits for every T-state to be drawn before continuing
+        lockstep = tk.BooleanVar(value=self.cpu.deltas.lockstep)
+        lockstep_check = tk.Checkbutton(button_frame, text="Lockstep", variable=lockstep)
+        lockstep_check.grid(row=1, column=3, padx=5, pady=5, sticky="w")
+
+        def lockstep_change(*args): self.cpu.deltas.lockstep = lockstep.get()
+        lockstep.trace_add('write', lockstep_change)
+
+        # Trace: record every T-state so a run can be replayed afterwards
+        tracing = tk.BooleanVar(value=self.cpu.trace is not None)
+        trace_check = tk.Checkbutton(button_frame, text="Trace", variable=tracing)
+        trace_check.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.replay_button = tk.Button(button_frame, text="Replay", command=self.open_replay)
+        self.replay_button.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+
+        def tracing_change(*args): self.cpu.trace = Trace(self.cpu) if tracing.get() else None
+        tracing.trace_add('write', tracing_change)
+
+        self.save_button = tk.Button(button_frame, text="Save State", command=self.save_state)
+        self.save_button.grid(row=2, column=0, padx=5, pady=5, sticky="ew")
+        self.restore_button = tk.Button(button_frame, text="Restore State", command=self.restore_state)
+        self.restore_button.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
+        self.back_button = tk.Button(button_frame, text="Step Back", command=self.step_back)
+        self.back_button.grid(row=2, column=2, padx=5, pady=5, sticky="ew")
+        self.until_button = tk.Button(button_frame, text="Run Until", command=self.open_run_until)
+        self.until_button.grid(row=2, column=3, padx=5, pady=5, sticky="ew")
+
+        # Profile: time every handler and CPU method on the host while checked
+        profiling = tk.BooleanVar(value=self.profiler.enabled)
+        profile_check = tk.Checkbutton(button_frame, text="Profile", variable=profiling)
+        profile_check.grid(row=3, column=0, padx=5, pady=5, sticky="w")
+        self.profile_button = tk.Button(button_frame, text="Profiler", command=self.open_profiler)
+        self.profile_button.grid(row=3, column=1, padx=5, pady=5, sticky="ew")
+
+        def profiling_change(*args): 
+            if profiling.get(): self.profiler.enable()
+            else: self.profiler.disable()
+        profiling.trace_add('write', profiling_change)
+
+        # Metrics: per-process scheduling counters while checked
+        measuring = tk.BooleanVar(value=self.metrics.enabled)
+        metrics_check = tk.Checkbutton(button_frame, text="Metrics", variable=measuring)
+        metrics_check.grid(row=3, column=2, padx=5, pady=5, sticky="w")
+        self.metrics_button = tk.Button(button_frame, text="Scheduling", command=self.open_metrics)
+        self.metrics_button.grid(row=3, column=3, padx=5, pady=5, sticky="ew")
+
+        def measuring_change(*args): 
+            if measuring.get(): self.metrics.enable()
+            else: self.metrics.disable()
+        measuring.trace_add('write', measuring_change)
+
+    def open_replay(self): 
+        trace = self.cpu.trace
+        if trace is None or len(trace) == 0: 
+            messagebox.showinfo(message="Nothing recorded. Enable Trace and run the program first")
+            return
+        if self.worker.busy: 
+            messagebox.showerror(message="Stop execution before replaying the trace")
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Trace Replay")
+
+        position = tk.IntVar(value=len(trace) - 1)
+        self.trace_rows = set(range(len(self.process_rows)))    # process rows show_trace is to redraw
+        label = tk.Label(window, width=40)
+        label.pack(side=tk.TOP, padx=10, pady=5)
+        scale = tk.Scale(window, from_=0, to=len(trace) - 1, orient=tk.HORIZONTAL, length=400, showvalue=False, 
+                         variable=position, command=lambda k: show(int(k)))
+        scale.pack(side=tk.TOP, padx=10)
+
+        controls = tk.Frame(window, padx=10, pady=10)
+        controls.pack(side=tk.TOP)
+        speed = tk.StringVar(value='20')
+        direction = [0]
+
+        def show(k): 
+            label.config(text=f"record {k + 1}/{len(trace)}   T-state {trace[k][0]}")
+            self.show_trace(k)
+
+        def play(step): 
+            if direction[0] == 0: 
+                direction[0] = step
+                tick()
+            direction[0] = step
+
+        def tick(): 
+            if direction[0] == 0 or not window.winfo_exists(): return
+            try: rate = max(float(speed.get()), 0.1)
+            except ValueError: rate = 20
+            # above ~30 records/s several records are skipped per frame
+            delay = max(self.frame_ms, int(1000 / rate))
+            k = position.get() + direction[0] * max(1, round(rate * delay / 1000))
+            k = min(max(k, 0), len(trace) - 1)
+            position.set(k)
+            show(k)
+            if k in (0, len(trace) - 1): direction[0] = 0
+            else: window.after(delay, tick)
+
+        def close(): 
+            direction[0] = 0
+            window.destroy()
+            self.memory_view.words = None
+            self.update_ui()
+
+        tk.Button(controls, text="<< Back", command=lambda: play(-1)).grid(row=0, column=0, padx=5)
+        tk.Button(controls, text="Pause", command=lambda: direction.__setitem__(0, 0)).grid(row=0, column=1, padx=5)
+        tk.Button(controls, text="Forward >>", command=lambda: play(1)).grid(row=0, column=2, padx=5)
+        tk.Label(controls, text="records/s").grid(row=0, column=3, padx=5)
+        tk.Entry(controls, textvariable=speed, width=8, justify='center').grid(row=0, column=4, padx=5)
+        tk.Button(controls, text="Live", command=close).grid(row=0, column=5, padx=5)
+        window.protocol("WM_DELETE_WINDOW", close)
+        show(position.get())
+
+    def open_profiler(self): 
+        window = tk.Toplevel(self.root)
+        window.title("Profiler")
+        text = tk.Text(window, width=70, height=30, font=('Courier', 10))
+        text.pack(side=tk.TOP, padx=10, pady=5)
+
+        controls = tk.Frame(window, padx=10, pady=10)
+        controls.pack(side=tk.TOP)
+        key = tk.StringVar(value='own')
+
+        def refresh(): 
+            if not window.winfo_exists(): return
+            text.delete('1.0', tk.END)
+            text.insert(tk.END, self.profiler.table(key.get()) if self.profiler.stats else "Nothing recorded. Check Profile and run the program")
+            window.after(500, refresh)
+
+        def save(): 
+            path = filedialog.asksaveasfilename(parent=window, defaultextension=".json", filetypes=(("JSON Files", "*.json"),))
+            if not path: return
+            with open(path, 'w') as file: file.write(self.profiler.json(key.get()))
+
+        tk.Label(controls, text="Sort by").grid(row=0, column=0, padx=5)
+        tk.OptionMenu(controls, key, 'own', 'total', 'calls').grid(row=0, column=1, padx=5)
+        tk.Button(controls, text="Reset", command=self.profiler.reset).grid(row=0, column=2, padx=5)
+        tk.Button(controls, text="Save JSON", command=save).grid(row=0, column=3, padx=5)
+        refresh()
+
+    def open_metrics(self): 
+        window = tk.Toplevel(self.root)
+        window.title("Scheduling Metrics")
+        text = tk.Text(window, width=92, height=16, font=('Courier', 10))
+        text.pack(side=tk.TOP, padx=10, pady=5)
+
+        def refresh(): 
+            if not window.winfo_exists(): return
+            text.delete('1.0', tk.END)
+            text.insert(tk.END, self.metrics.table() if self.metrics.processes else "Nothing recorded. Check Metrics and run the program")
+            window.after(500, refresh)
+
+        controls = tk.Frame(window, padx=10, pady=10)
+        controls.pack(side=tk.TOP)
+        tk.Button(controls, text="Reset", command=self.metrics.reset).grid(row=0, column=0, padx=5)
+        refresh()
+
+    def show_trace(self, k): 
+        # draw the machine as it was after trace record k, without touching the CPU
+        trace = self.cpu.trace
+        registers, memory, processes = trace.state_at(k)
+        for name, value in registers.items(): 
+            if name in self.registers: self.registers[name][0].set(self.cpu.format_value(name, value))
+            elif name in self.flip_flops: self.flip_flops[name][0].set(self.cpu.format_value(name, value))
+
+        self.memory_view.words = lambda address: memory.get(address, trace.base_memory[address])
+        self.memory_view.redraw()
+
+        # rows drawn from the trace (at first all of them) go back to their base row unless written by k
+        for pid in self.trace_rows | processes.keys(): 
+            row = processes.get(pid, trace.base_processes[pid])
+            self.secondary_memory_table.item(self.process_rows[pid], values=self.cpu.format_psr(row).split('-'))
+        self.trace_rows = set(processes)
+
+        _, changed, values, ptr = trace[k]
+        self.update_selected_ui(changed, values, ptr)
+    
 
     def ui_loop(self): 
-        if cpu.update_ui: 
-            # start = time.perf_counter()
-            # self.update_ui(selected=False)
-            self.update_selected_ui()
-            # print(time.perf_counter() - start)
-            cpu.update_ui = False
+        # finished commands and reports of the execution worker, then the CPU's change records
+        self.worker.poll()
+        records = self.cpu.deltas.drain()
+        if self.cpu.deltas.dropped: 
+            self.cpu.deltas.dropped = False
+            self.update_ui()
+        elif records: 
+            self.apply_deltas(records)
+
+        # turbo clocks: show the latest state, highlighting what changed since the last frame
+        pending = self.cpu.deltas.take_pending()
+        if pending: 
+            self.update_selected_ui(sorted(pending), None, getattr(self.cpu, self.cpu.memory_ptr))
+
+        # only the memory words and process rows written since the last frame are redrawn
+        memory, processes = self.cpu.deltas.take_dirty()
+        for address in memory: self.update_memory_row(address)
+        for pid in processes: self.update_process_row(pid)
         
-        # if self.cpu.stepping == False and self.cpu.running == False: 
+        self.root.after(self.frame_ms, self.ui_loop)
+
+    def apply_deltas(self, records): 
+        for changed, values, _ in records[:-1]: 
+            for r, value in zip(changed, values): 
+                if r in self.registers: 
+                    self.registers[r][0].set(self.cpu.format_value(r, value))
+                elif r in self.flip_flops: 
+                    self.flip_flops[r][0].set(self.cpu.format_value(r, value))
 
-        self.root.after(5, self.ui_loop)
+        self.update_selected_ui(*records[-1])
     
 
-    def update_selected_ui(self): 
+    def update_selected_ui(self, changed = None, values = None, ptr = None): 
+        # highlight the changed registers; values/ptr come from a delta record, or the live CPU
+        if changed is None: 
+            changed, ptr = self.cpu.changed_vars, getattr(self.cpu, self.cpu.memory_ptr)
+
         for r in self.prev_changed_values: 
             entry = None
             if r in self.registers: 
@@ -415,7 +634,7 @@ class UI:
                 if r in self.can_edit: entry.config(bg='yellow', fg='black')
                 else: entry.config(bg='white', fg='black')
 
-        for r in self.cpu.changed_vars: 
+        for i, r in enumerate(changed): 
             entry = None
             if r in self.registers: 
                 # if r == 'AR': mem_pointer = 'AR'
@@ -429,38 +648,39 @@ class UI:
             if entry is not None : 
                 # breakpoint()
                 entry.config(bg='blue', fg='white')
-                if r == 'PSR': 
-                    cols = ['S', 'A1', 'A0', 'E', 'AC', 'PC0', 'PC']
-                    val = '-'.join([str(self.cpu.PSR[c]) for c in cols])
-                else: val = getattr(self.cpu, r)
-                var.set(val)
+                var.set(self.cpu.format(r) if values is None else self.cpu.format_value(r, values[i]))
         
-        self.prev_changed_values = self.cpu.changed_vars.copy()
+        self.prev_changed_values = list(changed)
 
-        row_id = self.main_memory_table.get_children()[int(getattr(self.cpu, self.cpu.memory_ptr),16)] 
-        self.main_memory_table.selection_set(row_id)  
-        self.main_memory_table.focus(row_id)
-        self.main_memory_table.see(row_id)
+        self.select_memory_row(ptr)
+        self.select_process_row(self.cpu.TAR)
 
-        row_id = self.main_memory_table.get_children()[int(getattr(self.cpu, 'AR'),16)] 
-        address = getattr(self.cpu, 'AR')
-        row_id = self.main_memory_table.get_children()[int(address,16)] 
-        self.main_memory_table.item(row_id, values=(Hex(address).val, self.cpu.main_memory[int(address, 16)],))
+    def select_memory_row(self, address): 
+        if address is None or address == self.selected_memory_row: return
+        self.memory_view.select(address)
+        self.selected_memory_row = address
 
-        pid = int(getattr(self.cpu, 'TAR'))
-        # if pid != '': 
-        #     pid = int(pid)
-
-        row_id = self.secondary_memory_table.get_children()[pid] 
+    def select_process_row(self, pid): 
+        if pid == self.selected_process_row: return
+        row_id = self.process_rows[pid]
         self.secondary_memory_table.selection_set(row_id)  
         self.secondary_memory_table.focus(row_id)
         self.secondary_memory_table.see(row_id)
+        self.selected_process_row = pid
+
+    def memory_row_values(self, address, word): 
+        return self.cpu.format_address(address), self.cpu.format_word(word), disassemble(word, self.cpu.address_bits)
 
-        row = self.cpu.secondary_memory[pid].copy()
-        values = []
-        for col in ["S", "A1", "A0", "E", "AC", "PC0", "PC"]:
-            values.append(str(row[col]))
-        self.secondary_memory_table.item(row_id, values=values)
+    def memory_row_background(self, address): 
+        # red for a breakpoint, yellow for a watched word
+        marks = self.breakpoints.bitmap[address], self.breakpoints.watched[address]
+        return {(1, 0): '#f4b6b6', (0, 1): '#f4e3a1', (1, 1): '#f4c98a'}.get(marks)
+
+    def update_memory_row(self, address): 
+        self.memory_view.redraw_row(address)
+
+    def update_process_row(self, pid): 
+        self.secondary_memory_table.item(self.process_rows[pid], values=self.cpu.format_psr(self.cpu.secondary_memory[pid]).split('-'))
 
 
     def clear_selected(self):
@@ -472,7 +692,7 @@ class UI:
 
     def update_ui(self, selected = False):
         if self.loading: return
-        # if self.cpu.execute: return
+        self.resize_tables()
         # if self.cpu.stepping: breakpoint() 
 
         # Update flip-flops
@@ -492,11 +712,7 @@ class UI:
         # Update registers
         mem_pointer = 'PC'
         for reg, (var, entry) in self.registers.items():
-            val = getattr(self.cpu, reg)
-            if reg == "PSR":
-                val =  '-'.join(str(value) for key, value in val.items())
-            else: 
-                val = str(val)
+            val = self.cpu.format(reg)
             if val != self.prev_state[reg]: 
                 # if reg == 'AR': mem_pointer = 'AR'
                 entry.config(bg='blue', fg='white')
@@ -508,45 +724,32 @@ class UI:
             var.set(val)
 
         # Update main memory
-        row_id = self.main_memory_table.get_children()[int(getattr(self.cpu, 'PC'),16)] 
-        self.main_memory_table.selection_set(row_id)  
-        self.main_memory_table.focus(row_id)
-        self.main_memory_table.see(row_id)
+        self.selected_memory_row = None
+        self.select_memory_row(self.cpu.PC)
 
         if selected: 
-            address = getattr(self.cpu, 'PC')
-            row_id = self.main_memory_table.get_children()[int(address,16)] 
-            self.main_memory_table.item(row_id, values=(address, self.cpu.main_memory[int(address, 16)],))
+            self.update_memory_row(self.cpu.PC)
 
         else: 
-            for address, (child, value) in enumerate(zip(self.main_memory_table.get_children(), self.cpu.main_memory)):
-                self.main_memory_table.item(child, values=(f"{address:02x}".upper(), value,))
+            self.memory_view.redraw()
 
         # Update secondary memory
-        pid = int(getattr(self.cpu, 'TAR'))
-        # if pid != '': 
-        #     pid = int(pid)
-        row_id = self.secondary_memory_table.get_children()[pid] 
-            # if int(getattr(self.cpu, 'GS')) == 1: 
-        self.secondary_memory_table.selection_set(row_id)  
-        self.secondary_memory_table.focus(row_id)
-        self.secondary_memory_table.see(row_id)
+        self.selected_process_row = None
+        self.select_process_row(self.cpu.TAR)
 
-        for i, (child, row) in enumerate(zip(self.secondary_memory_table.get_children(), self.cpu.secondary_memory)):
-            values = []
-            for col in ["S", "A1", "A0", "E", "AC", "PC0", "PC"]:
-                values.append(str(row[col]))
-            self.secondary_memory_table.item(child, values=values)
+        for pid in range(len(self.process_rows)):
+            self.update_process_row(pid)
 
     def on_memory_edit(self, event):
-        if self.cpu.running or self.cpu.stepping: return
+        if self.worker.busy: return
 
-        item_id = self.main_memory_table.identify_row(event.y)
-        column = self.main_memory_table.identify_column(event.x)
+        address = self.memory_view.row_at(event.y)
+        column = self.memory_view.column_at(event.x)
 
-        if column != "#2" or not item_id: return
+        if column not in ("#2", "#3") or address is None: return
 
-        current_value = self.main_memory_table.item(item_id, "values")[1]
+        # either column takes an instruction, a label of the loaded program or a hex word
+        current_value = self.memory_row_values(address, self.cpu.main_memory[address])[2]
         
         entry = tk.Entry(self.root)
         entry.insert(0, current_value)
@@ -554,26 +757,69 @@ class UI:
         entry.focus()
 
         def save_value():
+            if not entry.winfo_exists(): return
             new_value = entry.get()
+            entry.destroy()
             
-            self.main_memory_table.item(item_id, values=(self.main_memory_table.item(item_id, "values")[0], new_value))
+            try: 
+                word = assemble_word(new_value, self.cpu.symbols, self.cpu.address_bits)
+            except ValueError as v: 
+                messagebox.showerror(message=v)
+                return
             
-            address = int(self.main_memory_table.item(item_id, "values")[0], 16)
-            self.cpu.main_memory[address] = new_value
-
-            entry.destroy()
+            self.cpu.store(address, word)
+            self.update_memory_row(address)
 
         entry.bind("<Return>", lambda e: save_value())
         entry.bind("<FocusOut>", lambda e: save_value())
 
+    def on_memory_menu(self, event):
+        address = self.memory_view.row_at(event.y)
+        if address is None: return
+        breakpoints = self.breakpoints
+
+        def change(action, *args):
+            try: action(*args)
+            except ValueError as v: 
+                messagebox.showerror(message=v)
+                return
+            self.memory_view.redraw_row(address)
+
+        def ask(title, prompt, initial = ''):
+            return simpledialog.askstring(title, prompt, initialvalue=initial, parent=self.root)
+
+        def break_if():
+            condition = breakpoints.addresses.get(address)
+            condition = ask("Breakpoint", f"Stop at {self.cpu.format_address(address)} when (e.g. PRC == 2 and AC == 0):", condition[0] if condition else '')
+            if condition: change(breakpoints.add, address, condition)
+
+        def break_when():
+            condition = ask("Breakpoint", "Stop before any instruction when (e.g. PRC == 2 and AC == 0):")
+            if condition: change(breakpoints.add_condition, condition)
+
+        def clear_all():
+            breakpoints.clear()
+            self.memory_view.redraw()
+
+        has_break, has_watch = address in breakpoints.addresses, breakpoints.watched[address]
+        menu = tk.Menu(self.root, tearoff=0)
+        menu.add_command(label="Remove breakpoint" if has_break else "Add breakpoint", 
+                         command=lambda: change(breakpoints.remove if has_break else breakpoints.add, address))
+        menu.add_command(label="Break if...", command=break_if)
+        menu.add_command(label="Unwatch" if has_watch else "Watch writes", 
+                         command=lambda: change(breakpoints.unwatch if has_watch else breakpoints.watch, address))
+        menu.add_separator()
+        menu.add_command(label="Break when...", command=break_when)
+        menu.add_command(label="Clear all", command=clear_all)
+        menu.tk_popup(event.x_root, event.y_root)
+
     def on_secondary_memory_edit(self, event):
-        if self.cpu.running or self.cpu.stepping: return
+        if self.worker.busy: return
 
         item_id = self.secondary_memory_table.identify_row(event.y)
         column_id = int(self.secondary_memory_table.identify_column(event.x)[1:]) - 1
         
 
-        columns = ["S", "A1", "A0", "E", "AC", "PC0", "PC"]
         current_value = self.secondary_memory_table.item(item_id, "values")[column_id]
 
         entry = tk.Entry(self.root)
@@ -588,18 +834,17 @@ class UI:
                 return "break"
             
             if column_id in range(4): 
-                new_value = str(int(new_value) % 2)
+                new_value = int(new_value) % 2
             elif column_id == 4: 
-                new_value = Hex(str(new_value), 3).val
+                new_value = int(str(new_value), 16) & self.cpu.mask['AC']
             else: 
-                new_value = Hex(str(new_value)).val
-
-            values =  list(self.secondary_memory_table.item(item_id, "values"))
-            values[column_id] = new_value
-            self.secondary_memory_table.item(item_id, values=values)
+                new_value = int(str(new_value), 16) & self.cpu.mask['PC']
             
-            address = (int(item_id[1:]) - 1) %8 
-            self.cpu.secondary_memory[address][columns[column_id]] = new_value
+            address = self.process_rows.index(item_id)
+            row = list(self.cpu.secondary_memory[address])
+            row[column_id] = new_value
+            self.cpu.store_process(address, row)
+            self.update_process_row(address)
 
             entry.destroy()
 
@@ -609,5 +854,9 @@ class UI:
         entry.bind("<FocusOut>", lambda e: save_value())
 
 
-cpu = CPU()
-ui = UI(cpu)
\ No newline at end of file
+def main():
+    UI(CPU())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import random
+from collections import deque
+
+
+def read_values(path):
+    # hex words from a text file, separated by whitespace, '#' starting a comment
+    with open(path) as file:
+        for line in file:
+            for token in line.split('#')[0].split():
+                yield int(token, 16)
+
+
+class Input:
+    # The values of `source` (a list, a generator, read_values(path) ...) arrive
+    # one after another, `interval` T-states apart, or with exponentially
+    # distributed gaps of mean `interval` when a seed is given. Arrived values
+    # wait in a buffer, of at most `size` values if given (later ones are
+    # dropped and counted), until FGI is clear and the CPU has taken the last
+    # one with INP; then the next one goes to INPR and sets FGI.
+    def __init__(self, source, interval = 1, seed = None, size = None):
+        if interval < 1: raise ValueError('Input interval must be at least 1 T-state')
+        self.values = iter(source)
+        self.interval = interval
+        self.random = None if seed is None else random.Random(seed)
+        self.size = size
+        self.buffer = deque()
+        self.dropped = 0
+        self.taken = True       # no value in INPR is waiting for INP
+        self.value = None       # next value to arrive
+        self.arrival = None     # its T-state, None once the source has run out
+
+    def schedule(self, now):
+        self.value = next(self.values, None)
+        if self.value is None: self.arrival = None
+        elif self.random is None: self.arrival = now + self.interval
+        else: self.arrival = now + max(1, round(self.random.expovariate(1 / self.interval)))
+
+    def ready(self, cpu):
+        return self.taken and self.buffer and not cpu.FGI
+
+    def poll(self, cpu, now):
+        while self.arrival is not None and self.arrival <= now:
+            if self.size is None or len(self.buffer) < self.size: self.buffer.append(self.value)
+            else: self.dropped += 1
+            self.schedule(self.arrival)
+        if not self.ready(cpu): return False
+        cpu.INPR = self.buffer.popleft() & cpu.mask['INPR']
+        cpu.FGI = 1
+        self.taken = False
+        return True
+
+
+class Output:
+    # Records (T-state, value) for every OUT in `values`, and sets FGO again
+    # `latency` T-states after each one. FGO is otherwise left as loaded.
+    def __init__(self, latency = 1):
+        self.latency = latency
+        self.values = []
+        self.ready = None       # T-state FGO is set again, None if no OUT is pending
+
+    def write(self, value, tick):
+        self.values.append((tick, value))
+        self.ready = tick + self.latency
+
+    def poll(self, cpu, now):
+        if self.ready is None or self.ready > now: return False
+        cpu.FGO = 1
+        self.ready = None
+        return True
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            for tick, value in self.values: file.write(f'{tick} {value:02X}\n')
+
+
+class Devices:
+    # What CPU.devices points to. poll() runs at the start of every instruction
+    # cycle and brings the devices up to the current T-state; INP and OUT call
+    # read() and write(). Compiled blocks do not poll: Machine runs one only for
+    # as many cycles as fit before horizon(), and blocks return after INP and OUT.
+    # Devices only run forward: stepping back would replay INP and OUT against
+    # buffers that have moved on, so Machine takes no journal with devices attached.
+    def __init__(self, input = None, output = None):
+        self.input = input
+        self.output = output
+        self.cpu = None
+        self.now = 0    # T-state of the last poll
+
+    def attach(self, cpu):
+        # again after a load or restore, to carry pending events over to the new T-state count
+        if self.cpu is None:
+            if self.input is not None: self.input.schedule(cpu.ticks)
+        else:
+            shift = cpu.ticks - self.now
+            if self.input is not None and self.input.arrival is not None: self.input.arrival += shift
+            if self.output is not None and self.output.ready is not None: self.output.ready += shift
+        self.cpu, cpu.devices, self.now = cpu, self, cpu.ticks
+
+    def poll(self):
+        cpu = self.cpu
+        now = self.now = cpu.ticks
+        changed = []
+        if self.input is not None and self.input.poll(cpu, now): changed += ['INPR', 'FGI']
+        if self.output is not None and self.output.poll(cpu, now): changed.append('FGO')
+        if changed and cpu.deltas is not None: cpu.deltas.touch(changed)
+
+    def read(self):
+        if self.input is not None: self.input.taken = True
+
+    def write(self, value, tick):
+        if self.output is not None: self.output.write(value, tick)
+
+    def horizon(self):
+        # earliest T-state at which poll() would change anything, None if none will
+        events = []
+        if self.input is not None:
+            if self.input.ready(self.cpu): return self.cpu.ticks
+            if self.input.arrival is not None: events.append(self.input.arrival)
+        if self.output is not None and self.output.ready is not None: events.append(self.output.ready)
+        return min(events, default=None)
+
+
+def make_devices(input = None, interval = 1, seed = None, output = False, latency = 1):
+    # Devices for an input file and/or an output sink, as the command line
+    # options give them; None when there is neither
+    if input is None and not output: return None
+    return Devices(
+        Input(read_values(input), interval, seed) if input is not None else None,
+        Output(latency) if output else None,
+    )
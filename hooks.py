@@ -0,0 +1,47 @@
+from weakref import WeakKeyDictionary
+
+MISSING = object()
+
+# hooked object -> [(attribute, hook, value it covered)] for hooks removed while
+# covered by a later one; when the later hook goes, the value is restored past
+# it. Held no longer than the object, whichever Hooks set them.
+STALE = WeakKeyDictionary()
+
+
+class Hooks:
+    # Instance attributes set over an object's own methods or values, so hooked
+    # behaviour costs nothing once removed. remove() undoes them newest first.
+    # A hook that something else has since been set over stays in place until
+    # that one is removed too (the later hook calls through it), so wrappers
+    # should call straight through once their owner is disabled.
+    def __init__(self):
+        self.saved = []     # (object, attribute, value it covered or MISSING, hook)
+
+    def __bool__(self):
+        return bool(self.saved)
+
+    def set(self, obj, attribute, hook):
+        self.saved.append((obj, attribute, obj.__dict__.get(attribute, MISSING), hook))
+        setattr(obj, attribute, hook)
+
+    def remove(self):
+        for obj, attribute, covered, hook in reversed(self.saved):
+            if obj.__dict__.get(attribute) is not hook:
+                STALE.setdefault(obj, []).append((attribute, hook, covered))
+                continue
+            covered = self.uncover(obj, attribute, covered)
+            if covered is MISSING: delattr(obj, attribute)
+            else: setattr(obj, attribute, covered)
+        self.saved.clear()
+
+    @staticmethod
+    def uncover(obj, attribute, value):
+        # value, or what it covered once stale hooks are skipped
+        stale = STALE.get(obj)
+        while stale:
+            entry = next((e for e in stale if e[0] == attribute and e[1] is value), None)
+            if entry is None: break
+            stale.remove(entry)
+            value = entry[2]
+        if stale == []: del STALE[obj]
+        return value
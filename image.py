@@ -0,0 +1,99 @@
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+
+# A program image is a header (magic, format version, sha256 of the yaml source)
+# followed by a marshalled (REG names, CPU.size, CPU.snapshot(), CPU.symbols) tuple:
+# the machine exactly as CPU.load() leaves it, so loading it needs no yaml parsing or
+# validation. CPU.size is the machine size the program gets when it has no SIZE
+# section; the labels are not machine state, so the snapshot does not hold them.
+MAGIC = b'BCIM'
+VERSION = 4
+HEADER = struct.Struct('<4sH32s')
+MMAP_SIZE = 1 << 16     # images at least this large are memory mapped
+
+
+def image_path(path):
+    return os.path.splitext(path)[0] + '.img'
+
+
+def parse_source(source):
+    # program config of yaml source text or bytes; bad yaml is a ValueError like any other bad program
+    import yaml     # only here: loading a cached image needs no yaml at all
+    try: return yaml.safe_load(source) or {}
+    except yaml.YAMLError as e: raise ValueError(f'Invalid yaml: {e}') from None
+
+
+def compile_source(cpu, source):
+    # load yaml source bytes into cpu and return the matching image
+    config = parse_source(source)
+    cpu.load(config)
+    names = tuple(str(r) for r in config.get('REG') or ())
+    return HEADER.pack(MAGIC, VERSION, hashlib.sha256(source).digest()) + marshal.dumps((names, cpu.size, cpu.snapshot(), cpu.symbols))
+
+
+def read_image(path):
+    # (digest, REG names, default size, snapshot, symbols) of an image file, or None if it is missing or unreadable
+    try:
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < MMAP_SIZE: return parse_image(file.read())
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return parse_image(data)
+    except (OSError, ValueError, EOFError, TypeError, struct.error):
+        return None
+
+
+def parse_image(data):
+    magic, version, digest = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION: return None
+    with memoryview(data) as view, view[HEADER.size:] as body:
+        names, size, snapshot, symbols = marshal.loads(body)
+    return digest, names, size, snapshot, symbols
+
+
+def load(cpu, path):
+    # Load a yaml program into cpu through the image cached next to it; returns
+    # the names of the registers its REG section set. The image is used while
+    # it is at least as new as the source, or the source hash still matches;
+    # otherwise the yaml is parsed and the image rewritten.
+    cached = image_path(path)
+    image = read_image(cached)
+    if image is not None and image[2] != cpu.size: image = None
+    source = None
+    if image is not None and os.path.getmtime(cached) < os.path.getmtime(path):
+        with open(path, 'rb') as file: source = file.read()
+        if hashlib.sha256(source).digest() != image[0]: image = None
+        else:
+            try: os.utime(cached)
+            except OSError: pass
+
+    if image is not None:
+        _, names, _, snapshot, symbols = image
+        cpu.reset()
+        cpu.restore(snapshot)
+        cpu.symbols = dict(symbols)
+        return names
+
+    if source is None:
+        with open(path, 'rb') as file: source = file.read()
+    data = compile_source(cpu, source)
+    write_image(cached, data)
+    return parse_image(data)[1]
+
+
+def write_image(cached, data):
+    # through a temporary file of this process's own, so concurrent writers (batch
+    # workers on the same source) never mix or replace a half-written image; the
+    # cache is best effort, so failing to write it is not an error
+    temporary = None
+    try:
+        fd, temporary = tempfile.mkstemp(prefix=os.path.basename(cached) + '.', suffix='.tmp', dir=os.path.dirname(cached) or '.')
+        with os.fdopen(fd, 'wb') as file: file.write(data)
+        os.replace(temporary, cached)
+    except OSError:
+        if temporary is not None:
+            try: os.remove(temporary)
+            except OSError: pass
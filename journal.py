@@ -0,0 +1,80 @@
+from collections import deque
+from operator import itemgetter
+
+from cpu import SNAPSHOT_NAMES
+
+
+class Journal:
+    # Undo log for stepping backwards. Every instruction cycle opens an entry with
+    # the registers, flip-flops, PSR and T-state count it started from, and
+    # CPU.store() / CPU.store_process() add the word or row they overwrite. Edits
+    # made between cycles land in the last entry, so undoing it reverts them too.
+    #
+    # Every `every` cycles a CPU.snapshot() is kept as well: a long rewind
+    # restores the nearest checkpoint past its target and undoes only the rest,
+    # so it costs at most `every` undos. At most `limit` cycles are kept.
+    def __init__(self, cpu, every = 1024, limit = 1 << 16):
+        self.cpu = cpu
+        self.every = every
+        self.limit = limit
+        self.registers = itemgetter(*SNAPSHOT_NAMES)
+        self.clear()
+
+    def clear(self):
+        self.entries = deque()  # (registers, PSR, ticks, writes) per cycle, oldest first
+        self.checkpoints = {}   # cycle -> snapshot of the state before it
+        self.cycle = 0          # cycles journaled, entries[-1] being cycle - 1
+        self.writes = None      # write list of the open entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def begin(self):
+        cpu = self.cpu
+        if self.cycle % self.every == 0: self.checkpoints[self.cycle] = cpu.snapshot()
+        self.writes = []
+        self.entries.append((self.registers(cpu.__dict__), tuple(cpu.PSR), cpu.ticks, self.writes))
+        self.cycle += 1
+
+        if len(self.entries) > self.limit:
+            self.entries.popleft()
+            self.checkpoints.pop(self.cycle - self.limit - 1, None)
+
+    def write(self, address, old):
+        if self.writes is not None: self.writes.append((True, address, old))
+
+    def write_process(self, pid, old):
+        if self.writes is not None: self.writes.append((False, pid, old))
+
+    def step_back(self, n = 1):
+        # undo the last n cycles, or as many as are held; returns how many
+        n = min(n, len(self.entries))
+        target = self.cycle - n
+
+        checkpoint = -(-target // self.every) * self.every
+        if self.cycle - checkpoint > 8 and checkpoint in self.checkpoints:
+            self.cpu.restore(self.checkpoints[checkpoint])
+            for _ in range(self.cycle - checkpoint): self.entries.pop()
+            self.cycle = checkpoint
+
+        self.writes = None
+        while self.cycle > target:
+            self.undo(self.entries.pop())
+            self.cycle -= 1
+
+        for cycle in [c for c in self.checkpoints if c > target]: del self.checkpoints[cycle]
+        self.writes = self.entries[-1][3] if self.entries else None
+        return n
+
+    def undo(self, entry):
+        cpu = self.cpu
+        values, psr, ticks, writes = entry
+        for memory, where, old in reversed(writes):
+            if memory: cpu.store(where, old)
+            else: cpu.store_process(where, old)
+
+        cpu.__dict__.update(zip(SNAPSHOT_NAMES, values))
+        cpu.PSR = list(psr)
+        cpu.ticks = ticks
+        cpu.changed_vars = []
+        cpu.memory_ptr = 'PC'
@@ -0,0 +1,284 @@
+import json
+import sys
+from time import perf_counter
+
+import image
+from assembler import ADDRESS_BITS
+from breakpoints import Break, Breakpoints
+from cpu import CPU, REGISTERS, FLIP_FLOPS
+from devices import make_devices
+from journal import Journal
+from metrics import Metrics
+from superblock import SuperblockCompiler
+from until import Until
+
+
+class Machine:
+    # Headless wrapper around CPU: no clock sleeps, no UI handshake, no dialogs.
+    # With compile=True straight-line code runs as compiled superblocks; with
+    # journal=True every cycle can be undone by step_back() (and nothing compiles);
+    # with metrics=True per-process scheduling counters are kept in self.metrics;
+    # devices is a devices.Devices feeding INPR and taking OUTR, which nothing
+    # rewinds, so it cannot go with journal=True.
+    # Breakpoints and watchpoints set on self.breakpoints stop run() and step()
+    # with a 'breakpoint ...' or 'watchpoint ...' halt reason; running again goes on.
+    # address_bits and processes size the machine for programs without a SIZE section.
+    def __init__(self, compile=False, journal=False, metrics=False, address_bits=ADDRESS_BITS, processes=8, devices=None):
+        if journal and devices is not None: raise ValueError('IO devices cannot be stepped back: journal needs devices=None')
+        self.cpu = CPU(address_bits=address_bits, processes=processes)
+        self.cpu.throttle = False
+        self.devices = devices
+        if devices is not None: devices.attach(self.cpu)
+        if compile: self.cpu.blocks = SuperblockCompiler(self.cpu)
+        if journal: self.cpu.journal = Journal(self.cpu)
+        self.metrics = None
+        if metrics:
+            self.metrics = Metrics(self.cpu)
+            self.metrics.enable()
+        self.breakpoints = Breakpoints(self.cpu)
+        self.cycles = 0
+        self.halt_reason = None
+
+    def load(self, program, cache=True):
+        # program is a path to a yaml file or an already parsed config dict;
+        # paths go through the compiled image next to the file unless cache=False
+        if isinstance(program, dict): self.cpu.load(program)
+        elif cache: image.load(self.cpu, program)
+        else:
+            with open(program, 'r') as file:
+                self.cpu.load(image.parse_source(file.read()))
+        if self.cpu.journal is not None: self.cpu.journal.clear()
+        if self.metrics is not None: self.metrics.reset()
+        if self.devices is not None: self.devices.attach(self.cpu)
+        self.breakpoints.resume = None
+        self.cycles = 0
+        self.halt_reason = None
+
+    def snapshot(self):
+        return self.cpu.snapshot()
+
+    def restore(self, blob):
+        # continue from a CPU.snapshot() blob as if it had just been loaded
+        self.cpu.restore(blob)
+        if self.cpu.journal is not None: self.cpu.journal.clear()
+        if self.metrics is not None: self.metrics.reset()
+        if self.devices is not None: self.devices.attach(self.cpu)
+        self.breakpoints.resume = None
+        self.cycles = 0
+        self.halt_reason = None
+
+    def step_back(self, n=1):
+        # undo the last n cycles (needs journal=True); returns how many were undone
+        n = self.cpu.journal.step_back(n)
+        if n and self.metrics is not None: self.metrics.reset()
+        self.breakpoints.resume = None  # going forward again stops at the same breakpoint
+        # a cycle that raised was journaled but never counted
+        self.cycles -= n - 1 if n and self.halt_reason and self.halt_reason.startswith('error') else n
+        self.halt_reason = None
+        return n
+
+    def stopped(self):
+        return self.halt_reason is not None and self.halt_reason.startswith(('breakpoint', 'watchpoint', 'until'))
+
+    def step(self, limit=1):
+        # one instruction cycle, or up to `limit` of them when a compiled block is at PC
+        if self.stopped(): self.halt_reason = None
+        if self.halt_reason is not None: return False
+        if not self.cpu.GS:
+            self.halt_reason = 'halted'
+            return False
+
+        block = None
+        try:
+            block = limit > 0 and self.cpu.blocks and self.cpu.blocks.lookup()
+            if block and self.devices is not None:
+                # no further than the devices' next event, which only the interpreter polls for
+                horizon = self.devices.horizon()
+                if horizon is not None:
+                    limit = min(limit, self.cpu.blocks.cycles_before(horizon))
+                    if limit <= 0: block = None
+            if block: self.cycles += block(self.cpu, limit)
+            else:
+                self.cpu.instruction_cycle()
+                self.cycles += 1
+        except ValueError as v:
+            if block: self.cycles += self.cpu.blocks.ran
+            self.halt_reason = f'error: {v}'
+            return False
+        except Break as hit:
+            # a watchpoint stops after its cycle, a breakpoint before anything ran
+            if hit.done: self.cycles += 1
+            self.halt_reason = str(hit)
+            return False
+        return True
+
+    def run(self, max_cycles=None, timeout=None):
+        # timeout is in seconds of wall time, checked every 1024 cycles
+        deadline = None if timeout is None else perf_counter() + timeout
+        checked = self.cycles
+        if max_cycles is not None and self.cycles >= max_cycles:
+            # the budget is spent already: not even one more cycle
+            if self.halt_reason is None or self.stopped(): self.halt_reason = 'max_cycles'
+            return self.halt_reason
+        while self.step(4096 if max_cycles is None else max_cycles - self.cycles):
+            if max_cycles is not None and self.cycles >= max_cycles:
+                self.halt_reason = 'max_cycles'
+                break
+            if deadline is not None and self.cycles - checked >= 1024:
+                checked = self.cycles
+                if perf_counter() > deadline:
+                    self.halt_reason = 'timeout'
+                    break
+        return self.halt_reason
+
+    def run_until(self, until, timeout=None):
+        # run on the interpreter, compiled blocks aside, until an until.Until is met;
+        # its reason becomes the halt reason as 'until: ...', and running again goes on
+        if self.stopped(): self.halt_reason = None
+        if self.halt_reason is not None: return self.halt_reason
+        deadline = None if timeout is None else perf_counter() + timeout
+        try:
+            reason = until.run(self.cpu, None if deadline is None else lambda: perf_counter() > deadline)
+            if reason == 'stopped': reason = 'timeout'
+            elif reason != 'halted' and not reason.startswith(('breakpoint', 'watchpoint')): reason = f'until: {reason}'
+            self.halt_reason = reason
+        except ValueError as v:
+            self.halt_reason = f'error: {v}'
+        finally:
+            self.cycles += until.ran
+        return self.halt_reason
+
+    def state(self):
+        cpu = self.cpu
+        state = {
+            'REG': {r: cpu.format(r) for r in REGISTERS if r != 'PSR'},
+            'PSR': cpu.format('PSR'),
+            'FF': {f: getattr(cpu, f) for f in FLIP_FLOPS},
+            'M': {cpu.format_address(a): cpu.format_word(v) for a, v in enumerate(cpu.main_memory) if v},
+            'M2': [cpu.format_psr(row) for row in cpu.secondary_memory],
+            'halt': self.halt_reason,
+            'cycles': self.cycles,
+            'tstates': cpu.ticks,
+        }
+        if self.metrics is not None: state['metrics'] = self.metrics.summary()
+        if self.devices is not None and self.devices.output is not None:
+            state['output'] = [[tick, cpu.format_value('OUTR', value)] for tick, value in self.devices.output.values]
+        return state
+
+
+def add_device_arguments(parser):
+    parser.add_argument('--input', default=None, metavar='FILE', help='feed the hex values in FILE to INPR as an input device')
+    parser.add_argument('--interval', type=int, default=1, help='T-states between input arrivals (their mean with --seed)')
+    parser.add_argument('--seed', type=int, default=None, help='random input arrivals from this seed')
+    parser.add_argument('--output', nargs='?', const='-', default=None, metavar='FILE',
+                        help='record every OUT with its T-state (in the state, and in FILE if given)')
+    parser.add_argument('--latency', type=int, default=1, help='T-states from OUT until the output device sets FGO')
+
+
+def main(argv=None):
+    import argparse     # not for library use (batch workers, bench)
+    parser = argparse.ArgumentParser(prog='machine', description='Headless Basic Computer simulator')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run a yaml program until it halts')
+    run.add_argument('program')
+    run.add_argument('--max-cycles', type=int, default=None)
+    run.add_argument('--dump', default=None, help='write the final machine state as json')
+    run.add_argument('--compile', action='store_true', help='run straight-line code as compiled superblocks (no faster, or slightly slower, for programs that switch processes or take IO every few instructions)')
+    run.add_argument('--profile', nargs='?', const='-', default=None, metavar='JSON',
+                     help='print host time per handler and CPU method, or write it to a json file')
+    run.add_argument('--metrics', action='store_true', help='print per-process scheduling metrics (also added to --dump)')
+    run.add_argument('--until', default=None, metavar='CONDITIONS',
+                     help='run until any of pc=ADDR, tar=PID, halt, cycles=N, tstates=N, switches=N (hex ADDR and PID)')
+    run.add_argument('--break', dest='breaks', action='append', default=[], metavar='ADDR[:COND]',
+                     help='stop before the instruction at hex ADDR, when COND holds if given; or, as :COND, before any instruction where it holds')
+    run.add_argument('--watch', action='append', default=[], metavar='ADDR',
+                     help='stop after any cycle that writes main memory at hex ADDR, or process table row N as M2:N')
+    add_device_arguments(run)
+    run.add_argument('--cores', type=int, default=1, help='cores sharing main memory and the process table')
+    run.add_argument('--parallel', action='store_true', help='run every core in its own OS process')
+
+    batch = commands.add_parser('batch', help='run every program in directories or globs across worker processes')
+    batch.add_argument('programs', nargs='+', help='yaml files, directories or glob patterns')
+    batch.add_argument('--max-cycles', type=int, default=100000)
+    batch.add_argument('--timeout', type=float, default=None, help='wall time limit per program in seconds')
+    batch.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    batch.add_argument('--out', default='results.json', help='json file with the final state of every program')
+    batch.add_argument('--compile', action='store_true', help='run straight-line code as compiled superblocks (no faster, or slightly slower, for programs that switch processes or take IO every few instructions)')
+    add_device_arguments(batch)
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        from batch import main as batch_main
+        return batch_main(args)
+    if args.cores > 1 or args.parallel:
+        if args.compile or args.profile or args.metrics or args.input or args.output or args.breaks or args.watch or args.until:
+            parser.error('--compile, --profile, --metrics, IO devices, --break, --watch and --until need a single core')
+        return run_multicore(args)
+
+    try:
+        devices = make_devices(args.input, args.interval, args.seed, args.output is not None, args.latency)
+        machine = Machine(compile=args.compile, metrics=args.metrics, devices=devices)
+        machine.load(args.program)
+        until = None if args.until is None else Until.parse(args.until)
+        for spec in args.breaks:
+            address, _, condition = spec.partition(':')
+            if address: machine.breakpoints.add(int(address, 16), condition or None)
+            else: machine.breakpoints.add_condition(condition)
+        for spec in args.watch:
+            if spec.upper().startswith('M2:'): machine.breakpoints.watch_process(int(spec[3:], 16))
+            else: machine.breakpoints.watch(int(spec, 16))
+    except (OSError, ValueError) as v:
+        print(f'{args.program}: {v}', file=sys.stderr)
+        return 1
+
+    profiler = None
+    if args.profile:
+        from profiler import Profiler
+        profiler = Profiler(machine.cpu)
+        profiler.enable()
+
+    if until is None: halt = machine.run(args.max_cycles)
+    else:
+        if until.cycles is None: until.cycles = args.max_cycles
+        halt = machine.run_until(until)
+    print(f'{args.program}: {halt} after {machine.cycles} cycles ({machine.cpu.ticks} T-states)')
+    if machine.metrics is not None: print(machine.metrics.table())
+    if args.output not in (None, '-'): devices.output.save(args.output)
+
+    if profiler is not None:
+        profiler.disable()
+        if args.profile == '-': print(profiler.table())
+        else:
+            with open(args.profile, 'w') as file: file.write(profiler.json())
+
+    if args.dump:
+        with open(args.dump, 'w') as file:
+            json.dump(machine.state(), file, indent=2)
+    return 0 if not halt.startswith('error') else 1
+
+
+def run_multicore(args):
+    from multicore import MultiCore
+    try:
+        machine = MultiCore(args.cores)
+        machine.load(args.program)
+    except (OSError, ValueError) as v:
+        print(f'{args.program}: {v}', file=sys.stderr)
+        return 1
+
+    start = perf_counter()
+    halt = machine.run_parallel(args.max_cycles) if args.parallel else machine.run(args.max_cycles)
+    elapsed = perf_counter() - start
+    print(f'{args.program}: {halt} after {sum(machine.cycles)} cycles on {args.cores} cores in {elapsed:.3f}s')
+    for i, (core, cycles, core_halt) in enumerate(zip(machine.cores, machine.cycles, machine.halts)):
+        print(f'  core {i}: {core_halt} after {cycles} cycles ({core.ticks} T-states)')
+
+    if args.dump:
+        with open(args.dump, 'w') as file:
+            json.dump(machine.state(), file, indent=2)
+    return 0 if not halt.startswith('error') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
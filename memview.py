@@ -0,0 +1,132 @@
+import tkinter as tk
+from tkinter import font, messagebox
+
+COLUMNS = (('Address', 50), ('Word', 50), ('Instructions', 150))
+HEADER = '#e6e6e6'
+SELECTED = '#3875d7'
+
+
+class MemoryView:
+    # Main memory as a grid drawn on a Canvas. Only the rows in sight have canvas
+    # items, reused as it scrolls, so building and refreshing it costs the same
+    # for 256 words as for 64K. Cells are read from the CPU when a row is drawn.
+    #
+    # values(address, word) gives the cells of a row and background(address) its
+    # colour, or None. words, when set, maps an address to the word to show
+    # instead of main memory (trace replay). row_at and column_at stand in for
+    # Treeview's identify_row and identify_column.
+    def __init__(self, parent, cpu, values, background, rows = 7):
+        self.cpu = cpu
+        self.values = values
+        self.background = background
+        self.words = None
+        self.top = 0            # first address in sight
+        self.selected = None
+        self.slots = []         # (background, cells) canvas items of each row in sight
+        self.row_height = font.nametofont('TkDefaultFont').metrics('linespace') + 4
+        self.width = sum(width for _, width in COLUMNS)
+        self.centers = [sum(width for _, width in COLUMNS[:i]) + COLUMNS[i][1] // 2 for i in range(len(COLUMNS))]
+
+        self.frame = tk.Frame(parent)
+        bar = tk.Frame(self.frame)
+        bar.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        tk.Label(bar, text="Go to").pack(side=tk.LEFT)
+        self.jump = tk.Entry(bar, width=8, justify='center')
+        self.jump.pack(side=tk.LEFT, padx=5)
+        self.jump.bind("<Return>", lambda e: self.on_jump())
+
+        self.canvas = tk.Canvas(self.frame, width=self.width, height=(rows + 1) * self.row_height,
+                                background='white', highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.create_rectangle(0, 0, self.width, self.row_height, fill=HEADER, outline=HEADER)
+        for (name, _), x in zip(COLUMNS, self.centers):
+            self.canvas.create_text(x, self.row_height // 2, text=name)
+
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.canvas.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.canvas.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll(3))
+
+    def size(self):
+        return len(self.cpu.main_memory)
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self.row_height - 1)
+        while len(self.slots) > rows:
+            for item in self.slots.pop(): self.canvas.delete(item)
+        while len(self.slots) < rows:
+            y = (len(self.slots) + 1) * self.row_height
+            background = self.canvas.create_rectangle(0, y, self.width, y + self.row_height, outline='')
+            cells = [self.canvas.create_text(x, y + self.row_height // 2) for x in self.centers]
+            self.slots.append((background, *cells))
+        self.redraw()
+
+    def draw(self, slot, address):
+        background, *cells = self.slots[slot]
+        if address >= self.size():
+            for item in self.slots[slot]: self.canvas.itemconfig(item, state='hidden')
+            return
+        word = self.cpu.main_memory[address] if self.words is None else self.words(address)
+        selected = address == self.selected
+        fill = SELECTED if selected else self.background(address) or 'white'
+        self.canvas.itemconfig(background, fill=fill, state='normal')
+        for item, value in zip(cells, self.values(address, word)):
+            self.canvas.itemconfig(item, text=value, fill='white' if selected else 'black', state='normal')
+
+    def redraw(self):
+        self.top = max(0, min(self.top, self.size() - len(self.slots)))
+        for slot in range(len(self.slots)): self.draw(slot, self.top + slot)
+        size = max(self.size(), 1)
+        self.scrollbar.set(self.top / size, min(1, (self.top + len(self.slots)) / size))
+
+    def redraw_row(self, address):
+        if self.top <= address < self.top + len(self.slots): self.draw(address - self.top, address)
+
+    def see(self, address):
+        # scroll just enough to bring address in sight; False if it already was
+        rows = len(self.slots) or 1    # none until the canvas is first laid out
+        if address < self.top: self.top = address
+        elif address >= self.top + rows: self.top = address - rows + 1
+        else: return False
+        self.redraw()
+        return True
+
+    def select(self, address):
+        previous, self.selected = self.selected, address
+        if self.see(address): return
+        if previous is not None: self.redraw_row(previous)
+        self.redraw_row(address)
+
+    def scroll(self, rows):
+        self.top += rows
+        self.redraw()
+
+    def yview(self, action, amount, what = None):
+        if action == 'moveto': self.top = int(float(amount) * self.size())
+        else: self.top += int(amount) * (len(self.slots) if what == 'pages' else 1)
+        self.redraw()
+
+    def on_jump(self):
+        try:
+            address = int(self.jump.get(), 16)
+            if not 0 <= address < self.size(): raise ValueError
+        except ValueError:
+            messagebox.showerror(message=f"Invalid address {self.jump.get()}")
+            return
+        self.top = address
+        self.redraw()
+
+    def row_at(self, y):
+        slot = y // self.row_height - 1
+        if not 0 <= slot < len(self.slots) or self.top + slot >= self.size(): return None
+        return self.top + slot
+
+    def column_at(self, x):
+        edge = 0
+        for i, (_, width) in enumerate(COLUMNS):
+            edge += width
+            if x < edge: return f'#{i + 1}'
+        return ''
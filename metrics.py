@@ -0,0 +1,168 @@
+from assembler import MEMORY_OPS, REGISTER_OPS
+from hooks import Hooks
+
+SWT = MEMORY_OPS.index('SWT') + 1
+AWT = MEMORY_OPS.index('AWT') + 1
+FORK = REGISTER_OPS.index('FORK') + 1
+HLT = REGISTER_OPS.index('HLT') + 1
+
+COUNTERS = ('instructions', 'tstates', 'scheduled', 'awt_wait', 'interrupts', 'io_latency', 'overhead')
+
+
+class Metrics:
+    # Guest-side scheduling counters, per PID, all times in T-states.
+    #
+    #   instructions  instructions the process retired
+    #   tstates       T-states of those instructions
+    #   scheduled     times a context switch or SWT handed it the CPU
+    #   awt_wait      T-states spent in AWT cycles that found the awaited process running
+    #   interrupts    IO interrupts taken while it ran
+    #   io_latency    T-states from FGI/FGO being seen set to those interrupts
+    #   overhead      T-states of contextSwitch, SWT and ioInterrupt cycles leaving it
+    #
+    # A process arrives when it is loaded or forked and completes at its HLT;
+    # turnaround runs from one to the other, waiting is turnaround less its own
+    # T-states. enable() wraps instruction_cycle (and compiled blocks) on the CPU
+    # instance, so nothing is counted and nothing costs while disabled.
+    # Counters follow execution forward only: step back or restore starts them over
+    # rather than keep counts of cycles that were undone.
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.enabled = False
+        self.hooks = Hooks()
+        self.reset()
+
+    def reset(self):
+        cpu = self.cpu
+        self.start = cpu.ticks
+        self.processes = {}
+        self.arrival = {pid: self.start for pid, pc in enumerate(cpu.secondary_memory.PC) if pc is not None}
+        self.completion = {}
+        self.pending = None     # T-state FGI/FGO were first seen set, None if clear
+
+    def counters(self, pid):
+        if pid not in self.processes: self.processes[pid] = dict.fromkeys(COUNTERS, 0)
+        return self.processes[pid]
+
+    def enable(self):
+        if self.enabled: return
+        cpu = self.cpu
+        self.hooks.set(cpu, 'instruction_cycle', self.counted(cpu.instruction_cycle))
+        if cpu.blocks is not None:
+            lookup, blocks = cpu.blocks.lookup, {}
+            def counted_lookup():
+                fn = lookup()
+                if fn is None: return None
+                if fn not in blocks: blocks[fn] = self.counted_block(fn)
+                return blocks[fn]
+            self.hooks.set(cpu.blocks, 'lookup', counted_lookup)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled: return
+        self.hooks.remove()
+        self.enabled = False
+
+    def counted(self, cycle):
+        cpu = self.cpu
+        def instruction_cycle():
+            if not self.enabled: return cycle()
+            memory = cpu.main_memory
+            pid, start, pc, s = memory[cpu.PRC], cpu.ticks, cpu.PC, cpu.S
+            switch = (cpu.C and cpu.SW) or not s
+            interrupt = not switch and (cpu.R or (cpu.IEN and (cpu.FGI or cpu.FGO)))
+            if cpu.FGI or cpu.FGO:
+                if self.pending is None: self.pending = start
+            else: self.pending = None
+
+            cycle()
+
+            now = cpu.ticks
+            process = self.counters(pid)
+            if switch:
+                process['overhead'] += now - start
+                self.counters(memory[cpu.PRC])['scheduled'] += 1
+                return
+            if interrupt:
+                process['overhead'] += now - start
+                process['interrupts'] += 1
+                if self.pending is not None: process['io_latency'] += start - self.pending
+                self.pending = None
+                return
+
+            word, a = cpu.IR, cpu.address_bits
+            op = word >> a & 7
+            if op == SWT:
+                process['overhead'] += now - start
+                self.counters(memory[cpu.PRC])['scheduled'] += 1
+                return
+            process['instructions'] += 1
+            process['tstates'] += now - start
+            if op == AWT and cpu.PC == pc: process['awt_wait'] += now - start
+            elif word >> a == 8:
+                n = word & (1 << a) - 1
+                if n == FORK: self.arrival[cpu.TAR] = now
+                elif n == HLT and s and pid not in self.completion: self.completion[pid] = now
+        return instruction_cycle
+
+    def counted_block(self, fn):
+        # compiled blocks never leave the running process
+        def block(cpu, limit):
+            if not self.enabled: return fn(cpu, limit)
+            process, start, ran = self.counters(cpu.main_memory[cpu.PRC]), cpu.ticks, 0
+            try: ran = fn(cpu, limit)
+            except ValueError:
+                ran = cpu.blocks.ran
+                raise
+            finally:
+                process['instructions'] += ran
+                process['tstates'] += cpu.ticks - start
+            return ran
+        return block
+
+    def summary(self):
+        elapsed = self.cpu.ticks - self.start
+        processes = {}
+        for pid in sorted(set(self.processes) | set(self.arrival)):
+            process = dict(self.counters(pid))
+            arrival = self.arrival.get(pid, self.start)
+            process['arrival'] = arrival - self.start
+            if pid in self.completion:
+                process['completion'] = self.completion[pid] - self.start
+                process['turnaround'] = self.completion[pid] - arrival
+                process['waiting'] = process['turnaround'] - process['tstates']
+            process['share'] = process['tstates'] / elapsed if elapsed else 0
+            processes[pid] = process
+
+        done = [p for p in processes.values() if 'turnaround' in p]
+        overhead = sum(p['overhead'] for p in processes.values())
+        return {
+            'elapsed': elapsed,
+            'completed': len(done),
+            'throughput': len(done) * 1000 / elapsed if elapsed else 0,   # per 1000 T-states
+            'overhead': overhead,
+            'overhead_share': overhead / elapsed if elapsed else 0,
+            'turnaround': sum(p['turnaround'] for p in done) / len(done) if done else None,
+            'waiting': sum(p['waiting'] for p in done) / len(done) if done else None,
+            'processes': processes,
+        }
+
+    def table(self):
+        summary = self.summary()
+        def average(value): return '-' if value is None else f'{value:.1f}'
+        lines = [
+            f'{summary["elapsed"]} T-states, {summary["completed"]} completed, '
+            f'throughput {summary["throughput"]:.2f} per 1000 T-states',
+            f'switch overhead {summary["overhead"]} T-states ({summary["overhead_share"] * 100:.1f}%), '
+            f'average turnaround {average(summary["turnaround"])}, waiting {average(summary["waiting"])}',
+            '',
+            f'{"PID":<4}{"instr":>8}{"T-states":>10}{"share":>7}{"sched":>7}{"AWT wait":>9}{"IO int":>7}'
+            f'{"IO lat":>7}{"overhead":>9}{"turnaround":>11}{"waiting":>8}',
+        ]
+        for pid, p in summary['processes'].items():
+            lines.append(
+                f'{pid:<4X}{p["instructions"]:>8}{p["tstates"]:>10}{p["share"] * 100:>6.1f}%{p["scheduled"]:>7}'
+                f'{p["awt_wait"]:>9}{p["interrupts"]:>7}{p["io_latency"]:>7}{p["overhead"]:>9}'
+                f'{p.get("turnaround", "-"):>11}{p.get("waiting", "-"):>8}'
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,367 @@
+import multiprocessing
+import queue
+from array import array
+from contextlib import nullcontext
+from multiprocessing import shared_memory
+from time import perf_counter
+
+import image
+from assembler import ADDRESS_BITS
+from cpu import CPU, FLIP_FLOPS, PSR_FIELDS, REGISTERS, ProcessTable
+
+# Memory ordering. Every memory access is a single aligned word read or write
+# and is atomic. MultiCore.run() interleaves whole instruction cycles, one core
+# after the other, so all cores see one global order of accesses (sequential
+# consistency). Under run_parallel() the cores run freely in their own OS
+# processes: a core sees its own accesses in program order, but a plain store
+# of another core may be seen late, and in a different order from that core's
+# other stores on hosts weaker than x86-64's total store order. TSA, context
+# switches, SWT, FORK and HLT hold one lock across cores, so they are totally
+# ordered and each acts as a full fence. Shared data should be guarded by a
+# TSA lock, released by storing 0 into it.
+
+SCHEDULER = ('TP', 'NS', 'GS')     # registers shared by all cores
+
+
+def shared_register(index):
+    def get(self): return self.scheduler[index]
+    def set(self, value): self.scheduler[index] = value
+    return property(get, set)
+
+
+class Core(CPU):
+    # One core of a MultiCore: its own registers and flip-flops, except TP, NS
+    # and GS, over the machine's main memory and process table. claims[pid] is
+    # the index + 1 of the core running that process, 0 if none is; `bus` is
+    # the lock around everything that reads and writes the scheduler state.
+    def __init__(self, index, address_bits = ADDRESS_BITS, processes = 8):
+        self.index = index
+        self.scheduler = [0] * len(SCHEDULER)
+        self.claims = [0] * processes
+        self.bus = nullcontext()
+        self.pid = None     # process this core holds
+        super().__init__(address_bits=address_bits, processes=processes)
+        self.throttle = False
+
+    TP, NS, GS = (shared_register(i) for i in range(len(SCHEDULER)))
+
+    def attach(self, memory, table, scheduler, claims, bus):
+        self.main_memory, self.secondary_memory = memory, table
+        self.scheduler, self.claims, self.bus = scheduler, claims, bus
+
+    def restore(self, blob):
+        # the snapshot sets TP, NS and GS as plain attributes, which the shared ones hide
+        super().restore(blob)
+        for name in SCHEDULER:
+            if name in self.__dict__: setattr(self, name, self.__dict__.pop(name))
+
+    def next_slot(self):
+        # slot after PRC in the order table whose process no core holds, PRC
+        # itself last; None when every process is held by another core
+        slot = self.PRC
+        for _ in range(max(self.TP, 1)):
+            slot = (slot + 1) & self.mask['PRC']
+            if slot >= self.TP: slot = 0
+            pid = self.read(slot)
+            if pid >= self.processes: raise ValueError(f'Invalid PID: {pid:X}')
+            if not self.claims[pid]: return slot
+        return None
+
+    def contextSwitch(self):
+        # As on one CPU, except that the process left is released and the next
+        # one is the first in order that no other core holds. A core holding no
+        # process saves nothing, and one that finds nothing free stays idle
+        # (S = 0) and tries again next cycle.
+        with self.bus:
+            pid = self.pid
+            if pid is not None:
+                self.AR = self.PRC
+                self.TAR = pid
+                self.PSR[:] = (self.S, self.A1, self.A0, self.E, self.AC, self.pc0(pid), self.PC)
+                self.block(['AR', 'TAR', 'PSR'])
+
+                self.store_process(pid, self.PSR)
+                self.claims[pid] = 0
+                self.pid = None
+
+            self.AR = self.time_address
+            self.TM = self.read(self.AR) & self.mask['TM']
+            self.block(['AR', 'TM'] if pid is None else ['M2', 'AR', 'TM'])
+
+            slot = self.next_slot()
+            if slot is None:
+                self.S, self.C, self.SC = 0, 1, 0
+                self.block(['S', 'C', 'SC'], True)
+                return
+
+            self.PRC = self.AR = slot
+            self.TAR = self.read(self.AR)
+            self.block(['PRC', 'AR', 'TAR'])
+
+            self.PSR[:] = self.process(self.TAR)
+            if self.PSR[6] is None: raise ValueError(f'Process {self.TAR:X} was never loaded')
+            self.claims[self.TAR] = self.index + 1
+            self.pid = self.TAR
+            self.block(['PSR'])
+
+        self.S, self.A1, self.A0, self.E, self.AC, _, self.PC = self.PSR
+        self.C = int(self.S == 0)
+        self.SC = 0
+        self.block(['PC', 'AC', 'E', 'A0', 'A1', 'S', 'C', 'SC'], True)
+
+    def SWT_instruction(self):
+        # a process held by another core is waited for, as AWT waits
+        with self.bus:
+            pid = self.read(self.AR)
+            if pid < self.processes and self.claims[pid] not in (0, self.index + 1):
+                self.PC = (self.PC - 1) & self.mask['PC']
+                self.SC = 0
+                self.TM = (self.TM - 1) & self.mask['TM']
+                self.block(['PC', 'SC', 'TM'], True)
+                return
+            super().SWT_instruction()
+            if self.pid is not None: self.claims[self.pid] = 0
+            self.claims[self.TAR] = self.index + 1
+            self.pid = self.TAR
+
+    def HLT_instruction(self):
+        with self.bus: super().HLT_instruction()
+
+    def FORK_instruction(self):
+        with self.bus: super().FORK_instruction()
+
+    def TSA_instruction(self):
+        with self.bus: super().TSA_instruction()
+
+
+class SharedProcessTable(ProcessTable):
+    # A process table over shared 64-bit columns, where -1 stands for None
+    def __init__(self, columns):
+        self.columns = columns
+        self.S, self.A1, self.A0, self.E, self.AC, self.PC0, self.PC = columns
+
+    def __getitem__(self, pid):
+        return tuple(None if column[pid] < 0 else column[pid] for column in self.columns)
+
+    def __setitem__(self, pid, row):
+        for column, value in zip(self.columns, row): column[pid] = -1 if value is None else value
+
+
+class SharedState:
+    # Main memory, the process table, TP/NS/GS, the claims and a stop flag laid
+    # out in one multiprocessing.shared_memory block, which core processes open
+    # by name. Views handed out are released again by close().
+    def __init__(self, address_bits, processes, typecode, name = None):
+        self.words, self.processes, self.typecode = 1 << address_bits, processes, typecode
+        self.offsets = [0]
+        for size in (self.words * array(typecode).itemsize, 8 * len(PSR_FIELDS) * processes, 8 * len(SCHEDULER), 8 * processes, 8):
+            self.offsets.append(self.offsets[-1] + size)
+        if name is None: self.block = shared_memory.SharedMemory(create=True, size=self.offsets[-1])
+        else: self.block = shared_memory.SharedMemory(name)
+        self.name = self.block.name
+        self.open = []
+
+        self.memory = self.view(0, typecode)
+        table = self.view(1, 'q')     # row after row, fields in PSR_FIELDS order
+        columns = tuple(table[i::len(PSR_FIELDS)] for i in range(len(PSR_FIELDS)))
+        self.open.extend(columns)
+        self.table = SharedProcessTable(columns)
+        self.scheduler, self.claims, self.stop = self.view(2, 'q'), self.view(3, 'q'), self.view(4, 'q')
+
+    def view(self, part, typecode):
+        view = self.block.buf[self.offsets[part]:self.offsets[part + 1]].cast(typecode)
+        self.open.append(view)
+        return view
+
+    def fill(self, cpu):
+        # copy the state shared by cpu and the cores in this process in
+        self.memory[:] = cpu.main_memory
+        for pid, row in enumerate(cpu.secondary_memory): self.table[pid] = row
+        for i, value in enumerate(cpu.scheduler): self.scheduler[i] = value
+        for pid, claim in enumerate(cpu.claims): self.claims[pid] = claim
+        self.stop[0] = 0
+
+    def copy_to(self, cpu):
+        # and back out, into new local objects that cpu holds
+        cpu.main_memory = array(self.typecode, self.memory.tobytes())
+        cpu.secondary_memory = ProcessTable(self.processes)
+        for pid in range(self.processes): cpu.secondary_memory[pid] = self.table[pid]
+        cpu.scheduler = list(self.scheduler)
+        cpu.claims = list(self.claims)
+
+    def close(self, unlink = False):
+        for view in reversed(self.open): view.release()
+        self.open.clear()
+        self.block.close()
+        if unlink: self.block.unlink()
+
+
+def run_core(name, index, blob, pid, bus, results, max_cycles, timeout):
+    # body of one core process under MultiCore.run_parallel()
+    core = Core(index)
+    core.restore(blob)
+    shared = SharedState(core.address_bits, core.processes, core.typecode, name)
+    core.attach(shared.memory, shared.table, shared.scheduler, shared.claims, bus)
+    core.pid = pid
+
+    deadline = None if timeout is None else perf_counter() + timeout
+    stop, cycles, halt = shared.stop, 0, None
+    try:
+        while halt is None:
+            if not core.GS: halt = 'halted'
+            elif stop[0]: halt = 'stopped'
+            elif max_cycles is not None and cycles >= max_cycles: halt = 'max_cycles'
+            elif deadline is not None and cycles & 1023 == 0 and perf_counter() > deadline: halt = 'timeout'
+            else:
+                try:
+                    core.instruction_cycle()
+                    cycles += 1
+                except ValueError as v:
+                    halt = f'error: core {index}: {v}'
+                    stop[0] = 1
+        results.put((index, cycles, halt, core.snapshot(), core.pid))
+    finally:
+        core.attach(None, None, None, None, None)
+        shared.close()
+
+
+class MultiCore:
+    # N cores sharing main memory, the process table and TP, NS and GS, each
+    # dispatching from the order table M[0 .. processes-1] (see Core). Core 0
+    # is loaded as a single CPU would be; the others start idle with its SW
+    # and pick up free processes at their first context switch. run()
+    # interleaves the cores in this process; run_parallel() runs each in its
+    # own OS process over shared memory. Both stop once GS is cleared, and
+    # max_cycles counts the cycles of each core. halt_reason is why the machine
+    # stopped and halts why each core did: the same under run(), each core's own
+    # under run_parallel() ('stopped' for a core another one's error stopped).
+    # See the memory ordering above.
+    def __init__(self, cores = 2, address_bits = ADDRESS_BITS, processes = 8):
+        if cores < 1: raise ValueError('A machine needs at least one core')
+        self.cores = [Core(i, address_bits, processes) for i in range(cores)]
+        self.cycles = [0] * cores
+        self.halt_reason = None
+        self.halts = [None] * cores
+
+    def load(self, program, cache = True):
+        # a yaml path or parsed config, as Machine.load
+        first = self.cores[0]
+        if isinstance(program, dict): first.load(program)
+        elif cache: image.load(first, program)
+        else:
+            with open(program, 'r') as file:
+                first.load(image.parse_source(file.read()))
+
+        claims = [0] * first.processes
+        if first.S and first.secondary_memory.PC[0] is not None:
+            first.pid = first.read(first.PRC)
+            if first.pid >= first.processes: raise ValueError(f'Invalid PID: {first.pid:X}')
+            claims[first.pid] = 1
+        else: first.pid = None
+        first.claims = claims
+
+        for core in self.cores[1:]:
+            core.scheduler = [0] * len(SCHEDULER)   # reset() must not clear the shared ones
+            if (core.address_bits, core.processes) != (first.address_bits, first.processes): core.configure(first.address_bits, first.processes)
+            else: core.reset()
+            core.SW = first.SW
+            core.pid = None
+        self.share()
+        self.cycles = [0] * len(self.cores)
+        self.halt_reason = None
+        self.halts = [None] * len(self.cores)
+
+    def share(self):
+        first = self.cores[0]
+        for core in self.cores[1:]:
+            core.attach(first.main_memory, first.secondary_memory, first.scheduler, first.claims, first.bus)
+
+    def step(self):
+        # one instruction cycle on every core in turn
+        if self.halt_reason is not None: return False
+        for i, core in enumerate(self.cores):
+            if not core.GS:
+                self.halt_reason = 'halted'
+                return False
+            try:
+                core.instruction_cycle()
+            except ValueError as v:
+                self.halt_reason = f'error: core {i}: {v}'
+                return False
+            self.cycles[i] += 1
+        return True
+
+    def run(self, max_cycles = None, timeout = None):
+        deadline = None if timeout is None else perf_counter() + timeout
+        rounds = 0
+        while self.step():
+            rounds += 1
+            if max_cycles is not None and self.cycles[0] >= max_cycles:
+                self.halt_reason = 'max_cycles'
+                break
+            if deadline is not None and rounds & 1023 == 0 and perf_counter() > deadline:
+                self.halt_reason = 'timeout'
+                break
+        self.halts = [self.halt_reason] * len(self.cores)
+        return self.halt_reason
+
+    def run_parallel(self, max_cycles = None, timeout = None):
+        # every core in its own process; returns once all have stopped, with
+        # the machine copied back here as if run() had left it so
+        if self.halt_reason is not None: return self.halt_reason
+        first = self.cores[0]
+        context = multiprocessing.get_context('spawn')
+        bus, results = context.Lock(), context.Queue()
+        shared = SharedState(first.address_bits, first.processes, first.typecode)
+        try:
+            shared.fill(first)
+            workers = [
+                context.Process(target=run_core, args=(shared.name, i, core.snapshot(), core.pid, bus, results, max_cycles, timeout))
+                for i, core in enumerate(self.cores)
+            ]
+            for worker in workers: worker.start()
+            reports = []
+            while len(reports) < len(workers):
+                try: reports.append(results.get(timeout=0.5))
+                except queue.Empty:
+                    if any(worker.is_alive() for worker in workers): continue
+                    shared.stop[0] = 1
+                    raise RuntimeError('A core process exited without reporting') from None
+            for worker in workers: worker.join()
+            reports.sort()
+
+            for index, cycles, halt, blob, pid in reports:
+                core = self.cores[index]
+                core.restore(blob)
+                core.pid = pid
+                self.cycles[index] += cycles
+            shared.copy_to(first)
+        finally:
+            shared.close(unlink=True)
+        self.share()
+
+        halts = self.halts = [halt for _, _, halt, _, _ in reports]
+        errors = [halt for halt in halts if halt.startswith('error')]
+        if errors: self.halt_reason = errors[0]
+        elif not first.GS: self.halt_reason = 'halted'
+        elif 'timeout' in halts: self.halt_reason = 'timeout'
+        else: self.halt_reason = 'max_cycles'
+        return self.halt_reason
+
+    def state(self):
+        first = self.cores[0]
+        return {
+            'cores': [{
+                'REG': {r: core.format(r) for r in REGISTERS if r != 'PSR'},
+                'PSR': core.format('PSR'),
+                'FF': {f: getattr(core, f) for f in FLIP_FLOPS},
+                'PID': core.pid,
+                'halt': halt,
+                'cycles': cycles,
+                'tstates': core.ticks,
+            } for core, cycles, halt in zip(self.cores, self.cycles, self.halts)],
+            'M': {first.format_address(a): first.format_word(v) for a, v in enumerate(first.main_memory) if v},
+            'M2': [first.format_psr(row) for row in first.secondary_memory],
+            'halt': self.halt_reason,
+            'cycles': sum(self.cycles),
+        }
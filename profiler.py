@@ -0,0 +1,100 @@
+import json
+from functools import wraps
+from time import perf_counter
+
+from hooks import Hooks
+
+
+class Profiler:
+    # Host time per CPU method. enable() hooks the timed methods with wrappers
+    # set on the CPU instance (and swaps in a decoding table of wrapped handlers),
+    # disable() puts back whatever was there before; when disabled the CPU runs
+    # its own methods with no profiling code left in the path.
+    #
+    # Each entry holds [calls, total, own]: total includes the time of timed
+    # calls made inside it, own does not. 'cycle' is the whole instruction
+    # cycle, 'deltas' and 'trace' are what block() publishes to (when attached
+    # at enable time), and compiled blocks are timed as 'superblock'.
+    METHODS = ('instruction_cycle', 'fetch', 'decode', 'contextSwitch', 'ioInterrupt', 'block', 'pace')
+    NAMES = {'instruction_cycle': 'cycle'}
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.enabled = False
+        self.stats = {}
+        self.stack = []     # time spent in timed callees, one slot per open call
+        self.hooks = Hooks()
+
+    def reset(self):
+        # zeroed in place, the wrappers hold on to their entries
+        for entry in self.stats.values(): entry[:] = [0, 0.0, 0.0]
+
+    def timed(self, name, fn):
+        entry = self.stats.setdefault(name, [0, 0.0, 0.0])
+        stack, clock = self.stack, perf_counter
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.enabled: return fn(*args, **kwargs)
+            stack.append(0.0)
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                inner = stack.pop()
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - inner
+                if stack: stack[-1] += elapsed
+        return wrapper
+
+    def enable(self):
+        if self.enabled: return
+        cpu = self.cpu
+        for method in self.METHODS:
+            self.hooks.set(cpu, method, self.timed(self.NAMES.get(method, method), getattr(cpu, method)))
+
+        self.hooks.set(cpu, 'decoding', cpu.decoding.map(lambda fn: self.timed(fn.__name__[:-len('_instruction')], fn)))
+
+        # what block() hands its records to, if attached now
+        if cpu.deltas is not None:
+            for method in ('push', 'touch'): self.hooks.set(cpu.deltas, method, self.timed('deltas', getattr(cpu.deltas, method)))
+        if cpu.trace is not None: self.hooks.set(cpu.trace, 'record', self.timed('trace', cpu.trace.record))
+
+        if cpu.blocks is not None:
+            lookup, blocks = cpu.blocks.lookup, {}
+            def timed_lookup():
+                fn = lookup()
+                if fn is None: return None
+                if fn not in blocks: blocks[fn] = self.timed('superblock', fn)
+                return blocks[fn]
+            self.hooks.set(cpu.blocks, 'lookup', timed_lookup)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled: return
+        self.hooks.remove()
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled: self.disable()
+        else: self.enable()
+        return self.enabled
+
+    def rows(self, key = 'own'):
+        # (name, calls, total s, own s) sorted by key, largest first
+        column = {'calls': 1, 'total': 2, 'own': 3}[key]
+        rows = [(name, calls, total, own) for name, (calls, total, own) in self.stats.items() if calls]
+        return sorted(rows, key=lambda row: row[column], reverse=True)
+
+    def table(self, key = 'own'):
+        rows = self.rows(key)
+        cycle = self.stats.get('cycle', [0, 0.0])[1] + self.stats.get('superblock', [0, 0.0])[1]
+        lines = [f'{"name":<14}{"calls":>10}{"total ms":>11}{"own ms":>11}{"own us/call":>13}{"own %":>8}']
+        for name, calls, total, own in rows:
+            share = f'{own / cycle * 100:7.1f}%' if cycle else '       -'
+            lines.append(f'{name:<14}{calls:>10}{total * 1e3:>11.2f}{own * 1e3:>11.2f}{own / calls * 1e6:>13.2f}{share}')
+        return '\n'.join(lines)
+
+    def json(self, key = 'own'):
+        return json.dumps({name: {'calls': calls, 'total': total, 'own': own} for name, calls, total, own in self.rows(key)}, indent=2)
@@ -0,0 +1,286 @@
+from assembler import disassemble
+
+
+class SuperblockCompiler:
+    # Compiles straight-line runs of main memory into Python functions.
+    #
+    # A compiled block fn(cpu, limit) runs at most `limit` instruction cycles
+    # starting at its address and returns how many it ran. It leaves registers,
+    # flip-flops, SC and ticks exactly as the interpreter would, but publishes
+    # no deltas and records no trace or journal, so it is only used with
+    # throttle off and neither attached.
+    # It is entered only where instruction_cycle would fetch (see lookup) and
+    # returns as soon as that no longer holds: TM reaching 0 with SW set, EI
+    # raising R, ESW while C is set. It also returns after a taken skip, a
+    # branch anywhere but its own start, and a store into its own code; a
+    # branch back to its start loops inside the function. With IO devices
+    # attached it returns after INP and OUT too, and it never polls them, so it
+    # is run for no more cycles than cycles_before() their next event allows.
+    #
+    # SWT, AWT, HLT, FORK, RST and LDP touch the process table or S and are
+    # left to the interpreter; so is any word that is not an instruction.
+    #
+    # A new block is on trial for its first TRIAL entries: one that averages
+    # fewer than SHORT cycles per entry (a polling loop exiting at every skip or
+    # EI, a process switched out every other instruction) costs more to enter
+    # than it saves, so its address goes back to the interpreter for good.
+    # Generated functions and their verdicts are kept by source text, so the
+    # same code loaded or restored again is neither recompiled nor retried.
+    #
+    # A block owns the addresses of its instructions, and the breakpoint or
+    # other instruction it stopped before; CPU.store() on an owned address, or a
+    # breakpoint set or cleared there, drops the block.
+
+    MAX_LENGTH = 64
+    HOT = 16    # entries at an address before it is worth compiling
+    TRIAL = 32  # entries a new block is measured for
+    SHORT = 3   # fewer cycles per entry than this on trial and it is dropped
+
+    # instructions the compiler knows, and how many T-states each takes after
+    # fetch, decode and indirection
+    TSTATES = {
+        'LDA': 2, 'CAL': 2, 'STA': 2, 'ISA': 3, 'BR': 1, 'UTM': 2, 'SPA': 2,
+        'ADD': 1, 'SUB': 1, 'AND': 1, 'OR': 1, 'CLE': 1, 'CMA': 1, 'CME': 1,
+        'CIR': 1, 'CIL': 1, 'SZA': 1, 'SZE': 1, 'ICA': 1, 'ESW': 1, 'DSW': 1,
+        'EI': 1, 'INP': 1, 'OUT': 1, 'SKI': 1, 'SKO': 1,
+    }
+    LONGEST = 4 + max(TSTATES.values())  # T-states of a cycle with fetch, decode and indirection
+    ALU = {'ADD': (0, 0), 'SUB': (1, 0), 'AND': (0, 1), 'OR': (1, 1)}
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.blocks = {}    # start address -> fn, or None where nothing compiles
+        self.owners = {}    # address -> start addresses of blocks depending on it
+        self.heat = {}      # address -> entries seen while not yet compiled
+        self.compiled = 0
+        self.ran = 0        # cycles a block completed before it raised
+        self.stops = set()  # breakpoint addresses, which no block runs into
+        self.sources = {}   # source text -> generated fn, kept across clear()
+
+    def clear(self):
+        self.blocks.clear()
+        self.owners.clear()
+        self.heat.clear()
+
+    def lookup(self):
+        # block to run at PC, or None when the interpreter has to take this cycle
+        cpu = self.cpu
+        pc = cpu.PC
+        fn = self.blocks.get(pc, False)
+        if fn is None: return None     # nothing compiles here
+        if cpu.throttle or cpu.trace is not None or cpu.journal is not None: return None
+        if (cpu.C and cpu.SW) or not cpu.S or cpu.R or (cpu.IEN and (cpu.FGI or cpu.FGO)): return None
+        if fn: return fn
+        heat = self.heat[pc] = self.heat.get(pc, 0) + 1
+        if heat < self.HOT: return None
+        del self.heat[pc]
+        fn = self.compile(pc)
+        if fn is not None and not fn.kept: fn = None if fn.kept is False else self.trial(pc, fn)
+        self.blocks[pc] = fn
+        return fn
+
+    def trial(self, start, fn):
+        # fn, counting cycles per entry until it is kept or dropped
+        entries = cycles = 0
+        def measured(cpu, limit):
+            nonlocal entries, cycles
+            c = fn(cpu, limit)
+            entries += 1
+            cycles += c
+            if entries == self.TRIAL:
+                fn.kept = cycles >= self.SHORT * entries
+                if self.blocks.get(start) is measured: self.blocks[start] = fn if fn.kept else None
+            return c
+        return measured
+
+    def cycles_before(self, tick):
+        # cycles any block can run from now on without reaching T-state tick:
+        # fetch, decode, indirection and the longest instruction each
+        return (tick - self.cpu.ticks) // self.LONGEST
+
+    def invalidate(self, address):
+        for start in self.owners.pop(address, ()):
+            self.blocks.pop(start, None)
+
+    def stop(self, address, on):
+        # blocks end before a breakpoint, and grow back over it once it is gone
+        if on: self.stops.add(address)
+        else: self.stops.discard(address)
+        self.invalidate(address)
+
+    def own(self, address, start):
+        self.owners.setdefault(address, set()).add(start)
+
+    def compile(self, start):
+        cpu = self.cpu
+        if start.__class__ is not int or not 0 <= start < len(cpu.main_memory): return None
+
+        program = []
+        address = start
+        while len(program) < self.MAX_LENGTH and address < len(cpu.main_memory):
+            self.own(address, start)
+            if address in self.stops and address != start: break
+            word = cpu.main_memory[address]
+            try:
+                handler, operand, indirect = cpu.decode_word(word)
+            except ValueError:
+                break
+            op = handler.__name__[:-len('_instruction')]
+            if op not in self.TSTATES: break
+            program.append((address, word, op, operand, indirect))
+            if op == 'BR': break
+            address += 1
+
+        # a store into the block's own code has to be its last instruction
+        for i, (_, _, op, operand, indirect) in enumerate(program):
+            if op in ('STA', 'ISA') and not indirect and start <= operand < start + len(program):
+                del program[i+1:]
+                break
+
+        if not program: return None
+        self.compiled += 1
+        return self.generate(start, program)
+
+    def generate(self, start, program):
+        cpu = self.cpu
+        m = cpu.mask
+        end = start + len(program)
+        exit = 'cpu.ticks = t; return c'
+        loops = program[-1][2] == 'BR' and not program[-1][4] and program[-1][3] & m['PC'] == start
+
+        lines = [
+            'def block(cpu, limit):',
+            '    read = cpu.read; store = cpu.store',
+            '    tm = cpu.TM; sw = cpu.SW; t = cpu.ticks; c = 0',
+            '    try:',
+            '        while True:',
+        ]
+        alu = None  # (A0, A1) when known from an earlier ADD/SUB/AND/OR in this pass
+        for address, word, op, operand, indirect in program:
+            body, after = [f'# {cpu.format_address(address)}: {disassemble(word, cpu.address_bits)}'], []
+            sc = 2  # T-states of this instruction so far
+            if operand is None:
+                body.append(f'cpu.AR = {address}; cpu.IR = {word}; cpu.PC = {(address + 1) & m["PC"]}')
+            else:
+                body.append(f'cpu.IR = {word}; cpu.PC = {(address + 1) & m["PC"]}')
+                sc += 1
+                if indirect:
+                    body.append(f'cpu.I = 1; ar = cpu.AR = read({operand}) & {m["AR"]}')
+                    sc += 1
+                    ar = 'ar'
+                else:
+                    body.append(f'cpu.AR = {operand}')
+                    ar = str(operand)
+            skip = f'cpu.PC = {(address + 2) & m["PC"]}'
+            # a read at an address only known at run time may raise: settle SC and ticks first
+            flush = f'cpu.SC = {sc}; cpu.ticks = t + {sc}'
+            flushed = skips = False
+
+            if op in ('LDA', 'CAL', 'ISA'):
+                if indirect:
+                    body.append(flush)
+                    flushed = True
+                body.append(f'dr = read({ar}) & {m["DR"]}')
+            if op == 'LDA':
+                body.append('cpu.DR = cpu.AC = dr')
+            elif op == 'CAL':
+                body.append('cpu.DR = dr')
+                results = {
+                    (0, 0): f'cpu.AC = (cpu.AC + dr) & {m["AC"]}',
+                    (1, 0): f'cpu.AC = (cpu.AC - dr) & {m["AC"]}',
+                    (0, 1): 'cpu.AC = cpu.AC & dr',
+                    (1, 1): 'cpu.AC = cpu.AC | dr',
+                }
+                if alu is not None: body.append(results[alu])
+                else: body += [
+                    'a0 = cpu.A0; a1 = cpu.A1',
+                    f'if a0 == 0 and a1 == 0: {results[0, 0]}',
+                    f'elif a0 == 1 and a1 == 0: {results[1, 0]}',
+                    f'elif a0 == 0 and a1 == 1: {results[0, 1]}',
+                    f'else: {results[1, 1]}',
+                ]
+            elif op == 'STA':
+                body.append(f'store({ar}, cpu.AC)')
+            elif op == 'ISA':
+                body += [
+                    f'dr = (dr + 1) & {m["DR"]}',
+                    f'cpu.DR = dr; store({ar}, dr)',
+                    'skip = dr == cpu.AC',
+                    f'if skip: {skip}',
+                ]
+                skips = True
+            elif op == 'BR':
+                body.append(f'cpu.PC = {ar} & {m["PC"]}' if indirect else f'cpu.PC = {operand & m["PC"]}')
+            elif op == 'UTM':
+                body.append(f'cpu.AR = {cpu.time_address}; cpu.TM = tm = read({cpu.time_address}) & {m["TM"]}')
+            elif op == 'SPA':
+                body += [
+                    'cpu.AR = prc = cpu.PRC',
+                    f'cpu.SC = {sc + 1}; cpu.ticks = t + {sc + 1}',
+                    'skip = read(prc) == cpu.AC',
+                    f'if skip: {skip}',
+                ]
+                flushed = skips = True
+            elif op in self.ALU:
+                alu = self.ALU[op]
+                body.append(f'cpu.A0 = {alu[0]}; cpu.A1 = {alu[1]}')
+            elif op == 'CLE':
+                body.append('cpu.E = 0')
+            elif op == 'CMA':
+                body.append(f'cpu.AC = ~cpu.AC & {m["AC"]}')
+            elif op == 'CME':
+                body.append('cpu.E = ~cpu.E % 2')
+            elif op == 'CIR':
+                body.append(f'ac = cpu.AC; cpu.AC = (ac >> 1 | (cpu.E << {cpu.bits["AC"]*4 - 1})) & {m["AC"]}; cpu.E = ac & 1')
+            elif op == 'CIL':
+                body.append(f'ac = cpu.AC; cpu.AC = ((ac << 1) & {m["AC"]}) | cpu.E; cpu.E = (ac >> {cpu.bits["AC"]*4 - 1}) & 1')
+            elif op in ('SZA', 'SZE', 'SKI', 'SKO'):
+                test = {'SZA': 'cpu.AC == 0', 'SZE': 'cpu.E == 0', 'SKI': 'cpu.FGI == 1', 'SKO': 'cpu.FGO == 1'}[op]
+                body += [f'skip = {test}', f'if skip: {skip}']
+                skips = True
+            elif op == 'ICA':
+                body.append(f'cpu.AC = (cpu.AC + 1) & {m["AC"]}')
+            elif op == 'ESW':
+                body.append('cpu.SW = sw = 1')
+                after.append(f'if cpu.C: {exit}')
+            elif op == 'DSW':
+                body.append('cpu.SW = sw = 0')
+            elif op == 'EI':
+                # R is 0 on entry and only EI can raise it
+                body.append('cpu.IEN = 1; cpu.R = int(cpu.FGI or cpu.FGO)')
+                after.append(f'if cpu.R: {exit}')
+            elif op == 'INP':
+                body += [f'cpu.AC = cpu.INPR & {m["AC"]}; cpu.FGI = 0', 'if cpu.devices is not None: cpu.devices.read()']
+                after.append(f'if cpu.devices is not None: {exit}')
+            elif op == 'OUT':
+                body += [f'cpu.OUTR = cpu.AC & {m["OUTR"]}; cpu.FGO = 0', f'if cpu.devices is not None: cpu.devices.write(cpu.OUTR, t + {sc})']
+                after.append(f'if cpu.devices is not None: {exit}')
+
+            if flushed: body.append('cpu.SC = 0')
+            if op != 'UTM': body.append(f'cpu.TM = tm = (tm - 1) & {m["TM"]}')
+            body += [
+                f't += {sc + self.TSTATES[op]}; c += 1',
+                'if tm == 0:',
+                '    cpu.C = sw',
+                f'    if sw: {exit}',
+            ]
+            if skips: after.append(f'if skip: {exit}')
+            if indirect and op in ('STA', 'ISA'): after.append(f'if {start} <= ar < {end}: {exit}')
+            after.append(f'if c >= limit: {exit}')
+            lines += ['            ' + line for line in body + after]
+
+        lines += [
+            '            continue' if loops else f'            {exit}',
+            '    except ValueError:',
+            '        cpu.blocks.ran = c',
+            '        raise',
+        ]
+        source = '\n'.join(lines)
+        fn = self.sources.get(source)
+        if fn is not None: return fn
+        namespace = {}
+        exec(compile(source, f'<superblock {cpu.format_address(start)}>', 'exec'), namespace)
+        fn = self.sources[source] = namespace['block']
+        fn.source = source
+        fn.kept = None      # trial verdict, see lookup()
+        return fn
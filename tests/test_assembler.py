@@ -0,0 +1,54 @@
+import pytest
+
+from assembler import MEMORY_OPS, REGISTER_OPS, assemble, assemble_entries, assemble_word, disassemble, encode
+from cpu import ADDRESS_WIDTHS
+
+
+@pytest.mark.parametrize('address_bits', ADDRESS_WIDTHS)
+def test_every_mnemonic_round_trips(address_bits):
+    digits = (address_bits + 3) // 4
+    address = (1 << address_bits) - 2
+    for op in MEMORY_OPS:
+        for text in (f'{op} {address:0{digits}X}', f'{op} {address:0{digits}X} I'):
+            word = assemble_word(text, address_bits=address_bits)
+            assert word < 1 << address_bits + 4
+            assert disassemble(word, address_bits) == text
+    for op in REGISTER_OPS:
+        assert disassemble(assemble_word(op, address_bits=address_bits), address_bits) == op
+
+
+def test_encoding_layout():
+    # I | op | address, with register instructions as 1 | 000 | n
+    assert assemble_word('LDA 0A') == 0x10A
+    assert assemble_word('LDA 0A I') == 0x90A
+    assert assemble_word('AWT FF I') == 0xFFF
+    assert assemble_word('AND') == 0x801
+    assert assemble_word('TSA') == 0x800 | len(REGISTER_OPS)
+    assert encode('TSA') == 0x800 | REGISTER_OPS.index('TSA') + 1
+    # data words that are no instruction come back as hex
+    assert disassemble(0x005) == '005'
+
+
+def test_labels_resolve_in_both_passes():
+    words, symbols = assemble_entries([(0x10, 'start: LDA x'), (0x11, 'BR start'), (0x12, {'x': '7'}), (0x13, 'x')])
+    assert symbols == {'start': 0x10, 'x': 0x12}
+    assert words == {0x10: 0x112, 0x11: 0x410, 0x12: 0x007, 0x13: 0x012}
+
+
+def test_text_programs():
+    words, symbols = assemble('ORG 20\nloop: ADD   # add\nBR loop ; again\n')
+    assert words == {0x20: 0x802, 0x21: 0x420}
+    assert symbols == {'loop': 0x20}
+
+
+@pytest.mark.parametrize('text', ['FOO', 'FOO 10', 'LDA', 'LDA 10 X', 'LDA 100', 'HLT 10', 'ADD I', '1000'])
+def test_invalid_words(text):
+    with pytest.raises(ValueError):
+        assemble_word(text)
+
+
+def test_undefined_and_duplicate_labels():
+    with pytest.raises(ValueError, match='Unknown label nowhere'):
+        assemble_entries([(0, 'BR nowhere')])
+    with pytest.raises(ValueError, match='defined twice'):
+        assemble_entries([(0, 'a: HLT'), (1, 'a: HLT')])
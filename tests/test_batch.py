@@ -0,0 +1,49 @@
+import json
+from types import SimpleNamespace
+
+import batch
+
+GOOD = '''\
+FF: {GS: 1, S: 1}
+M:
+  0: [0]
+  8: 'FF'
+  20: ['LDA x', 'HLT']
+  30: 'x: 5'
+M2:
+  0: {PC: 20, PC0: 20, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+'''
+
+BAD = {
+    'syntax.yaml': 'M: [unclosed\n',
+    'scalar_section.yaml': 'M: 5\n',
+    'scalar_row.yaml': GOOD.replace('0: {PC: 20, PC0: 20, AC: 0, E: 0, A0: 0, A1: 0, S: 1}', '0: 7'),
+    'list.yaml': '- 1\n- 2\n',
+    'flip_flop_register.yaml': GOOD.replace('FF: {GS: 1, S: 1}', 'REG: {E: 1}\nFF: {GS: 1, S: 1}'),
+}
+
+
+def write_programs(directory):
+    (directory / 'good.yaml').write_text(GOOD)
+    for name, text in BAD.items(): (directory / name).write_text(text)
+
+
+def test_bad_programs_are_errors_of_their_own(tmp_path):
+    write_programs(tmp_path)
+    paths = batch.expand([str(tmp_path)])
+    for workers in (1, 2):
+        results = batch.run_batch(paths, max_cycles=1000, workers=workers)
+        assert results[str(tmp_path / 'good.yaml')]['halt'] == 'halted'
+        for name in BAD:
+            assert results[str(tmp_path / name)]['halt'].startswith('error: '), name
+
+
+def test_main_writes_results_despite_bad_programs(tmp_path):
+    write_programs(tmp_path)
+    out = tmp_path / 'results.json'
+    args = SimpleNamespace(programs=[str(tmp_path)], max_cycles=1000, timeout=None, workers=2, compile=False,
+                           input=None, interval=1, seed=None, output=None, latency=1, out=str(out))
+    assert batch.main(args) == 1
+    results = json.loads(out.read_text())
+    assert len(results) == 1 + len(BAD)
+    assert results[str(tmp_path / 'good.yaml')]['halt'] == 'halted'
@@ -0,0 +1,98 @@
+import pytest
+
+from machine import Machine
+
+
+def process(pc):
+    return {'PC': pc, 'PC0': pc, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}
+
+
+# 16: ADD, 17: LDA count, 18: CAL one, 19: STA count, 1A: BR loop
+COUNTING = {
+    'FF': {'GS': 1, 'S': 1},
+    'M': {0: [0], 8: 'FF', 16: ['loop: ADD', 'LDA count', 'CAL one', 'STA count', 'BR loop'], 32: ['count: 0', 'one: 1']},
+    'M2': {0: process(16)},
+}
+
+HOOKED = ('fetch', 'store', 'store_process', 'instruction_cycle')
+
+
+def loaded(program=COUNTING, compile=False):
+    machine = Machine(compile=compile)
+    machine.load(program)
+    return machine
+
+
+@pytest.mark.parametrize('compile', [False, True])
+def test_breakpoint_stops_before_its_instruction(compile):
+    machine = loaded(compile=compile)
+    machine.breakpoints.add(0x19)
+    assert machine.run(1000) == 'breakpoint at 19'
+    assert machine.cycles == 3 and machine.cpu.PC == 0x19
+    assert machine.cpu.main_memory[0x32] == 0
+    # running on takes the instruction it stopped at, and stops there next time round
+    assert machine.run(1000) == 'breakpoint at 19'
+    assert machine.cycles == 8 and machine.cpu.main_memory[0x32] == 1
+
+
+def test_conditional_breakpoints():
+    machine = loaded()
+    machine.breakpoints.add(0x19, 'AC == 3')
+    assert machine.run(1000) == 'breakpoint at 19: AC == 3'
+    assert machine.cycles == 13
+
+    machine = loaded()
+    machine.breakpoints.add_condition('M[0x32] == 2')
+    assert machine.run(1000) == 'breakpoint: M[0x32] == 2'
+    assert machine.cycles == 9
+
+
+@pytest.mark.parametrize('compile', [False, True])
+def test_watchpoint_stops_after_the_writing_cycle(compile):
+    machine = loaded(compile=compile)
+    machine.breakpoints.watch(0x32)
+    assert machine.run(1000) == 'watchpoint: M[32] 000 -> 001'
+    assert machine.cycles == 4 and machine.cpu.PC == 0x1A
+
+
+def test_process_watchpoint():
+    program = {
+        'FF': {'GS': 1, 'S': 1, 'SW': 1},
+        'M': {0: [0, 1], 8: '2', 16: ['a: BR a'], 32: ['b: BR b']},
+        'M2': {0: process(16), 1: process(32)},
+    }
+    machine = loaded(program)
+    machine.breakpoints.watch_process(0)
+    assert machine.run(1000).startswith('watchpoint: M2[0] ')
+    # the time slice ran out after two cycles, and the switch saved process 0
+    assert machine.cycles == 3 and machine.cpu.TAR == 1
+
+
+def test_invalid_breakpoints():
+    machine = loaded()
+    with pytest.raises(ValueError): machine.breakpoints.add(0x100)
+    with pytest.raises(ValueError): machine.breakpoints.add_condition('AC ==')
+    with pytest.raises(ValueError): machine.breakpoints.watch_process(8)
+
+
+@pytest.mark.parametrize('compile', [False, True])
+def test_hooks_go_once_nothing_is_set(compile):
+    machine = loaded(compile=compile)
+    cpu, breakpoints = machine.cpu, machine.breakpoints
+    breakpoints.add(0x19)
+    breakpoints.watch(0x32)
+    breakpoints.watch_process(0)
+    assert all(name in cpu.__dict__ for name in HOOKED)
+
+    breakpoints.unwatch(0x32)
+    breakpoints.unwatch_process(0)
+    assert 'fetch' in cpu.__dict__ and 'store' not in cpu.__dict__
+    breakpoints.remove(0x19)
+    assert not any(name in cpu.__dict__ for name in HOOKED)
+    if compile: assert 'lookup' not in cpu.blocks.__dict__
+
+    breakpoints.add(0x19)
+    breakpoints.watch(0x32)
+    breakpoints.clear()
+    assert not breakpoints and not any(name in cpu.__dict__ for name in HOOKED)
+    assert machine.run(100) == 'max_cycles'
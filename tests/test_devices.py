@@ -0,0 +1,75 @@
+from itertools import count
+
+from cpu import CPU
+from devices import Devices, Input, Output
+from machine import Machine
+
+
+def attached(*devices):
+    cpu = CPU()
+    cpu.throttle = False
+    Devices(*devices).attach(cpu)
+    return cpu
+
+
+def test_input_arrives_when_fgi_is_clear():
+    cpu = attached(Input([5, 6, 7], interval=10, size=1))
+    devices, input = cpu.devices, cpu.devices.input
+    assert devices.horizon() == 10
+    cpu.ticks = 9
+    devices.poll()
+    assert not cpu.FGI
+
+    cpu.ticks = 10
+    devices.poll()
+    assert (cpu.INPR, cpu.FGI) == (5, 1)
+    # FGI is set: nothing more is delivered before the next arrival
+    assert devices.horizon() == 20
+
+    cpu.ticks = 35
+    devices.poll()
+    assert cpu.INPR == 5 and list(input.buffer) == [6] and input.dropped == 1
+    devices.read()
+    cpu.FGI = 0
+    # the buffered value is due at once
+    assert devices.horizon() == 35
+    devices.poll()
+    assert (cpu.INPR, cpu.FGI) == (6, 1)
+    assert input.arrival is None and devices.horizon() is None
+
+
+def test_output_sets_fgo_after_its_latency():
+    cpu = attached(None, Output(latency=4))
+    devices = cpu.devices
+    assert devices.horizon() is None
+    devices.write(0x41, 3)
+    assert devices.horizon() == 7
+    cpu.ticks = 7
+    devices.poll()
+    assert cpu.FGO == 1 and devices.horizon() is None
+    assert devices.output.values == [(3, 0x41)]
+
+
+# polls with SKI/INP and echoes every value taken as an interrupt with OUT
+ECHO = {
+    'FF': {'GS': 1, 'S': 1, 'FGO': 1},
+    'M': {
+        0: [0], 8: 'FF', 9: 'handler',
+        '0A': 'polled: 0', '0B': 'taken: 0',
+        20: ['loop: EI', 'SKI', 'BR loop', 'INP', 'STA polled', 'BR loop'],
+        30: ['handler: INP', 'OUT', 'STA taken', 'LDP'],
+    },
+    'M2': {0: {'PC': 20, 'PC0': 20, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}},
+}
+
+
+def test_compiled_blocks_stop_at_the_device_horizon():
+    # compiled blocks do not poll: they must leave every device event to the interpreter
+    states = []
+    for compile in (False, True):
+        machine = Machine(compile=compile, devices=Devices(Input(count(1), 37, seed=3), Output(5)))
+        machine.load(ECHO)
+        machine.run(20000)
+        states.append(machine.state())
+    assert states[0] == states[1]
+    assert len(states[0]['output']) > 100
@@ -0,0 +1,32 @@
+import gc
+
+import hooks
+from hooks import Hooks
+
+
+class Target:
+    def method(self):
+        return 'original'
+
+
+def test_hooks_removed_out_of_order_restore_the_original():
+    target, first, second = Target(), Hooks(), Hooks()
+    first.set(target, 'method', lambda: 'first')
+    second.set(target, 'method', lambda: 'second')
+    first.remove()
+    assert target.method() == 'second'
+    second.remove()
+    assert target.method() == 'original'
+    assert 'method' not in target.__dict__
+    assert target not in hooks.STALE
+
+
+def test_stale_hooks_go_with_their_object():
+    target, first, second = Target(), Hooks(), Hooks()
+    first.set(target, 'method', lambda: 'first')
+    second.set(target, 'method', lambda: 'second')
+    first.remove()
+    assert target in hooks.STALE
+    del target, second
+    gc.collect()
+    assert len(hooks.STALE) == 0
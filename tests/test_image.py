@@ -0,0 +1,57 @@
+import image
+from cpu import CPU
+
+PROGRAM = '''\
+FF: {GS: 1, S: 1}
+M:
+  0: [0]
+  8: 'FF'
+  16: ['start: LDA x', 'BR start']
+  32: 'x: 5'
+M2:
+  0: {PC: 16, PC0: 16, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+'''
+
+
+def test_cached_load_keeps_symbols(tmp_path):
+    path = tmp_path / 'labels.yaml'
+    path.write_text(PROGRAM)
+
+    first = CPU()
+    image.load(first, str(path))
+    assert (tmp_path / 'labels.img').exists()
+
+    second = CPU()
+    image.load(second, str(path))
+    assert second.symbols == first.symbols == {'start': 0x16, 'x': 0x32}
+    assert second.main_memory.tobytes() == first.main_memory.tobytes()
+
+
+def test_old_images_are_parsed_again(tmp_path):
+    path = tmp_path / 'labels.yaml'
+    path.write_text(PROGRAM)
+    image.load(CPU(), str(path))
+    cached = tmp_path / 'labels.img'
+    data = bytearray(cached.read_bytes())
+    image.HEADER.pack_into(data, 0, image.MAGIC, image.VERSION - 1, bytes(data[6:38]))
+    cached.write_bytes(data)
+
+    cpu = CPU()
+    image.load(cpu, str(path))
+    assert cpu.symbols == {'start': 0x16, 'x': 0x32}
+    assert image.read_image(str(cached))[0] == bytes(data[6:38])
+
+
+def test_image_is_written_through_a_temporary_file(tmp_path, monkeypatch):
+    path = tmp_path / 'labels.yaml'
+    path.write_text(PROGRAM)
+    image.load(CPU(), str(path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['labels.img', 'labels.yaml']
+
+    def failing(src, dst): raise OSError('disk full')
+    (tmp_path / 'labels.img').unlink()
+    monkeypatch.setattr(image.os, 'replace', failing)
+    cpu = CPU()
+    image.load(cpu, str(path))
+    assert cpu.symbols == {'start': 0x16, 'x': 0x32}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['labels.yaml']
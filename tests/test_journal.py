@@ -0,0 +1,24 @@
+import pytest
+
+from devices import Devices, Input
+from machine import Machine
+
+
+def test_devices_cannot_be_stepped_back():
+    with pytest.raises(ValueError):
+        Machine(journal=True, devices=Devices(Input([1, 2, 3])))
+
+
+def test_step_back_starts_the_metrics_over():
+    machine = Machine(journal=True, metrics=True)
+    machine.load({
+        'FF': {'GS': 1, 'S': 1},
+        'M': {0: [0], 8: 'FF', 16: ['ADD', 'BR 16']},
+        'M2': {0: {'PC': 16, 'PC0': 16, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}},
+    })
+    machine.run(10)
+    assert machine.metrics.summary()['processes'][0]['instructions'] == 10
+    machine.step_back(4)
+    assert machine.metrics.summary()['elapsed'] == 0
+    machine.run(10)
+    assert machine.metrics.summary()['processes'][0]['instructions'] == 4
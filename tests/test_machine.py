@@ -0,0 +1,31 @@
+from machine import Machine
+
+PROGRAM = {
+    'FF': {'GS': 1, 'S': 1},
+    'M': {0: [0], 8: 'FF', 16: ['ADD', 'BR 16']},
+    'M2': {0: {'PC': 16, 'PC0': 16, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}},
+}
+
+
+def loaded():
+    machine = Machine()
+    machine.load(PROGRAM)
+    return machine
+
+
+def test_run_stops_at_max_cycles():
+    machine = loaded()
+    assert machine.run(7) == 'max_cycles'
+    assert machine.cycles == 7
+
+
+def test_no_cycle_runs_once_the_budget_is_spent():
+    machine = loaded()
+    assert machine.run(0) == 'max_cycles'
+    assert machine.cycles == 0 and machine.cpu.ticks == 0
+
+    machine = loaded()
+    for _ in range(5): machine.step()
+    ticks = machine.cpu.ticks
+    assert machine.run(3) == 'max_cycles'
+    assert machine.cycles == 5 and machine.cpu.ticks == ticks
@@ -0,0 +1,77 @@
+from multicore import MultiCore
+
+
+def process(pc):
+    return {'PC': pc, 'PC0': pc, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}
+
+
+def counting(locked, times=0x20):
+    # two processes each adding 1 to a shared count `times` times, inside a TSA lock if locked
+    def code(loop, counter):
+        acquire = [f'{loop}: LDA lockp', 'TSA', 'SZA', f'BR {loop}'] if locked else [f'{loop}: ADD']
+        release = ['LDA zero', 'STA lock'] if locked else []
+        return (acquire + ['ADD', 'LDA count', 'CAL one', 'STA count'] + release
+                + ['SUB', f'LDA {counter}', 'CAL one', f'STA {counter}', 'SZA', f'BR {loop}', 'HLT'])
+    return {
+        'FF': {'GS': 1, 'S': 1, 'SW': 1},
+        'M': {
+            0: [0, 1], 8: '4',
+            '0A': ['lockp: lock', 'lock: 0', 'count: 0', 'one: 1', 'zero: 0', f'n0: {times:X}', f'n1: {times:X}'],
+            20: code('a', 'n0'), 40: code('b', 'n1'),
+        },
+        'M2': {0: process(20), 1: process(40)},
+    }
+
+
+def loaded(program, cores=2):
+    machine = MultiCore(cores)
+    machine.load(program)
+    return machine
+
+
+def test_scheduler_registers_are_shared():
+    machine = loaded(counting(True))
+    first, second = machine.cores
+    assert second.GS == first.GS == 1
+    first.TP = 5
+    assert second.TP == 5
+    second.restore(second.snapshot())
+    assert second.TP == 5 and 'TP' not in second.__dict__
+    assert first.claims == [1, 0, 0, 0, 0, 0, 0, 0] and second.claims is first.claims
+
+
+def test_tsa_lock_keeps_the_shared_count():
+    machine = loaded(counting(True))
+    assert machine.run(100000) == 'halted'
+    assert machine.cores[0].main_memory[0x0C] == 0x40
+    # each core ran a process of its own
+    assert sorted(core.pid for core in machine.cores) == [0, 1]
+    assert machine.halts == ['halted', 'halted']
+
+
+def test_without_the_lock_updates_are_lost():
+    machine = loaded(counting(False))
+    assert machine.run(100000) == 'halted'
+    assert machine.cores[0].main_memory[0x0C] < 0x40
+
+
+def test_parallel_cores_keep_the_shared_count():
+    machine = loaded(counting(True))
+    assert machine.run_parallel(100000, timeout=60) == 'halted'
+    assert machine.cores[0].main_memory[0x0C] == 0x40
+    assert machine.halts == ['halted', 'halted']
+    assert [core['halt'] for core in machine.state()['cores']] == ['halted', 'halted']
+
+
+def test_parallel_halts_are_per_core():
+    # core 0 starts on process 0, which switches to a PID that does not exist:
+    # core 0 fails and core 1, on its endless loop, is stopped
+    program = {
+        'FF': {'GS': 1, 'S': 1, 'SW': 1},
+        'M': {0: [0, 1], 8: '4', '0A': 'bad: 7F', 20: ['SWT bad'], 40: ['loop: BR loop']},
+        'M2': {0: process(20), 1: process(40)},
+    }
+    machine = loaded(program)
+    halt = machine.run_parallel(timeout=60)
+    assert halt == 'error: core 0: Invalid PID: 7F'
+    assert machine.halts == [halt, 'stopped']
@@ -0,0 +1,59 @@
+import image
+from machine import Machine
+
+# two processes switched out after every instruction: no block gets past its first one
+SWITCHING = '''\
+FF: {GS: 1, S: 1, SW: 1}
+M:
+  0: [0, 1]
+  8: '1'
+  16: ['loop: ADD', 'LDA count', 'CAL one', 'STA count', 'BR loop']
+  32: ['count: 0', 'one: 1']
+M2:
+  0: {PC: 16, PC0: 16, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+  1: {PC: 16, PC0: 16, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+'''
+
+# one process in a loop that never leaves its block
+LOOPING = '''\
+FF: {GS: 1, S: 1}
+M:
+  0: [0]
+  8: 'FF'
+  16: ['loop: ADD', 'LDA count', 'CAL one', 'STA count', 'BR loop']
+  32: ['count: 0', 'one: 1']
+M2:
+  0: {PC: 16, PC0: 16, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+'''
+
+
+def run(program, compile, cycles=2000, machine=None):
+    # up to 8 cycles a step, so blocks are entered often enough to finish their trial
+    if machine is None:
+        machine = Machine(compile=compile)
+        machine.load(image.parse_source(program))
+    while machine.cycles < cycles: machine.step(min(8, cycles - machine.cycles))
+    return machine
+
+
+def test_short_blocks_go_back_to_the_interpreter():
+    compiled, interpreted = run(SWITCHING, True), run(SWITCHING, False)
+    assert compiled.cpu.blocks.blocks[0x16] is None
+    assert compiled.state() == interpreted.state()
+
+
+def test_long_blocks_are_kept():
+    compiled, interpreted = run(LOOPING, True), run(LOOPING, False)
+    assert compiled.cpu.blocks.blocks[0x16].kept
+    assert compiled.state() == interpreted.state()
+
+
+def test_restored_code_is_not_compiled_again():
+    machine = run(LOOPING, True)
+    blocks = machine.cpu.blocks
+    fn, sources = blocks.blocks[0x16], dict(blocks.sources)
+    machine.restore(machine.snapshot())
+    assert not blocks.blocks
+    run(LOOPING, True, machine=machine)
+    assert blocks.blocks[0x16] is fn
+    assert blocks.sources == sources
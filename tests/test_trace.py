@@ -0,0 +1,45 @@
+import image
+from cpu import CPU
+from tracer import Trace
+
+# two processes switching every 3 cycles, both counting with ISA
+PROGRAM = '''\
+FF: {GS: 1, S: 1, SW: 1}
+M:
+  0: [0, 1]
+  8: '3'
+  16: ['ISA x', 'BR 16']
+  24: ['ISA y', 'BR 24']
+  32: ['x: 0', 'y: 0']
+M2:
+  0: {PC: 16, PC0: 16, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+  1: {PC: 24, PC0: 24, AC: 0, E: 0, A0: 0, A1: 0, S: 1}
+'''
+
+
+def replayed(size):
+    cpu = CPU()
+    cpu.load(image.parse_source(PROGRAM))
+    cpu.throttle = False
+    cpu.trace = trace = Trace(cpu, size)
+    for _ in range(40): cpu.instruction_cycle()
+    _, memory, processes = trace.state_at(len(trace) - 1)
+    main_memory = list(trace.base_memory)
+    for address, word in memory.items(): main_memory[address] = word
+    secondary_memory = list(trace.base_processes)
+    for pid, row in processes.items(): secondary_memory[pid] = row
+    return cpu, memory, processes, main_memory, secondary_memory
+
+
+def test_replay_ends_at_the_live_state():
+    cpu, memory, processes, main_memory, secondary_memory = replayed(4096)
+    assert {0x32, 0x33} <= memory.keys()
+    assert processes.keys() == {0, 1}
+    assert main_memory == list(cpu.main_memory)
+    assert secondary_memory == list(cpu.secondary_memory)
+
+
+def test_wrapped_records_are_folded_into_the_base():
+    cpu, _, _, main_memory, secondary_memory = replayed(16)
+    assert main_memory == list(cpu.main_memory)
+    assert secondary_memory == list(cpu.secondary_memory)
@@ -0,0 +1,95 @@
+import pytest
+
+from machine import Machine
+from until import Until
+
+
+def process(pc):
+    return {'PC': pc, 'PC0': pc, 'AC': 0, 'E': 0, 'A0': 0, 'A1': 0, 'S': 1}
+
+
+# process 0 counts up for good, process 1 counts n down and halts; switched every 3 cycles
+PROGRAM = {
+    'FF': {'GS': 1, 'S': 1, 'SW': 1},
+    'M': {
+        0: [0, 1], 8: '3',
+        '0A': ['count: 0', 'one: 1', 'n: 9'],
+        20: ['up: ADD', 'LDA count', 'CAL one', 'STA count', 'BR up'],
+        40: ['down: SUB', 'LDA n', 'CAL one', 'STA n', 'SZA', 'BR down', 'HLT'],
+    },
+    'M2': {0: process(20), 1: process(40)},
+}
+
+
+def loaded():
+    machine = Machine()
+    machine.load(PROGRAM)
+    return machine
+
+
+def stepped(machine, stop):
+    # the reference: one plain step at a time, stop(ran) checked before each cycle
+    cpu, ran = machine.cpu, 0
+    while cpu.GS and not stop(ran):
+        assert machine.step()
+        ran += 1
+    return ran
+
+
+def switches(machine):
+    # stop() counting the cycles that switch process
+    cpu, seen = machine.cpu, []
+    def switched(ran):
+        seen.append((cpu.C and cpu.SW) or not cpu.S)
+        return sum(seen[:-1])
+    return switched
+
+
+CASES = [
+    ('pc=24', lambda m: lambda ran: ran and m.cpu.PC == 0x24),
+    ('pc=20', lambda m: lambda ran: ran and m.cpu.PC == 0x20),
+    ('tar=1', lambda m: lambda ran: ran and m.cpu.TAR == 1),
+    ('halt', lambda m: lambda ran: ran and not m.cpu.S),
+    ('cycles=17', lambda m: lambda ran: ran >= 17),
+    ('tstates=50', lambda m: lambda ran, end=m.cpu.ticks + 50: m.cpu.ticks >= end),
+    ('switches=4', lambda m: lambda ran, count=switches(m): count(ran) >= 4),
+]
+
+
+@pytest.mark.parametrize('text, reference', CASES, ids=[text for text, _ in CASES])
+def test_fast_path_stops_where_stepping_does(text, reference):
+    fast, slow = loaded(), loaded()
+    # start somewhere into the run, so conditions that hold at first are passed over
+    for machine in (fast, slow): machine.run(7)
+    for machine in (fast, slow): machine.halt_reason = None
+
+    until = Until.parse(text)
+    assert fast.run_until(until).startswith('until: ')
+    ran = stepped(slow, reference(slow))
+    assert until.ran == ran
+    assert fast.state()['REG'] == slow.state()['REG']
+    assert fast.state()['M'] == slow.state()['M'] and fast.state()['M2'] == slow.state()['M2']
+    assert fast.cpu.ticks == slow.cpu.ticks
+
+
+def test_memory_condition_stops_where_stepping_does():
+    # conditions are checked at fetches, so the reference steps with the same one set
+    fast, slow = loaded(), loaded()
+    for machine in (fast, slow): machine.breakpoints.add_condition('M[0x0A] == 5')
+    assert fast.run_until(Until(cycles=1000)) == 'breakpoint: M[0x0A] == 5'
+    while slow.step(): pass
+    assert slow.halt_reason == fast.halt_reason
+    assert fast.cycles == slow.cycles and fast.cpu.main_memory[0x0A] == 5
+    assert fast.state() == slow.state() and fast.cpu.ticks == slow.cpu.ticks
+
+
+def test_halted_machine():
+    machine = loaded()
+    machine.cpu.GS = 0
+    assert machine.run_until(Until(cycles=10)) == 'halted'
+    assert machine.cycles == 0
+
+
+@pytest.mark.parametrize('text', ['', 'pc', 'pc=zz', 'halt=1', 'speed=3'])
+def test_invalid_conditions(text):
+    with pytest.raises(ValueError): Until.parse(text)
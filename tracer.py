@@ -0,0 +1,50 @@
+from cpu import REGISTERS, FLIP_FLOPS
+
+
+class Trace:
+    # Ring buffer with one record per CPU.block() call:
+    # (T-state index, changed names, their new values, memory_ptr address).
+    # A write to main memory shows up as the name 'M' with value (address, word),
+    # one to the process table as 'M2' with value (PID, row).
+    # When the buffer wraps, the overwritten record is folded into `base`, so the
+    # state before the oldest held record is always known and any window can be
+    # replayed in either direction.
+    def __init__(self, cpu, size = 4096):
+        self.size = size
+        self.records = [None] * size
+        self.count = 0
+        self.base = {name: cpu.value(name) for name in REGISTERS + FLIP_FLOPS}
+        self.base_memory = list(cpu.main_memory)
+        self.base_processes = list(cpu.secondary_memory)
+
+    def record(self, tstate, changed, values, ptr):
+        i = self.count % self.size
+        if self.records[i] is not None: self.fold(self.records[i])
+        self.records[i] = (tstate, changed, values, ptr)
+        self.count += 1
+
+    def fold(self, record):
+        _, changed, values, _ = record
+        for name, value in zip(changed, values):
+            if name == 'M': self.base_memory[value[0]] = value[1]
+            elif name == 'M2': self.base_processes[value[0]] = value[1]
+            elif name in self.base: self.base[name] = value
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def __getitem__(self, k):
+        # k-th oldest record still held
+        if not 0 <= k < len(self): raise IndexError(k)
+        return self.records[(self.count - len(self) + k) % self.size]
+
+    def state_at(self, k):
+        # (registers, memory writes, process table writes) after record k, all as dicts
+        registers, memory, processes = dict(self.base), {}, {}
+        for i in range(k + 1):
+            _, changed, values, _ = self[i]
+            for name, value in zip(changed, values):
+                if name == 'M': memory[value[0]] = value[1]
+                elif name == 'M2': processes[value[0]] = value[1]
+                elif name in registers: registers[name] = value
+        return registers, memory, processes
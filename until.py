@@ -0,0 +1,66 @@
+from breakpoints import Break
+
+KEYS = ('pc', 'tar', 'halt', 'cycles', 'tstates', 'switches')
+
+
+class Until:
+    # Where a run-until stops, whichever comes first: PC reaching `pc`, TAR
+    # reaching `tar`, a process halting (S cleared), `cycles` instruction
+    # cycles, `tstates` T-states or `switches` context switches from the start.
+    # PC, TAR and S are checked between cycles, from the second one on, so a
+    # run-until goes somewhere even when one of them already holds. It also
+    # stops where GS is cleared, at a breakpoint or watchpoint, and wherever
+    # stopped() says so (checked every 256 cycles).
+    def __init__(self, pc = None, tar = None, halt = False, cycles = None, tstates = None, switches = None):
+        self.pc = pc
+        self.tar = tar
+        self.halt = halt
+        self.cycles = cycles
+        self.tstates = tstates
+        self.switches = switches
+        self.ran = 0            # cycles the last run() completed, even if it raised
+
+    @classmethod
+    def parse(cls, text):
+        # 'pc=2C switches=500 halt', as --until takes it: addresses and PIDs in hex, counts in decimal
+        conditions = {}
+        for item in text.replace(',', ' ').split():
+            key, _, value = item.partition('=')
+            key = key.lower()
+            if key not in KEYS or (key == 'halt') != (value == ''): raise ValueError(f'Invalid run-until condition {item}')
+            try: conditions[key] = True if key == 'halt' else int(value, 16 if key in ('pc', 'tar') else 10)
+            except ValueError: raise ValueError(f'Invalid run-until condition {item}') from None
+        if not conditions: raise ValueError('No run-until condition')
+        return cls(**conditions)
+
+    def run(self, cpu, stopped = None):
+        # The fast path: throttle is off for the duration, so block() neither
+        # sleeps nor publishes deltas, and the caller refreshes its view once at
+        # the end. Returns why it stopped.
+        throttle, cpu.throttle = cpu.throttle, False
+        pc, tar, halt, switches = self.pc, self.tar, self.halt, self.switches
+        cycles = self.cycles
+        end = None if self.tstates is None else cpu.ticks + self.tstates
+        ran = switched = 0
+        try:
+            while True:
+                if not cpu.GS: return 'halted'
+                if ran:
+                    if pc is not None and cpu.PC == pc: return f'PC = {cpu.format_address(pc)}'
+                    if tar is not None and cpu.TAR == tar: return f'TAR = {tar:X}'
+                    if halt and not cpu.S: return 'process halted'
+                    if switches is not None and switched >= switches: return f'{switched} context switches'
+                    if stopped is not None and not ran & 255 and stopped(): return 'stopped'
+                if cycles is not None and ran >= cycles: return f'{ran} cycles'
+                if end is not None and cpu.ticks >= end: return f'{self.tstates} T-states'
+
+                switching = (cpu.C and cpu.SW) or not cpu.S
+                try: cpu.instruction_cycle()
+                except Break as hit:
+                    if hit.done: ran += 1
+                    return str(hit)
+                ran += 1
+                if switching: switched += 1
+        finally:
+            self.ran = ran
+            cpu.throttle = throttle
@@ -0,0 +1,51 @@
+import queue
+import threading
+
+
+class ExecutionWorker:
+    # The one thread that runs the CPU for the GUI. submit() queues a command,
+    # any callable (a step, a run, a load ...), and the worker runs them in
+    # order; done(result) then runs on the Tk thread, result being what the
+    # command returned or the exception it raised. A run is stopped by clearing
+    # cpu.running, which run_code checks every cycle, not by a command, since
+    # it would wait behind the run. CPU on_error/on_stop reports are passed on
+    # to report(kind, message) on the Tk thread as well.
+    #
+    # Nothing from this thread touches Tk: finished commands and reports wait in
+    # a queue that the Tk thread empties with poll() from its after() loop.
+    def __init__(self, cpu, report):
+        self.cpu = cpu
+        self.report = report
+        self.commands = queue.SimpleQueue()
+        self.finished = queue.SimpleQueue()
+        self.pending = 0    # commands submitted and not yet done, counted on the Tk thread
+        cpu.on_error = lambda message: self.finished.put((report, ('error', message)))
+        cpu.on_stop = lambda message: self.finished.put((report, ('stop', message)))
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    def submit(self, command, *args, done = None):
+        self.pending += 1
+        self.commands.put((command, args, done))
+
+    def serve(self):
+        while True:
+            command, args, done = self.commands.get()
+            try: result = command(*args)
+            except Exception as e: result = e
+            self.finished.put((self.complete, (done, result)))
+
+    def complete(self, done, result):
+        self.pending -= 1
+        if done is not None: done(result)
+
+    def poll(self):
+        # on the Tk thread: deliver whatever finished since the last call
+        while True:
+            try: callback, args = self.finished.get_nowait()
+            except queue.Empty: return
+            callback(*args)